@@ -1,13 +1,17 @@
 from fakeredis import FakeRedis
-from redis import Redis
+from redis import BlockingConnectionPool, Redis
 from app import config
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_login import LoginManager
 from flask_redis import FlaskRedis
+from sqlalchemy.engine import make_url
 from logging.config import dictConfig as logging_config
+from app.backend.utils.identity_cache import setup_identity_cache
+from app.backend.utils.metrics import setup_metrics
 from app.backend.utils.misc import setup_csrf
+from app.backend.utils.query_profiler import setup_query_profiler
 from app.backend.utils.rate_limiting import setup_rate_limiting
 
 
@@ -25,6 +29,11 @@ def create_app(config_object=config, overrides=None):
     flask_app.debug = True
     if overrides:
         flask_app.config.update(overrides)
+    # The pools of SQLite can't be sized
+    database_uri = flask_app.config.get('SQLALCHEMY_DATABASE_URI')
+    if database_uri and make_url(database_uri).get_backend_name() != 'sqlite':
+        flask_app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {**flask_app.config['SQLALCHEMY_ENGINE_OPTIONS'],
+                                                         **config.SQLALCHEMY_POOL_OPTIONS}
 
     db.init_app(app=flask_app)
     migrate.init_app(app=flask_app, db=db)
@@ -32,11 +41,16 @@ def create_app(config_object=config, overrides=None):
     redis_client.init_app(app=flask_app)
     if flask_app.testing:
         redis_client._redis_client = FakeRedis()
+    else:
+        # Waits for a free connection instead of failing when all are in use
+        pool = BlockingConnectionPool.from_url(flask_app.config.get('REDIS_URL') or 'redis://localhost:6379/0',
+                                               **config.REDIS_POOL_OPTIONS)
+        redis_client._redis_client = Redis(connection_pool=pool)
 
-    from app.backend.admin.models import AdminUser
+    from app.backend.admin.helpers import get_admin_user
     @login_manager.user_loader
     def user_loader(user_id: str):
-        return AdminUser.query.get(int(user_id))
+        return get_admin_user(int(user_id))
     
     from app.backend.admin.routes import admin_bp
     from app.backend.requesters.routes import requesters_bp
@@ -49,7 +63,10 @@ def create_app(config_object=config, overrides=None):
     flask_app.register_blueprint(conversations_bp)
     flask_app.register_blueprint(common_bp)
 
+    setup_metrics(app=flask_app, redis_client=redis_client)
+    setup_query_profiler(app=flask_app)
     setup_csrf(app=flask_app)
     setup_rate_limiting(app=flask_app, redis_client=redis_client)
+    setup_identity_cache(app=flask_app, redis_client=redis_client)
     
     return flask_app
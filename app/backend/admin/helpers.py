@@ -1,11 +1,25 @@
+from concurrent.futures import ThreadPoolExecutor
 from functools import wraps
+import os
+import threading
+from typing import Optional
 import bcrypt
 from flask import abort, make_response
 from flask_login import current_user
+from sqlalchemy.orm import make_transient_to_detached
+from app.backend.admin.models import AdminUser
+from app.backend.utils.identity_cache import IdentityCache
+from app.backend.utils.metrics import record_rate_limit_rejection
 from app.backend.utils.misc import get_ip_address
-from app.app_factory import redis_client
+from app.backend.utils.rate_limiting import hit_sliding_windows
+from app.app_factory import db, redis_client
 from app import config
 
+try:
+    from gevent import monkey
+except ImportError:
+    monkey = None
+
 
 def admin_only(function):
     @wraps(function)
@@ -16,29 +30,97 @@ def admin_only(function):
     return wrapper
 
 
+def load_admin_identity(id: int) -> Optional[dict]:
+    user = db.session.get(AdminUser, id)
+    if not user:
+        return None
+    return {'id': user.id,
+            'username': user.username,
+            'email': user.email,
+            'is_active': user.is_active}
+
+
+admin_identity_cache = IdentityCache(name='admin_user', loader=load_admin_identity)
+
+
+def get_admin_user(id: int) -> Optional[AdminUser]:
+    """Used by the `user_loader`. The `AdminUser` is built from the cached
+    identity and attached to the session without querying the database;
+    the other attributes are loaded only if accessed. Deactivated admins
+    are treated as logged out."""
+    identity = admin_identity_cache.get(redis_client, id)
+    if identity is None or not identity['is_active']:
+        return None
+
+    user = AdminUser(**identity)
+    make_transient_to_detached(user)
+    return db.session.merge(user, load=False)
+
+
 def limit_login_attempts(function):
     @wraps(function)
     def wrapper(*args, **kwargs):
-        ip = get_ip_address()
-        key = f'admin_login_attempts:{ip}'
+        key = login_attempts_key(get_ip_address())
 
-        request_count = redis_client.incr(key)
-
-        if request_count == 1:
-            redis_client.expire(key, config.ADMIN_LOGIN_COOLDOWN)
-        elif request_count > config.ADMIN_LOGIN_MAX_ATTEMPTS:
+        window = (key, config.ADMIN_LOGIN_MAX_ATTEMPTS, config.ADMIN_LOGIN_COOLDOWN, 1)
+        if hit_sliding_windows(redis_client, [window]):
+            record_rate_limit_rejection('admin_login')
             abort(429)
         return function(*args, **kwargs)
 
     return wrapper
 
 
+def login_attempts_key(ip: str) -> str:
+    return f'admin_login_window:{ip}'
+
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def get_bcrypt_executor():
+    """The pool hashing the passwords of the current worker process. The
+    number of threads bounds the CPU spent on logins. With the gevent
+    workers the pool must be gevent's one, with real threads, so that the
+    other requests of the worker are served while bcrypt runs."""
+    global _executor, _executor_pid
+    with _executor_lock:
+        # The threads don't survive a fork
+        if _executor_pid != os.getpid():
+            if monkey and monkey.is_module_patched('threading'):
+                from gevent.threadpool import ThreadPoolExecutor as GeventThreadPoolExecutor
+                _executor = GeventThreadPoolExecutor(max_workers=config.BCRYPT_MAX_THREADS)
+            else:
+                _executor = ThreadPoolExecutor(max_workers=config.BCRYPT_MAX_THREADS,
+                                               thread_name_prefix='bcrypt')
+            _executor_pid = os.getpid()
+        return _executor
+
+
 def generate_password_hash(password: str):
-    salt = bcrypt.gensalt()
-    password_hash = bcrypt.hashpw(password=password.encode(),
-                                  salt=salt).decode()
-    return password_hash
+    salt = bcrypt.gensalt(rounds=config.BCRYPT_ROUNDS)
+    password_hash = get_bcrypt_executor().submit(bcrypt.hashpw, password.encode(), salt).result()
+    return password_hash.decode()
 
 
 def check_password_hash(password: str, password_hash: str) -> bool:
-    return bcrypt.checkpw(password.encode(), password_hash.encode())
+    return get_bcrypt_executor().submit(bcrypt.checkpw, password.encode(),
+                                        password_hash.encode()).result()
+
+
+def password_needs_rehash(password_hash: str) -> bool:
+    # The hashes look like `$2b$<rounds>$<salt and hash>`
+    return int(password_hash.split('$')[2]) != config.BCRYPT_ROUNDS
+
+
+def rehash_password_if_needed(user: AdminUser, password: str) -> bool:
+    """Rehash the password with the configured cost, if it has changed. To
+    be called with the password which has just been checked. Committing is
+    left to the caller."""
+    if not password_needs_rehash(user.password):
+        return False
+
+    user.password = generate_password_hash(password)
+    return True
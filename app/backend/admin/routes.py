@@ -1,15 +1,23 @@
 from logging import getLogger
-from flask import Blueprint, abort, jsonify, request
+from flask import Blueprint, Response, abort, jsonify, request
 from flask_login import current_user, login_user, logout_user
 from pydantic import ValidationError
-from app.backend.admin.helpers import admin_only, limit_login_attempts
+from app.backend.admin.helpers import admin_only, limit_login_attempts, login_attempts_key, rehash_password_if_needed
 from app.backend.admin.models import AdminNote, AdminUser
-from app.backend.admin.schemas import AdminLogin, AdminNoteCreate, AdminNoteSchema, AdminNoteUpdate, AdminUserSchema
+from app.backend.admin.schemas import (AdminBroadcastCreate, AdminLogin, AdminNoteCreate, AdminNoteSchema,
+                                       AdminNoteUpdate, AdminUserSchema, SearchResultSchema)
 from app.app_factory import db, redis_client
+from app import config
+from app.backend.conversations.cache import invalidate_thread_cache
+from app.backend.conversations.helpers import broadcast_admin_message, message_event, publish_thread_events
 from app.backend.conversations.models import Message, Thread
+from app.backend.conversations.stats import get_moderation_stats
 from app.backend.conversations.schemas import MessageCreate, MessageSchema
+from app.backend.utils.identity_cache import get_identity_cache_stats
 from app.backend.utils.misc import get_ip_address
-from app.backend.utils.pagination import paginate
+from app.backend.utils.pagination import get_page, paginate_response
+from app.backend.utils.search import KINDS, search_query
+from app.backend.utils.serialization import dump_list_json
 
 admin_bp = Blueprint(
     name='admin',
@@ -33,20 +41,20 @@ def admin_login():
     except ValidationError as error:
         return jsonify({"errors": error.errors(include_url=False, include_context=False)}), 400
 
-    username: str = login_schema.username
-
-    user = AdminUser.active().filter_by(username=username).first()
-
+    user = login_schema.user
     login_user(user)
 
     response = {
         'success': True,
         'id': user.id
     }
+
+    # After the user is used, so the commit doesn't make it reload
+    if rehash_password_if_needed(user, login_schema.password):
+        db.session.commit()
     
     # Clear the login attempt count
-    key = f'admin_login_attempts:{get_ip_address()}'
-    redis_client.delete(key)
+    redis_client.delete(login_attempts_key(get_ip_address()))
 
     return jsonify(response)
 
@@ -72,15 +80,25 @@ def admin_get_current_user():
     return jsonify(response)
 
 
+@admin_bp.route('/identity-cache-stats', methods=['GET'])
+@admin_only
+def admin_get_identity_cache_stats():
+    return jsonify(get_identity_cache_stats())
+
+
+@admin_bp.route('/stats', methods=['GET'])
+@admin_only
+def admin_get_stats():
+    return jsonify(get_moderation_stats())
+
+
 @admin_bp.route('/users', methods=['GET'])
 @admin_only
 def admin_get_user_list():
-    pagination = paginate(request_args=request.args,
-                          sqlalchemy_query=AdminUser.active(),
-                          pydantic_model=AdminUserSchema,
-                          list_name='user_list')
-
-    return jsonify(pagination)
+    return paginate_response(request_args=request.args,
+                             sqlalchemy_query=AdminUser.active(),
+                             pydantic_model=AdminUserSchema,
+                             list_name='user_list')
 
 
 @admin_bp.route('/users/<int:id>', methods=["GET"])
@@ -95,6 +113,29 @@ def admin_get_user(id: int):
     return jsonify(response)
 
 
+@admin_bp.route('/search', methods=['GET'])
+@admin_only
+def admin_search():
+    kind = request.args.get('type')
+    if kind is not None and kind not in KINDS:
+        abort(400)
+
+    query = search_query(request.args.get('q', ''), kind=kind)
+    if query is None:
+        response = {'success': False, 'message': 'Nothing to search for.'}
+        return jsonify(response), 400
+
+    # Ranked, so only the offset pagination
+    page_args = {name: request.args[name] for name in ('page', 'per-page') if name in request.args}
+    envelope, rows = get_page(request_args=page_args, sqlalchemy_query=query, per_page=10)
+
+    body = dump_list_json(pydantic_model=SearchResultSchema,
+                          rows=rows,
+                          envelope=envelope,
+                          list_name='result_list')
+    return Response(body, mimetype='application/json')
+
+
 @admin_bp.route('/send-message/<int:id>', methods=['POST'])
 @admin_only
 def admin_send_message_to_thread(id: int):
@@ -121,10 +162,53 @@ def admin_send_message_to_thread(id: int):
         return {'success': False,
                 'message': 'Unknown error occured'}, 500
 
+    invalidate_thread_cache([id])
+    publish_thread_events([message_event(message)])
+
     response = MessageSchema.model_validate(message).model_dump()
     return jsonify(response)
 
 
+@admin_bp.route('/broadcast', methods=['POST'])
+@admin_only
+def admin_broadcast_message():
+    try:
+        schema = AdminBroadcastCreate(**request.get_json())
+    except ValidationError as error:
+        return jsonify({"errors": error.errors(include_url=False, include_context=False)}), 400
+
+    max_threads = config.ADMIN_BROADCAST_MAX_THREADS
+    if schema.thread_ids is not None:
+        if len(set(schema.thread_ids)) > max_threads:
+            response = {'success': False, 'message': f'At most {max_threads} Threads at once.'}
+            return jsonify(response), 400
+        criteria = [Thread.id.in_(schema.thread_ids)]
+    else:
+        criteria = [Thread.created_on > schema.created_after]
+
+    try:
+        messages = broadcast_admin_message(schema.text, current_user.id, *criteria, limit=max_threads + 1)
+        if len(messages) > max_threads:
+            db.session.rollback()
+            response = {'success': False, 'message': f'At most {max_threads} Threads at once.'}
+            return jsonify(response), 400
+        db.session.commit()
+
+    except Exception as e:
+        db.session.rollback()
+        logger.exception(e)
+        return {'success': False,
+                'message': 'Unknown error occured'}, 500
+
+    thread_ids = [message.thread_id for message in messages]
+    invalidate_thread_cache(thread_ids)
+    publish_thread_events([message_event(message) for message in messages])
+
+    response = {'sent': len(messages),
+                'not_found': sorted(set(schema.thread_ids or ()) - set(thread_ids))}
+    return jsonify(response)
+
+
 @admin_bp.route('/notes', methods=["GET"])
 @admin_only
 def admin_get_note_list():
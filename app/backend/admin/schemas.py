@@ -1,9 +1,11 @@
 from datetime import datetime
 from logging import getLogger
-from pydantic import BaseModel, ConfigDict, Field, field_validator, model_validator
+from typing import List, Optional
+from pydantic import BaseModel, ConfigDict, Field, PrivateAttr, field_validator, model_validator
 from app.backend.admin.helpers import check_password_hash
 from app.backend.admin.models import AdminUser
 from app.backend.requesters.models import Requester
+from app.backend.utils.serialization import HttpDatetime
 
 
 logger = getLogger(__name__)
@@ -12,6 +14,9 @@ logger = getLogger(__name__)
 class AdminLogin(BaseModel):
     username: str
     password: str = Field(..., max_length=128)
+
+    # The user whose credentials have been checked
+    _user: AdminUser = PrivateAttr(None)
     
     @model_validator(mode='after')
     def check_credentials(self):
@@ -30,8 +35,13 @@ class AdminLogin(BaseModel):
         if not credentials_match:
             raise ValueError("Login credentials are incorrect.")
 
+        self._user = user
         return self
 
+    @property
+    def user(self) -> AdminUser:
+        return self._user
+
 
 class AdminUserSchema(BaseModel):
     id: int
@@ -56,7 +66,7 @@ class AdminNoteCreate(BaseModel):
 class AdminNoteSchema(BaseModel):
     id: int
     text: str
-    created_on: datetime
+    created_on: HttpDatetime
     author_id: int
     requester_id: int
     
@@ -64,4 +74,34 @@ class AdminNoteSchema(BaseModel):
 
 
 class AdminNoteUpdate(BaseModel):
-    text: str
\ No newline at end of file
+    text: str
+
+
+class AdminBroadcastCreate(BaseModel):
+    text: str
+    # Either the threads, or all the active ones created after the date
+    thread_ids: Optional[List[int]] = None
+    created_after: Optional[datetime] = None
+
+    @field_validator('created_after')
+    def to_local_time(created_after: Optional[datetime]):
+        # The dates are stored in the naive local time
+        if created_after is not None and created_after.tzinfo is not None:
+            created_after = created_after.astimezone().replace(tzinfo=None)
+        return created_after
+
+    @model_validator(mode='after')
+    def check_threads(self):
+        if (self.thread_ids is None) == (self.created_after is None):
+            raise ValueError('Either thread_ids or created_after is required.')
+        return self
+
+
+class SearchResultSchema(BaseModel):
+    kind: str
+    id: int
+    thread_id: Optional[int]
+    requester_id: Optional[int]
+    snippet: str
+
+    model_config = ConfigDict(from_attributes=True)
@@ -1,7 +1,18 @@
+import pytest
 from time import sleep
+from flask import g
 from flask.testing import FlaskClient
 from app import config
-from app.conftest import TEST_PASSWORD
+from app.app_factory import db, redis_client
+from app.backend.admin.helpers import admin_identity_cache, check_password_hash, password_needs_rehash
+from app.backend.admin.models import AdminUser
+from app.backend.admin.сli import deactivate_admin
+from app.backend.conversations.helpers import bulk_update_thread_status, create_thread
+from app.backend.conversations.models import Message, Thread
+from app.backend.conversations.stats import STATUSES_KEY
+from app.backend.conversations.сli import recount_stats
+from app.backend.utils.identity_cache import handle_invalidation
+from app.conftest import TEST_PASSWORD, assert_max_queries, count_queries
 
 
 def test_admin_login(client: FlaskClient, minimal_testing_setup):
@@ -59,6 +70,7 @@ def test_admin_get_current_user(client: FlaskClient, minimal_testing_setup):
     assert response.get_json()['id'] == admin_id
 
 
+@pytest.mark.max_queries(2)
 def test_admin_get_user_list(client: FlaskClient, minimal_testing_setup):
     response = client.get('api/admin/users')
     assert response.status_code == 401
@@ -97,6 +109,7 @@ def test_admin_get_user(client: FlaskClient, minimal_testing_setup):
     assert response.status_code == 404
 
 
+@pytest.mark.max_queries(3)
 def test_admin_send_message_to_thread(client: FlaskClient, minimal_testing_setup):
     thread_id = minimal_testing_setup['threads'][0].id
     text = 'Testing Text'
@@ -119,6 +132,43 @@ def test_admin_send_message_to_thread(client: FlaskClient, minimal_testing_setup
     assert response.get_json()['thread_id'] == thread_id
 
 
+@pytest.mark.max_queries(2)
+def test_admin_broadcast_message(client: FlaskClient, minimal_testing_setup, monkeypatch):
+    first_thread, second_thread = minimal_testing_setup['threads']
+    text = 'We are looking into the ban wave.'
+    response = client.post('api/admin/broadcast', json={'text': text, 'thread_ids': [first_thread.id]})
+    assert response.status_code == 401
+
+    # Log in
+    response = client.post('api/admin/login', json={
+        'username': minimal_testing_setup['admin_users'][0].username,
+        'password': TEST_PASSWORD
+    })
+
+    response = client.post('api/admin/broadcast', json={'text': text, 'thread_ids': [first_thread.id, 999]})
+    assert response.status_code == 200
+    assert response.get_json() == {'sent': 1, 'not_found': [999]}
+    message = Message.query.filter_by(text=text).one()
+    assert message.thread_id == first_thread.id
+    assert message.admin_user_id == minimal_testing_setup['admin_users'][0].id
+
+    # All the active threads created after the date
+    second_thread.created_on = first_thread.created_on.replace(year=1999)
+    first_thread.created_on = first_thread.created_on.replace(year=2000)
+    db.session.commit()
+    response = client.post('api/admin/broadcast', json={'text': text, 'created_after': '2000-01-01T00:00:00'})
+    assert response.get_json() == {'sent': 1, 'not_found': []}
+    assert Message.query.filter_by(text=text, thread_id=first_thread.id).count() == 2
+
+    monkeypatch.setattr(config, 'ADMIN_BROADCAST_MAX_THREADS', 1)
+    response = client.post('api/admin/broadcast', json={'text': text, 'created_after': '1990-01-01T00:00:00'})
+    assert response.status_code == 400
+    assert Message.query.filter_by(text=text).count() == 2
+
+    response = client.post('api/admin/broadcast', json={'text': text})
+    assert response.status_code == 400
+
+
 def test_limit_login_attempts(client: FlaskClient, minimal_testing_setup, monkeypatch):
     monkeypatch.setattr(config, "ADMIN_LOGIN_COOLDOWN", 3)
     
@@ -145,4 +195,127 @@ def test_limit_login_attempts(client: FlaskClient, minimal_testing_setup, monkey
         'password': TEST_PASSWORD
     })
     
-    assert response.status_code == 200
\ No newline at end of file
+    assert response.status_code == 200
+
+
+def test_admin_identity_cache(client: FlaskClient, runner, minimal_testing_setup):
+    admin_user = minimal_testing_setup['admin_users'][0]
+    admin_id, username = admin_user.id, admin_user.username
+
+    def get_current_user():
+        # The app context outlives the requests in the tests, so the user
+        # loaded by an earlier request has to be forgotten
+        g.pop('_login_user', None)
+        return client.get('api/admin/current-user')
+
+    response = client.post('api/admin/login', json={
+        'username': username,
+        'password': TEST_PASSWORD
+    })
+    response = get_current_user()
+    assert response.status_code == 200
+
+    # No identity queries with a hot cache, even with an empty session
+    db.session.expunge_all()
+    with assert_max_queries(0):
+        response = get_current_user()
+    assert response.get_json()['id'] == admin_id
+
+    stats = admin_identity_cache.get_stats()
+    assert (stats['local_hits'], stats['redis_hits'], stats['misses']) == (1, 0, 1)
+    response = client.get('api/admin/identity-cache-stats')
+    assert response.get_json()['admin_user']['hit_rate'] == 0.5
+
+    # An invalidation from another worker only evicts the local entry
+    handle_invalidation(f'admin_user:{admin_id}'.encode())
+    response = get_current_user()
+    assert response.status_code == 200
+    assert admin_identity_cache.get_stats()['redis_hits'] == 1
+
+    # A deactivated admin is logged out right away
+    result = runner.invoke(deactivate_admin, args=[username])
+    assert result.exit_code == 0
+    response = get_current_user()
+    assert response.status_code == 401
+
+
+def test_admin_login_rehash(client: FlaskClient, minimal_testing_setup, monkeypatch):
+    admin_user = minimal_testing_setup['admin_users'][0]
+    username = admin_user.username
+    old_hash = admin_user.password
+    monkeypatch.setattr(config, 'BCRYPT_ROUNDS', 4)
+
+    # The user is loaded only once
+    with count_queries() as statements:
+        response = client.post('api/admin/login', json={
+            'username': username,
+            'password': TEST_PASSWORD
+        })
+    assert response.status_code == 200
+    assert len([s for s in statements if s.startswith('SELECT')]) == 1
+
+    # Rehashed with the new cost
+    new_hash = db.session.get(AdminUser, admin_user.id).password
+    assert new_hash != old_hash
+    assert new_hash.startswith('$2b$04$')
+    assert not password_needs_rehash(new_hash)
+
+    assert check_password_hash(TEST_PASSWORD, new_hash)
+
+
+def test_admin_get_stats(client: FlaskClient, runner, minimal_testing_setup):
+    response = client.get('api/admin/stats')
+    assert response.status_code == 401
+
+    admin = minimal_testing_setup['admin_users'][0]
+    client.post('api/admin/login', json={
+        'username': admin.username,
+        'password': TEST_PASSWORD
+    })
+
+    response = client.get('api/admin/stats')
+    assert response.status_code == 200
+    stats = response.get_json()
+    assert stats['threads_by_status'] == {'ACTIVE': 2, 'UNRESOLVED': 0, 'APPROVED': 0, 'DENIED': 0}
+    assert stats['oldest_active_thread_age'] >= 0
+    assert stats['wait_time'] == {'median': None, 'p95': None, 'sample_size': 0}
+    assert stats['decisions_today'] == {}
+
+    thread = minimal_testing_setup['threads'][0]
+    client.put(f'api/conversations/threads/{thread.id}', json={'status': Thread.STATUSES.DENIED.value})
+    client.post('/api/requesters/authenticate', json={
+        'username': 'NewRequester',
+        'first_message': 'Please review my ban.',
+        'fp': 'another-fingerprint'
+    })
+
+    # Served from the counters, without touching the database
+    with assert_max_queries(0):
+        stats = client.get('api/admin/stats').get_json()
+    assert stats['threads_by_status'] == {'ACTIVE': 2, 'UNRESOLVED': 0, 'APPROVED': 0, 'DENIED': 1}
+    assert stats['wait_time']['sample_size'] == 1
+    assert stats['wait_time']['median'] == stats['wait_time']['p95'] >= 0
+    assert stats['decisions_today'] == {str(admin.id): 1}
+
+    # The drift is corrected by the recount
+    redis_client.hincrby(STATUSES_KEY, int(Thread.STATUSES.ACTIVE), 5)
+    assert client.get('api/admin/stats').get_json()['threads_by_status']['ACTIVE'] == 7
+    result = runner.invoke(recount_stats)
+    assert result.exit_code == 0
+    stats = client.get('api/admin/stats').get_json()
+    assert stats['threads_by_status'] == {'ACTIVE': 2, 'UNRESOLVED': 0, 'APPROVED': 0, 'DENIED': 1}
+    assert stats['wait_time']['sample_size'] == 1
+    assert stats['decisions_today'] == {str(admin.id): 1}
+
+    # Recounted by the request only once Redis lost the counters
+    redis_client.delete(STATUSES_KEY)
+    stats = client.get('api/admin/stats').get_json()
+    assert stats['threads_by_status'] == {'ACTIVE': 2, 'UNRESOLVED': 0, 'APPROVED': 0, 'DENIED': 1}
+
+    # Applied with the outer transaction, not when a savepoint is released
+    bulk_update_thread_status([minimal_testing_setup['threads'][1].id], Thread.STATUSES.DENIED,
+                              processed_by_system=True)
+    create_thread(requester=minimal_testing_setup['requesters'][0], first_message='Unban me.', commit=False)
+    db.session.rollback()
+    stats = client.get('api/admin/stats').get_json()
+    assert stats['threads_by_status'] == {'ACTIVE': 2, 'UNRESOLVED': 0, 'APPROVED': 0, 'DENIED': 1}
@@ -1,7 +1,9 @@
+import pytest
 from flask.testing import FlaskClient
 from app.conftest import TEST_PASSWORD
 
 
+@pytest.mark.max_queries(2)
 def test_admin_get_note_list(client: FlaskClient, minimal_testing_setup):
     response = client.get('api/admin/notes')
     assert response.status_code == 401
@@ -52,6 +54,7 @@ def test_admin_get_note(client: FlaskClient, minimal_testing_setup):
     assert response.status_code == 404
 
 
+@pytest.mark.max_queries(3)
 def test_admin_create_note(client: FlaskClient, minimal_testing_setup):
     text = 'Testing Text'
     requester = minimal_testing_setup['requesters'][0]
@@ -80,6 +83,7 @@ def test_admin_create_note(client: FlaskClient, minimal_testing_setup):
     assert response.get_json()['author_id'] == admin_user.id
 
 
+@pytest.mark.max_queries(3)
 def test_admin_update_note(client: FlaskClient, minimal_testing_setup):
     new_text = 'Testing Text'
     admin_note = minimal_testing_setup['admin_notes'][0]
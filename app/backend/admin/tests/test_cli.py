@@ -1,6 +1,8 @@
 from app import config
+from app.backend.admin.helpers import login_attempts_key
 from app.backend.admin.сli import create_admin, remove_login_restriction
 from app.app_factory import redis_client
+from app.backend.utils.rate_limiting import hit_sliding_windows
 
 def test_create_admin(runner):
     # Create first user
@@ -45,8 +47,10 @@ def test_remove_login_restriction(runner):
     result = runner.invoke(remove_login_restriction, args=ip_address)
     assert result.exit_code == 1
     
-    key = f'admin_login_attempts:{ip_address}'
-    redis_client.set(key, 9999)
+    key = login_attempts_key(ip_address)
+    window = (key, config.ADMIN_LOGIN_MAX_ATTEMPTS, config.ADMIN_LOGIN_COOLDOWN, 1)
+    for i in range(config.ADMIN_LOGIN_MAX_ATTEMPTS + 1):
+        hit_sliding_windows(redis_client, [window])
     
     result = runner.invoke(remove_login_restriction, args=ip_address)
     assert result.exit_code == 0
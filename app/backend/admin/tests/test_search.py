@@ -0,0 +1,130 @@
+import pytest
+from flask.testing import FlaskClient
+from app import config
+from app.app_factory import db
+from app.backend.admin.models import AdminNote
+from app.backend.conversations.helpers import update_thread_status
+from app.backend.conversations.models import Message, Thread
+from app.backend.utils.search import build_match_expression
+from app.conftest import TEST_PASSWORD
+
+
+def search(client: FlaskClient, query: str, **params) -> list:
+    response = client.get('api/admin/search', query_string={'q': query, **params})
+    assert response.status_code == 200
+    return [(result['kind'], result['id']) for result in response.get_json()['result_list']]
+
+
+@pytest.mark.max_queries(3)
+def test_admin_search(client: FlaskClient, minimal_testing_setup):
+    response = client.get('api/admin/search?q=message')
+    assert response.status_code == 401
+
+    response = client.post('api/admin/login', json={
+        'username': minimal_testing_setup['admin_users'][0].username,
+        'password': TEST_PASSWORD
+    })
+
+    requester = minimal_testing_setup['requesters'][1]
+    note = minimal_testing_setup['admin_notes'][0]
+    first_message = Message.query.filter_by(text='This is first message. Index: 1').one()
+
+    assert search(client, 'requester1') == [('requester', requester.id)]
+    assert search(client, 'admin note') == [('note', note.id), ('note', minimal_testing_setup['admin_notes'][1].id)]
+    assert search(client, 'first "index 1"') == [('message', first_message.id)]
+    # The words of a phrase have to be next to each other
+    assert search(client, '"first index"') == []
+    # The shorter messages rank first
+    results = search(client, 'message', type='message')
+    assert len(results) == 4
+    assert {kind for kind, _ in results} == {'message'}
+    assert set(results[2:]) == {('message', message.id) for message in Message.query.filter(
+        Message.text.startswith('This is first'))}
+
+    response = client.get('api/admin/search?q=message&per-page=1&page=2')
+    assert response.get_json()['total'] == 4
+    assert len(response.get_json()['result_list']) == 1
+
+    result = client.get('api/admin/search', query_string={'q': '"index 1"'}).get_json()['result_list'][0]
+    assert result['thread_id'] == first_message.thread_id
+    assert 'Index' in result['snippet']
+
+    # Nothing to search for
+    assert client.get('api/admin/search?q=" ()').status_code == 400
+    assert client.get('api/admin/search?q=message&type=thread').status_code == 400
+
+
+def test_search_index_sync(client: FlaskClient, minimal_testing_setup):
+    client.post('api/admin/login', json={
+        'username': minimal_testing_setup['admin_users'][0].username,
+        'password': TEST_PASSWORD
+    })
+
+    note: AdminNote = minimal_testing_setup['admin_notes'][0]
+    note.text = 'Evading the ban with an alt account.'
+    db.session.commit()
+    assert search(client, 'evading') == [('note', note.id)]
+    assert ('note', note.id) not in search(client, 'admin note')
+
+    db.session.delete(note)
+    db.session.commit()
+    assert search(client, 'evading') == []
+
+    # Deleted from an active thread
+    thread: Thread = minimal_testing_setup['threads'][0]
+    message = Message(text='Sorry for the spam.', requester_id=thread.requester_id, thread_id=thread.id)
+    db.session.add(message)
+    db.session.commit()
+    assert search(client, 'spam') == [('message', message.id)]
+    db.session.delete(message)
+    db.session.commit()
+    assert search(client, 'spam') == []
+
+    # The messages of a resolved thread stay searchable through its archive
+    message = Message(text='Sorry for the spam.', requester_id=thread.requester_id, thread_id=thread.id)
+    db.session.add(message)
+    db.session.commit()
+    message_id = message.id
+    update_thread_status(thread=thread, new_status=Thread.STATUSES.DENIED, processed_by_system=True)
+    assert Message.query.filter_by(thread_id=thread.id).count() == 0
+    assert search(client, 'spam') == [('message', message_id)]
+
+    # Deleted from a reopened thread, which still has its archive
+    update_thread_status(thread=thread, new_status=Thread.STATUSES.ACTIVE, processed_by_system=True)
+    message = Message(text='A secret giraffe.', requester_id=thread.requester_id, thread_id=thread.id)
+    db.session.add(message)
+    db.session.commit()
+    assert search(client, 'giraffe') == [('message', message.id)]
+    response = client.delete(f'api/conversations/messages/{message.id}')
+    assert response.status_code == 204
+    assert search(client, 'giraffe') == []
+    assert search(client, 'spam') == [('message', message_id)]
+
+    # The id of the archived message is not given to the next one
+    other_thread: Thread = minimal_testing_setup['threads'][1]
+    message = Message(text='Sorry for the spam again.', requester_id=other_thread.requester_id,
+                      thread_id=other_thread.id)
+    db.session.add(message)
+    db.session.commit()
+    assert message.id > message_id
+    assert sorted(search(client, 'spam')) == [('message', message_id), ('message', message.id)]
+
+
+def test_search_rank_window(client: FlaskClient, minimal_testing_setup, monkeypatch):
+    client.post('api/admin/login', json={
+        'username': minimal_testing_setup['admin_users'][0].username,
+        'password': TEST_PASSWORD
+    })
+
+    # Only the most recent matches are ranked
+    monkeypatch.setattr(config, 'SEARCH_RANK_WINDOW', 2)
+    latest_messages = Message.query.order_by(Message.id.desc()).limit(2)
+    assert sorted(search(client, 'message')) == sorted(('message', message.id) for message in latest_messages)
+
+
+def test_build_match_expression():
+    assert build_match_expression('ban appeal') == '"ban" "appeal"'
+    assert build_match_expression('"ban appeal" again') == '"ban appeal" "again"'
+    # None of the FTS5 syntax gets through
+    assert build_match_expression('ban OR body:x* NEAR("a" "b")') == '"a" "b" "ban" "OR" "body" "x" "NEAR"'
+    assert build_match_expression('"" ()') == ''
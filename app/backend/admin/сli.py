@@ -1,10 +1,11 @@
 import click
 from sqlalchemy import func
 from app import config
-from app.backend.admin.helpers import generate_password_hash
+from app.backend.admin.helpers import admin_identity_cache, generate_password_hash, login_attempts_key
 from app.backend.admin.routes import admin_bp
 from app.app_factory import db, redis_client
 from app.backend.admin.models import AdminUser
+from app.backend.utils.rate_limiting import get_sliding_window_count
 
 admin_bp.cli.help = 'Perform user-related operations.'
 
@@ -33,16 +34,30 @@ def create_admin(username: str, email: str, password: str):
     return 
 
 
+@admin_bp.cli.command('deactivateadmin', help='Deactivate an admin user and end their sessions.')
+@click.argument('username')
+def deactivate_admin(username: str):
+    user = AdminUser.active().filter_by(username=username).first()
+    if not user:
+        raise click.ClickException(f'There is no active admin user {username}.')
+
+    user_id = user.id
+    user.is_active = False
+    db.session.commit()
+    admin_identity_cache.invalidate(redis_client, user_id)
+
+    click.echo('The admin user has been deactivated.')
+
+
 @admin_bp.cli.command('removeloginrestriction', help='Remove the admin login restriction fron an IP address.')
 @click.argument('ip')
 def remove_login_restriction(ip: str):
-    key = f'admin_login_attempts:{ip}'
+    key = login_attempts_key(ip)
 
-    request_count = redis_client.get(key)
-    if request_count is None:
-        request_count = 0
+    request_count = get_sliding_window_count(redis_client, key, config.ADMIN_LOGIN_COOLDOWN)
     
-    if int(request_count) <= config.ADMIN_LOGIN_MAX_ATTEMPTS:
+    # The rejected attempts aren't recorded, a full window is a restriction
+    if request_count < config.ADMIN_LOGIN_MAX_ATTEMPTS:
         raise click.ClickException(f'The {ip} IP is not restricted.')
     else:
         redis_client.delete(key)
@@ -1,5 +1,9 @@
-from flask import Blueprint, abort, jsonify
+import secrets
+from flask import Blueprint, Response, abort, jsonify, request
+from flask_login import current_user
 from app import config
+from app.app_factory import redis_client
+from app.backend.utils.metrics import render_metrics
 from app.backend.utils.misc import get_csrf_token
 
 
@@ -13,3 +17,17 @@ def csrf_token():
 
     token = get_csrf_token()
     return jsonify({"csrf_token": token})
+
+
+
+@common_bp.route('/metrics', methods=['GET'])
+def metrics():
+    if not config.METRICS_ENABLED:
+        abort(404)
+
+    token = request.headers.get('Authorization', '').removeprefix('Bearer ')
+    has_token = bool(config.METRICS_TOKEN) and secrets.compare_digest(token, config.METRICS_TOKEN)
+    if current_user.is_anonymous and not has_token:
+        abort(401)
+
+    return Response(render_metrics(redis_client), mimetype='text/plain; version=0.0.4')
@@ -1,6 +1,12 @@
+import logging
 from time import sleep
 from flask.testing import FlaskClient
 from app import config
+from app.app_factory import redis_client
+from app.backend.utils.metrics import METRICS_KEY, flush_metrics, increment, start_metrics_flusher
+from app.backend.utils.query_profiler import ProfiledStatement, RequestProfile, log_repeated_statements
+from app.backend.utils.rate_limiting import hit_sliding_windows
+from app.conftest import TEST_PASSWORD
 
 
 def test_rate_limiting(client: FlaskClient, monkeypatch):
@@ -27,4 +33,109 @@ def test_rate_limiting(client: FlaskClient, monkeypatch):
     # Make one more
     response = client.get('api/conversations/thread-statuses')
     assert response.status_code == 429
-    
\ No newline at end of file
+
+
+def test_rate_limiting_endpoint_limits(client: FlaskClient, monkeypatch):
+    monkeypatch.setattr(config, "RATE_LIMIT_MAX_REQUESTS", 10)
+    monkeypatch.setattr(config, "RATE_LIMIT_ENDPOINTS", {
+        'conversations.get_thread_statuses': {'cost': 3, 'max_requests': 100},
+    })
+
+    # Each request takes 3 of the 10 requests available
+    for i in range(3):
+        response = client.get('api/conversations/thread-statuses')
+        assert response.status_code == 200
+
+    response = client.get('api/conversations/thread-statuses')
+    assert response.status_code == 429
+
+    # Every window key has an expiration set
+    for key in redis_client.keys('rate_limit:*'):
+        assert redis_client.pttl(key) > 0
+
+
+def test_rate_limiting_retries(app):
+    window = ('rate_limit:retrying', 2, 1, 1)
+    assert not hit_sliding_windows(redis_client, [window])
+    assert not hit_sliding_windows(redis_client, [window])
+
+    # Retrying while over the limit doesn't extend it
+    for i in range(4):
+        assert hit_sliding_windows(redis_client, [window])
+        sleep(0.3)
+    assert not hit_sliding_windows(redis_client, [window])
+
+
+def test_metrics(client: FlaskClient, minimal_testing_setup, monkeypatch):
+    monkeypatch.setattr(config, "RATE_LIMIT_ENDPOINTS", {
+        'conversations.get_thread_statuses': {'max_requests': 2},
+    })
+    # Forget the samples of the other tests
+    flush_metrics(redis_client, force=True)
+    redis_client.delete(METRICS_KEY)
+
+    response = client.get('api/metrics')
+    assert response.status_code == 401
+
+    monkeypatch.setattr(config, "METRICS_TOKEN", 'testing-token')
+    response = client.get('api/metrics', headers={'Authorization': 'Bearer wrong-token'})
+    assert response.status_code == 401
+
+    for i in range(2):
+        client.get('api/conversations/thread-statuses')
+    response = client.get('api/conversations/thread-statuses')
+    assert response.status_code == 429
+
+    response = client.get('api/metrics', headers={'Authorization': 'Bearer testing-token'})
+    assert response.status_code == 200
+    lines = response.get_data(as_text=True).splitlines()
+
+    labels = 'endpoint="conversations.get_thread_statuses",method="GET"'
+    assert f'http_requests_total{{{labels},status="200"}} 2' in lines
+    assert f'http_requests_total{{{labels},status="429"}} 1' in lines
+    assert f'http_request_duration_seconds_bucket{{{labels},status="200",le="+Inf"}} 2' in lines
+    assert f'http_request_duration_seconds_count{{{labels},status="200"}} 2' in lines
+    assert 'rate_limit_rejections_total{endpoint="conversations.get_thread_statuses",limiter="requests"} 1' in lines
+    assert any(line.startswith('redis_commands_total{endpoint="conversations.get_thread_statuses"}')
+               for line in lines)
+    assert '# TYPE http_request_duration_seconds histogram' in lines
+
+    # The samples of every worker are added up in Redis
+    redis_client.hincrbyfloat(METRICS_KEY, f'http_requests_total{{{labels},status="200"}}', 3)
+    response = client.post('api/admin/login', json={
+        'username': minimal_testing_setup['admin_users'][0].username,
+        'password': TEST_PASSWORD
+    })
+    response = client.get('api/metrics')
+    lines = response.get_data(as_text=True).splitlines()
+    assert f'http_requests_total{{{labels},status="200"}} 5' in lines
+    assert any(line.startswith('sql_statements_total{endpoint="admin.admin_login"}')
+               for line in lines)
+
+
+def test_metrics_flusher(app, monkeypatch):
+    monkeypatch.setattr(config, "METRICS_FLUSH_INTERVAL", 0.1)
+    flush_metrics(redis_client, force=True)
+    redis_client.delete(METRICS_KEY)
+
+    # Flushed without waiting for another request
+    increment('http_requests_total', {'endpoint': 'common.idle'})
+    stopped = start_metrics_flusher(redis_client)
+    sleep(0.3)
+    stopped.set()
+    assert float(redis_client.hget(METRICS_KEY, 'http_requests_total{endpoint="common.idle"}')) == 1
+
+
+def test_log_repeated_statements(caplog, monkeypatch):
+    monkeypatch.setattr(config, "QUERY_PROFILER_N_PLUS_ONE_THRESHOLD", 3)
+    lazy_load = 'SELECT requester.id FROM requester WHERE requester.id = ?'
+    profile = RequestProfile(method='GET', path='/api/conversations/threads', endpoint=None,
+                             statements=[ProfiledStatement('SELECT thread.id FROM thread', None)]
+                             + [ProfiledStatement(lazy_load, None)] * 3)
+
+    # The logger has its own handler, caplog listens on the root one
+    monkeypatch.setattr(logging.getLogger('app.backend.utils.query_profiler'), 'propagate', True)
+    log_repeated_statements(profile)
+    assert len(caplog.records) == 1
+    assert 'Possible N+1' in caplog.text
+    assert lazy_load in caplog.text
@@ -0,0 +1,113 @@
+import hashlib
+import secrets
+import time
+from typing import List, NamedTuple, Optional
+from app import config
+from app.app_factory import redis_client
+from app.backend.conversations.models import Thread
+from app.backend.conversations.schemas import ThreadDetailedSchema
+
+
+STATS_KEY = 'thread_cache_stats'
+
+
+class CachedThread(NamedTuple):
+    etag: str
+    requester_id: int
+    payload: bytes
+
+
+def thread_cache_key(thread_id: int) -> str:
+    return f'thread_cache:{thread_id}'
+
+
+def thread_version_key(thread_id: int) -> str:
+    return f'thread_version:{thread_id}'
+
+
+def get_cached_thread(thread_id: int) -> Optional[CachedThread]:
+    """Read-through cache of the serialized `ThreadDetailedSchema` of an
+    active Thread; `None` if there is no such Thread.
+
+    Every entry stores the version it was built for, and the writers replace
+    the version after committing, so an entry loaded before a write can never
+    be served after it. On a miss only one worker loads the Thread, the rest
+    wait for the entry for up to `THREAD_CACHE_WAIT` seconds."""
+    pipeline = redis_client.pipeline(transaction=False)
+    pipeline.mget(thread_version_key(thread_id), thread_cache_key(thread_id))
+    pipeline.hincrby(STATS_KEY, 'requests', 1)
+    (version, entry), _ = pipeline.execute()
+
+    if version is None:
+        # Unknown or evicted version, any older entry is discarded
+        version = secrets.token_hex(8).encode()
+        if not redis_client.set(thread_version_key(thread_id), version, nx=True,
+                                ex=config.THREAD_CACHE_TTL * 2):
+            version = redis_client.get(thread_version_key(thread_id))
+        entry = None
+
+    cached_thread = _parse_entry(entry, version)
+    if cached_thread:
+        return cached_thread
+
+    redis_client.hincrby(STATS_KEY, 'misses', 1)
+
+    lock_key = f'thread_cache_lock:{thread_id}:{version.decode()}'
+    is_locked = redis_client.set(lock_key, 1, nx=True, ex=config.THREAD_CACHE_LOCK_TIMEOUT)
+    if not is_locked:
+        # Somebody else is loading the Thread
+        deadline = time.monotonic() + config.THREAD_CACHE_WAIT
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            cached_thread = _parse_entry(redis_client.get(thread_cache_key(thread_id)), version)
+            if cached_thread:
+                return cached_thread
+
+    try:
+        thread = Thread.active().options(*Thread.detailed_options()).filter_by(id=thread_id).first()
+        if not thread:
+            return None
+
+        payload = ThreadDetailedSchema.model_validate(thread).model_dump_json().encode()
+        etag = hashlib.blake2b(payload, digest_size=16).hexdigest()
+        entry = b'\n'.join([version, etag.encode(), str(thread.requester_id).encode(), payload])
+        redis_client.set(thread_cache_key(thread_id), entry, ex=config.THREAD_CACHE_TTL)
+
+        return CachedThread(etag=etag, requester_id=thread.requester_id, payload=payload)
+    finally:
+        if is_locked:
+            redis_client.delete(lock_key)
+
+
+def invalidate_thread_cache(thread_ids: List[int]):
+    """Must be called after the commit of every change of the Threads."""
+    if not thread_ids:
+        return None
+
+    pipeline = redis_client.pipeline(transaction=False)
+    for thread_id in thread_ids:
+        pipeline.set(thread_version_key(thread_id), secrets.token_hex(8), ex=config.THREAD_CACHE_TTL * 2)
+        pipeline.delete(thread_cache_key(thread_id))
+    pipeline.execute()
+
+
+def get_thread_cache_stats() -> dict:
+    stats = redis_client.hgetall(STATS_KEY)
+    requests = int(stats.get(b'requests', 0))
+    misses = int(stats.get(b'misses', 0))
+    return {
+        'requests': requests,
+        'hits': requests - misses,
+        'misses': misses,
+        'hit_rate': (requests - misses) / requests if requests else None,
+    }
+
+
+def _parse_entry(entry: Optional[bytes], version: bytes) -> Optional[CachedThread]:
+    if entry is None:
+        return None
+
+    entry_version, etag, requester_id, payload = entry.split(b'\n', 3)
+    if entry_version != version:
+        return None
+    return CachedThread(etag=etag.decode(), requester_id=int(requester_id), payload=payload)
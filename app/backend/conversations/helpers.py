@@ -1,39 +1,74 @@
-import random
+from datetime import datetime, timedelta
+from itertools import groupby
+import json
+from logging import getLogger
+import time
+from typing import Dict, List, Optional, Tuple
 from uuid import uuid4
+import zlib
 
 from flask_login import current_user
-from app.backend.conversations.models import Message, Thread
-from app.app_factory import db
+from sqlalchemy import delete, func, insert, literal, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from app.backend.conversations.cache import invalidate_thread_cache
+from app.backend.conversations.jobs import threads_approved, threads_denied, threads_unresolved
+from app.backend.conversations.models import Message, Thread, ThreadArchive
+from app.backend.conversations.schemas import MessageSchema
+from app.backend.conversations.stats import record_status_changes, record_thread_created
+from app.app_factory import db, redis_client
 from app.backend.requesters.models import Requester
+from app.backend.utils.jobs import enqueue
 from app import config
 import string
 
+logger = getLogger(__name__)
 
-def create_thread(requester: Requester, first_message: str):
-    thread_key = generate_thread_key()
+THREAD_KEY_COUNTER = 'thread_key_counter'
+
+
+def create_thread(requester: Requester, first_message: str, commit=True):
+    # The allocated keys are unique; a collision is only possible with the
+    # randomly generated legacy keys or after the Redis counter was lost
+    for attempt in range(config.THREAD_KEY_MAX_ATTEMPTS):
+        try:
+            with db.session.begin_nested():
+                new_thread = Thread(
+                    key=generate_thread_key(),
+                    requester_id=requester.id
+                )
+                db.session.add(new_thread)
+            break
+        except IntegrityError:
+            logger.warning('Thread key collision, allocating another one.')
+    else:
+        raise RuntimeError('Could not allocate a unique Thread key.')
+    record_thread_created(new_thread)
 
-    new_thread = Thread(
-        key=thread_key,
-        requester_id=requester.id
-    )
-    db.session.add(new_thread)
-    db.session.flush()
     new_message = Message(
         text=first_message,
         requester_id=requester.id,
         thread_id=new_thread.id,
     )
     db.session.add(new_message)
-    db.session.commit()
+    if commit:
+        db.session.commit()
 
     return new_thread
 
 
 def update_thread_status(thread: Thread, new_status: Thread.STATUSES, no_deletion=False,
                          processed_by_system=False):
+    old_status = thread.status
+    admin_id = None if processed_by_system else current_user.id
+
     if new_status == Thread.STATUSES.ACTIVE:
         thread.status = Thread.STATUSES.ACTIVE
+        thread.resolved_on = thread.resolved_by_id = None
+        record_status_changes([(thread.id, old_status, thread.created_on)], thread.status, admin_id)
+        event = status_event(thread.id, thread.status)
         db.session.commit()
+        invalidate_thread_cache([event[0]])
+        publish_thread_events([event])
         return True
 
     # The 'finished' statuses
@@ -52,38 +87,408 @@ def update_thread_status(thread: Thread, new_status: Thread.STATUSES, no_deletio
     else:
         raise ValueError('No such status.')
 
+    thread.resolved_on = datetime.now()
+    thread.resolved_by_id = admin_id
+    thread.claimed_by_id = thread.claimed_until = None
+    record_status_changes([(thread.id, old_status, thread.created_on)], thread.status, admin_id)
+
     # Delete the conversation
     if not no_deletion:
-        for message in thread.messages:
-            db.session.delete(message)
+        if config.THREAD_ARCHIVE_ENABLED:
+            archive_thread_messages([thread.id])
+        db.session.execute(delete(Message).where(Message.thread_id == thread.id))
     
     if not processed_by_system:
-        thread.requester.last_reviewed_by_id = current_user.id
+        db.session.execute(update(Requester)
+                           .where(Requester.id == thread.requester_id)
+                           .values(last_reviewed_by_id=admin_id))
 
+    event = status_event(thread.id, thread.status)
     db.session.commit()
+    invalidate_thread_cache([event[0]])
+    publish_thread_events([event])
     return True
 
 
-def approved_hooks(thread: Thread):
+def bulk_update_thread_status(thread_ids: List[int], new_status: Thread.STATUSES,
+                              no_deletion=False, processed_by_system=False) -> List[int]:
+    """Set-based version of `update_thread_status` for the finished
+    statuses. The statuses are updated and the messages are deleted with
+    one statement each; committing is left to the caller.
+
+    Only the threads still active, and not claimed by another admin unless
+    processed by the system, are updated: the check is part of the UPDATE,
+    so a concurrent decision can't slip in between. Returns their ids."""
+    bulk_hooks = {
+        Thread.STATUSES.APPROVED: approved_bulk_hooks,
+        Thread.STATUSES.DENIED: denied_bulk_hooks,
+        Thread.STATUSES.UNRESOLVED: unresolved_bulk_hooks,
+    }
+    if new_status not in bulk_hooks:
+        raise ValueError('No such status.')
+
+    if not thread_ids:
+        return []
+
+    admin_id = None if processed_by_system else current_user.id
+    now = datetime.now()
+    criteria = [Thread.id.in_(thread_ids), Thread.status == Thread.STATUSES.ACTIVE]
+    if not processed_by_system:
+        criteria.append(or_(Thread.claimable(now), Thread.claimed_by_id == admin_id))
+
+    updated_threads = db.session.execute(
+        update(Thread)
+        .where(*criteria)
+        .values(status=new_status, resolved_on=now, resolved_by_id=admin_id,
+                claimed_by_id=None, claimed_until=None)
+        .returning(Thread.id, Thread.created_on)
+        .execution_options(synchronize_session=False)
+    ).all()
+    if not updated_threads:
+        return []
+
+    updated_ids = [thread_id for thread_id, _ in updated_threads]
+    # For the moderation stats, all of them were active
+    record_status_changes([(thread_id, Thread.STATUSES.ACTIVE, created_on)
+                           for thread_id, created_on in updated_threads], new_status, admin_id)
+    bulk_hooks[new_status](updated_ids)
+
+    # Delete the conversations
+    if not no_deletion:
+        if config.THREAD_ARCHIVE_ENABLED:
+            archive_thread_messages(updated_ids)
+        db.session.execute(
+            delete(Message)
+            .where(Message.thread_id.in_(updated_ids))
+            .execution_options(synchronize_session=False)
+        )
+
+    if not processed_by_system:
+        requester_ids = select(Thread.requester_id).where(Thread.id.in_(updated_ids))
+        db.session.execute(
+            update(Requester)
+            .where(Requester.id.in_(requester_ids))
+            .values(last_reviewed_by_id=admin_id)
+            .execution_options(synchronize_session=False)
+        )
+
+    return updated_ids
+
+
+def broadcast_admin_message(text: str, admin_id: int, *criteria, limit: Optional[int] = None) -> list:
+    """Send the message to every active thread matching the criteria (and
+    to at most `limit` of them), with a single INSERT ... SELECT; returns
+    the inserted messages. Committing is left to the caller."""
+    threads = (select(literal(text), literal(datetime.now()), literal(admin_id), Thread.id)
+               .where(Thread.status == Thread.STATUSES.ACTIVE, *criteria)
+               .order_by(Thread.id)
+               .limit(limit))
+    return db.session.execute(
+        insert(Message)
+        .from_select(['text', 'created_on', 'admin_user_id', 'thread_id'], threads)
+        .returning(Message.id, Message.text, Message.created_on, Message.thread_id,
+                   Message.admin_user_id, Message.requester_id)
+    ).all()
+
+
+def claim_next_thread(admin_id: int) -> Optional[int]:
+    """Claim the active thread that waited the longest and nobody holds a
+    lease on, for `THREAD_CLAIM_LEASE` seconds; returns its id, or None if
+    the queue is empty. Commits.
+
+    On Postgres the candidate row is locked with SKIP LOCKED, so concurrent
+    claims get different rows without waiting for each other. SQLite has no
+    row locks: the claim is a compare-and-set on the lease, and whoever
+    loses the race moves on to the next of the few oldest candidates."""
+    postgresql = db.engine.dialect.name == 'postgresql'
+    candidate_count = 1 if postgresql else config.THREAD_CLAIM_CANDIDATES
+
+    for attempt in range(config.THREAD_CLAIM_MAX_ATTEMPTS):
+        now = datetime.now()
+        candidate_ids = db.session.scalars(
+            select(Thread.id)
+            .where(Thread.status == Thread.STATUSES.ACTIVE, Thread.claimable(now))
+            .order_by(Thread.last_activity_on, Thread.id)
+            .limit(candidate_count)
+            .with_for_update(skip_locked=True)
+        ).all()
+        if not candidate_ids:
+            db.session.rollback()
+            return None
+
+        for thread_id in candidate_ids:
+            result = db.session.execute(
+                update(Thread)
+                .where(Thread.id == thread_id,
+                       Thread.status == Thread.STATUSES.ACTIVE,
+                       Thread.claimable(now))
+                # Claiming is not an activity, the queue order is kept
+                .values(claimed_by_id=admin_id,
+                        claimed_until=now + timedelta(seconds=config.THREAD_CLAIM_LEASE),
+                        last_activity_on=Thread.last_activity_on)
+                .execution_options(synchronize_session=False)
+            )
+            if result.rowcount == 1:
+                db.session.commit()
+                return thread_id
+
+        # All taken meanwhile; the write lock is not held while looking again
+        db.session.rollback()
+
     return None
 
 
+def claim_thread(thread_id: int, admin_id: int) -> Optional[Thread]:
+    """Claim the active thread for the admin, unless another admin holds a
+    lease on it, to decide it in the same transaction; returns it, or None
+    if it couldn't be claimed. Committing is left to the caller.
+
+    The check is part of the UPDATE: a concurrent claim or decision of the
+    thread waits for the transaction (the row lock on Postgres, the write
+    lock on SQLite) and then doesn't match anymore."""
+    now = datetime.now()
+    return db.session.scalars(
+        update(Thread)
+        .where(Thread.id == thread_id,
+               Thread.status == Thread.STATUSES.ACTIVE,
+               or_(Thread.claimable(now), Thread.claimed_by_id == admin_id))
+        .values(claimed_by_id=admin_id,
+                claimed_until=now + timedelta(seconds=config.THREAD_CLAIM_LEASE),
+                last_activity_on=Thread.last_activity_on)
+        .returning(Thread)
+    ).first()
+
+
+def archive_thread_messages(thread_ids: List[int]) -> int:
+    """Pack the messages of every thread into one compressed `ThreadArchive`
+    row; deleting the messages is left to the caller. The messages are
+    stored as `MessageSchema` dumps, the way they are sent to the clients.
+    Returns the number of rows added."""
+    rows = db.session.execute(
+        select(Message.id, Message.text, Message.created_on, Message.thread_id,
+               Message.admin_user_id, Message.requester_id)
+        .where(Message.thread_id.in_(thread_ids))
+        .order_by(Message.thread_id, Message.created_on, Message.id)
+    ).all()
+
+    archives = []
+    for thread_id, thread_rows in groupby(rows, key=lambda row: row.thread_id):
+        messages = [MessageSchema.model_validate(row).model_dump(mode='json') for row in thread_rows]
+        raw = json.dumps(messages, separators=(',', ':')).encode()
+        archives.append({
+            'thread_id': thread_id,
+            'data': zlib.compress(raw, config.THREAD_ARCHIVE_COMPRESSION_LEVEL),
+            'message_count': len(messages),
+            'raw_size': len(raw),
+        })
+
+    if archives:
+        db.session.execute(insert(ThreadArchive), archives)
+    return len(archives)
+
+
+def load_thread_archive(thread_id: int) -> List[Dict]:
+    """Decompress the archived messages of the thread, oldest first."""
+    archives = db.session.scalars(
+        select(ThreadArchive.data).where(ThreadArchive.thread_id == thread_id).order_by(ThreadArchive.id))
+
+    messages = []
+    for data in archives:
+        messages.extend(json.loads(zlib.decompress(data)))
+    return messages
+
+
+def get_thread_messages(thread: Thread, since_id: int = None, before_id: int = None,
+                        limit: int = None) -> List[Message]:
+    """Return the messages of the thread ordered by id. `since_id` selects
+    only the newer messages, `before_id` the older ones; with `limit` the
+    newest messages of the window are returned (the oldest ones if
+    `since_id` is given)."""
+    query = Message.query.filter_by(thread_id=thread.id)
+    if since_id is not None:
+        query = query.filter(Message.id > since_id)
+    if before_id is not None:
+        query = query.filter(Message.id < before_id)
+
+    if limit is None:
+        return query.order_by(Message.id).all()
+    if since_id is not None:
+        return query.order_by(Message.id).limit(limit).all()
+
+    return query.order_by(Message.id.desc()).limit(limit).all()[::-1]
+
+
+def thread_events_key(thread_id: int) -> str:
+    return f'thread_events:{thread_id}'
+
+
+def thread_events_channel(thread_id: int) -> str:
+    return f'thread_events_channel:{thread_id}'
+
+
+def message_event(message: Message) -> Tuple[int, str, Dict]:
+    data = MessageSchema.model_validate(message).model_dump(mode='json')
+    return message.thread_id, 'message', data
+
+
+def status_event(thread_id: int, status: Thread.STATUSES) -> Tuple[int, str, Dict]:
+    return thread_id, 'status', {'id': thread_id, 'status': int(status)}
+
+
+def publish_thread_events(events: List[Tuple[int, str, Dict]]):
+    """Append the `(thread_id, event, data)` events to the Redis streams of
+    their threads and notify the subscribers, all in one round trip. Must be
+    called after the commit; a Redis failure is logged and not raised, since
+    the change itself is already saved."""
+    if not events:
+        return None
+
+    try:
+        pipeline = redis_client.pipeline(transaction=False)
+        for thread_id, event, data in events:
+            key = thread_events_key(thread_id)
+            pipeline.xadd(key, {'event': event, 'data': json.dumps(data)},
+                          maxlen=config.THREAD_EVENTS_MAX_LENGTH, approximate=True)
+            pipeline.expire(key, config.THREAD_EVENTS_TTL)
+            pipeline.publish(thread_events_channel(thread_id), event)
+        pipeline.execute()
+    except Exception as e:
+        logger.exception(e)
+
+
+def stream_thread_events(thread_id: int, last_event_id: str = None):
+    """Generate the Server-Sent Events of the thread, starting after
+    `last_event_id` or, if it is not given, with the next new event.
+
+    The Redis stream of the thread is the source of the events; the pub/sub
+    channel is only used to wake up when new ones are added, so nothing is
+    lost between reading the stream and subscribing. The generator ends when
+    the thread is closed or after `THREAD_EVENTS_TIMEOUT` seconds, and the
+    client reconnects with the `Last-Event-ID` header."""
+    key = thread_events_key(thread_id)
+    if last_event_id is None:
+        latest_events = redis_client.xrevrange(key, count=1)
+        last_event_id = latest_events[0][0].decode() if latest_events else '0-0'
+
+    pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe(thread_events_channel(thread_id))
+    try:
+        # The client resumes from here even if no event comes before the
+        # timeout, so that none published while it reconnects is lost
+        yield f'id: {last_event_id}\n\n'
+        deadline = time.monotonic() + config.THREAD_EVENTS_TIMEOUT
+        last_sent_on = time.monotonic()
+        has_new_events = True  # the events published before subscribing
+
+        while time.monotonic() < deadline:
+            if has_new_events:
+                milliseconds, sequence = last_event_id.split('-')
+                new_events = redis_client.xrange(key, min=f'{milliseconds}-{int(sequence) + 1}')
+
+                for event_id, fields in new_events:
+                    last_event_id = event_id.decode()
+                    event = fields[b'event'].decode()
+                    data = fields[b'data'].decode()
+                    yield f'id: {last_event_id}\nevent: {event}\ndata: {data}\n\n'
+                    last_sent_on = time.monotonic()
+
+                    if event == 'status' and json.loads(data)['status'] != Thread.STATUSES.ACTIVE:
+                        return None
+
+            message = pubsub.get_message(timeout=config.THREAD_EVENTS_HEARTBEAT)
+            has_new_events = message is not None
+
+            if not has_new_events and time.monotonic() - last_sent_on >= config.THREAD_EVENTS_HEARTBEAT:
+                yield ': heartbeat\n\n'
+                last_sent_on = time.monotonic()
+    finally:
+        pubsub.close()
+
+
+# The hooks only enqueue the jobs, which run once the status change is
+# committed
+
+def approved_hooks(thread: Thread):
+    enqueue(threads_approved, [thread.id])
+
+
 def denied_hooks(thread: Thread):
-    return None
+    enqueue(threads_denied, [thread.id])
 
 
 def unresolved_hooks(thread: Thread):
-    return None
+    enqueue(threads_unresolved, [thread.id])
+
+
+def approved_bulk_hooks(thread_ids: List[int]):
+    enqueue(threads_approved, list(thread_ids))
+
+
+def denied_bulk_hooks(thread_ids: List[int]):
+    enqueue(threads_denied, list(thread_ids))
+
+
+def unresolved_bulk_hooks(thread_ids: List[int]):
+    enqueue(threads_unresolved, list(thread_ids))
 
 
 def generate_thread_key(label: str = config.THREAD_ID_LABEL, alpha_width: int = 3, num_width: int = 4):
+    return thread_key_from_number(allocate_thread_key_number(), label=label,
+                                  alpha_width=alpha_width, num_width=num_width)
+
+
+def allocate_thread_key_number() -> int:
+    """Return the next number of the Thread key sequence kept in Redis."""
+    number = redis_client.incr(THREAD_KEY_COUNTER)
+    if number == 1:
+        # The counter is new or was lost, continue after the existing Threads
+        max_thread_id = db.session.scalar(select(func.max(Thread.id)))
+        if max_thread_id:
+            number = redis_client.incrby(THREAD_KEY_COUNTER, max_thread_id)
+    return number
+
+
+def thread_key_from_number(number: int, label: str = config.THREAD_ID_LABEL,
+                           alpha_width: int = 3, num_width: int = 4) -> str:
+    """Turn a sequence number (starting from 1) into a key like
+    `PINBAN-QWE-1234`. Different numbers always give different keys, while
+    consecutive ones look unrelated."""
+    key_space = 26 ** alpha_width * 10 ** num_width
+    if not 1 <= number <= key_space:
+        raise ValueError('The Thread key space is exhausted.')
+
+    index = scramble(number - 1, key_space)
+
+    alpha_index, numerical_index = divmod(index, 10 ** num_width)
+    alphabet_chars = ''
+    for i in range(alpha_width):
+        alpha_index, char_index = divmod(alpha_index, 26)
+        alphabet_chars = string.ascii_uppercase[char_index] + alphabet_chars
+    numerical_chars = str(numerical_index).zfill(num_width)
+
+    return f'{label}-{alphabet_chars}-{numerical_chars}'
+
+
+def scramble(value: int, space: int, seed: int = config.THREAD_KEY_SEED) -> int:
+    """A permutation of `range(space)`: a Feistel network over the smallest
+    even number of bits that fits `space`, cycle-walked back into it."""
+    half_bits = ((space - 1).bit_length() + 1) // 2
+    half_mask = (1 << half_bits) - 1
+
     while True:
-        label = label
-        alphabet_chars = ''.join([random.choice(string.ascii_uppercase) for i in range(alpha_width)])
-        numerical_chars = ''.join([random.choice('0123456789') for i in range(num_width)])
+        left, right = value >> half_bits, value & half_mask
+        for round_index in range(4):
+            left, right = right, left ^ (_feistel_round(right, round_index, seed) & half_mask)
+        value = (left << half_bits) | right
+        if value < space:
+            return value
 
-        result = f'{label}-{alphabet_chars}-{numerical_chars}'
-        
-        if not Thread.query.filter_by(key=result).first():
-            break
-    return result
+
+def _feistel_round(value: int, round_index: int, seed: int) -> int:
+    value = (value * 0x9E3779B1 + round_index * 0x85EBCA6B + seed) & 0xFFFFFFFF
+    value ^= value >> 16
+    value = (value * 0x7FEB352D) & 0xFFFFFFFF
+    value ^= value >> 15
+    value = (value * 0x846CA68B) & 0xFFFFFFFF
+    value ^= value >> 16
+    return value
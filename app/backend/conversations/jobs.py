@@ -0,0 +1,21 @@
+from typing import List
+from app.backend.utils.jobs import job
+
+
+# The work done once the threads are decided (unbanning, notifications),
+# run by the job queue after the commit. The threads may have changed again
+# by then, and a job can run more than once.
+
+@job
+def threads_approved(thread_ids: List[int]):
+    return None
+
+
+@job
+def threads_denied(thread_ids: List[int]):
+    return None
+
+
+@job
+def threads_unresolved(thread_ids: List[int]):
+    return None
@@ -1,9 +1,9 @@
 from datetime import datetime
 import enum
 from typing import TYPE_CHECKING, List
-from sqlalchemy import ForeignKey
+from sqlalchemy import ForeignKey, Index, LargeBinary, UniqueConstraint, or_
 from app.app_factory import db
-from sqlalchemy.orm import Mapped, mapped_column, relationship
+from sqlalchemy.orm import Mapped, mapped_column, relationship, selectinload
 
 
 if TYPE_CHECKING:
@@ -12,6 +12,10 @@ if TYPE_CHECKING:
 
 
 class Message(db.Model):
+    # The ids of the deleted messages are never reused: the archived ones
+    # stay in the search index
+    __table_args__ = {'sqlite_autoincrement': True}
+
     id: Mapped[int] = mapped_column(primary_key=True)
     text: Mapped[str] = mapped_column()
     created_on: Mapped[datetime] = mapped_column(default=datetime.now)
@@ -22,7 +26,7 @@ class Message(db.Model):
     requester_id: Mapped[int] = mapped_column(ForeignKey('requester.id'), nullable=True)
     requester: Mapped["Requester"] = relationship(back_populates='messages')
     
-    thread_id: Mapped[int] = mapped_column(ForeignKey('thread.id'))
+    thread_id: Mapped[int] = mapped_column(ForeignKey('thread.id'), index=True)
     thread: Mapped['Thread'] = relationship(back_populates='messages')
 
 
@@ -32,6 +36,16 @@ class Thread(db.Model):
         UNRESOLVED = 1
         APPROVED = 2
         DENIED = 3
+
+    __table_args__ = (
+        # Active thread lookup by requester (authentication)
+        Index('ix_thread_status_requester_id', 'status', 'requester_id'),
+        # Stale active threads lookup (the `deleteoldthreads` command)
+        Index('ix_thread_status_last_activity_on', 'status', 'last_activity_on'),
+        # Latest decisions (the recount of the moderation stats)
+        Index('ix_thread_resolved_on', 'resolved_on'),
+        UniqueConstraint('key', name='uq_thread_key'),
+    )
     
     id: Mapped[int] = mapped_column(primary_key=True)
     key: Mapped[str] = mapped_column()
@@ -39,12 +53,43 @@ class Thread(db.Model):
     
     created_on: Mapped[datetime] = mapped_column(default=datetime.now)
     last_activity_on: Mapped[datetime] = mapped_column(default=datetime.now, onupdate=datetime.now)
+    # When and by whom the thread got a finished status; no admin if it
+    # was resolved by the system
+    resolved_on: Mapped[datetime] = mapped_column(nullable=True)
+    resolved_by_id: Mapped[int] = mapped_column(ForeignKey('admin_user.id'), nullable=True)
+    # The review queue: the admin working on the thread, until the lease expires
+    claimed_by_id: Mapped[int] = mapped_column(ForeignKey('admin_user.id'), nullable=True)
+    claimed_until: Mapped[datetime] = mapped_column(nullable=True)
     
-    messages: Mapped[List["Message"]] = relationship(back_populates='thread')
+    messages: Mapped[List["Message"]] = relationship(
+        back_populates='thread', order_by='[Message.created_on, Message.id]')
     
     requester_id: Mapped[int] = mapped_column(ForeignKey('requester.id'))
     requester: Mapped["Requester"] = relationship(back_populates='threads')
 
     @classmethod
     def active(cls):
-        return db.session.query(cls).filter_by(status=cls.STATUSES.ACTIVE)
\ No newline at end of file
+        return db.session.query(cls).filter_by(status=cls.STATUSES.ACTIVE)
+
+    @classmethod
+    def claimable(cls, now: datetime):
+        """The filter of the threads nobody holds a lease on."""
+        return or_(cls.claimed_until.is_(None), cls.claimed_until < now)
+
+    @classmethod
+    def detailed_options(cls):
+        """Loader options for everything `ThreadDetailedSchema` reads."""
+        return (selectinload(cls.messages),)
+
+
+class ThreadArchive(db.Model):
+    """The messages of a resolved thread, packed into one zlib-compressed
+    JSON list; a thread archived more than once has several rows."""
+    id: Mapped[int] = mapped_column(primary_key=True)
+    data: Mapped[bytes] = mapped_column(LargeBinary)
+    message_count: Mapped[int] = mapped_column()
+    # The size of the uncompressed JSON, in bytes
+    raw_size: Mapped[int] = mapped_column()
+    created_on: Mapped[datetime] = mapped_column(default=datetime.now)
+
+    thread_id: Mapped[int] = mapped_column(ForeignKey('thread.id'), index=True)
@@ -2,12 +2,20 @@ from logging import getLogger
 from flask_login import current_user
 from pydantic import ValidationError
 from app.backend.admin.helpers import admin_only
-from app.backend.conversations.helpers import generate_thread_key, update_thread_status
+from app.backend.conversations.cache import get_cached_thread, get_thread_cache_stats, invalidate_thread_cache
+from app.backend.conversations.helpers import (bulk_update_thread_status, claim_next_thread, claim_thread,
+                                               generate_thread_key, get_thread_messages, load_thread_archive,
+                                               message_event, publish_thread_events, status_event,
+                                               stream_thread_events, update_thread_status)
 from app.backend.conversations.models import Message, Thread
-from flask import Blueprint, abort, jsonify, request, session
-from app.backend.conversations.schemas import MessageCreate, MessageSchema, ThreadBasicSchema, ThreadDetailedSchema, ThreadUpdate
+import re
+from flask import Blueprint, Response, abort, jsonify, make_response, request, session
+from sqlalchemy import select
+from app.backend.conversations.schemas import (MessageCreate, MessageSchema, ThreadBasicSchema, ThreadBulkUpdate,
+                                               ThreadClaimSchema, ThreadDetailedSchema, ThreadUpdate)
 from app.app_factory import db
-from app.backend.utils.pagination import paginate
+from app import config
+from app.backend.utils.pagination import paginate_response
 
 conversations_bp = Blueprint(
     name='conversations',
@@ -21,12 +29,10 @@ logger = getLogger(__name__)
 @conversations_bp.route('/messages', methods=['GET'])
 @admin_only
 def get_message_list():
-    pagination = paginate(request_args=request.args,
-                          sqlalchemy_query=Message.query,
-                          pydantic_model=MessageSchema,
-                          list_name='message_list')
-
-    return jsonify(pagination)
+    return paginate_response(request_args=request.args,
+                             sqlalchemy_query=Message.query,
+                             pydantic_model=MessageSchema,
+                             list_name='message_list')
 
 
 @conversations_bp.route('/messages/<int:id>', methods=["GET"])
@@ -51,6 +57,7 @@ def delete_message(id: int):
         response = {'success': False, 'message': 'No such Message.'}
         return jsonify(response), 404
 
+    thread_id = message.thread_id
     try:
         db.session.delete(message)
         db.session.commit()
@@ -59,6 +66,7 @@ def delete_message(id: int):
         return {'success': False,
                 'message': 'Unknown error occured'}, 500
 
+    invalidate_thread_cache([thread_id])
     return '', 204
 
 
@@ -77,22 +85,24 @@ def get_thread_list():
         query = query.filter(Thread.requester_id == requester_id)
     
     
-    pagination = paginate(request_args=request.args,
-                          sqlalchemy_query=query,
-                          pydantic_model=ThreadBasicSchema,
-                          list_name='thread_list')
-
-    return jsonify(pagination)
+    return paginate_response(request_args=request.args,
+                             sqlalchemy_query=query,
+                             pydantic_model=ThreadBasicSchema,
+                             list_name='thread_list')
 
 
 @conversations_bp.route('/threads/<int:id>', methods=["DELETE"])
 @admin_only
 def delete_thread(id: int):
-    thread: Thread = Thread.active().filter_by(id=id).first()
-
+    # Claimed first, so that no other admin decides it meanwhile
+    thread: Thread = claim_thread(id, current_user.id)
     if not thread:
-        response = {'success': False, 'message': 'No such Thread.'}
-        return jsonify(response), 404
+        db.session.rollback()
+        if not Thread.active().filter_by(id=id).first():
+            response = {'success': False, 'message': 'No such Thread.'}
+            return jsonify(response), 404
+        response = {'success': False, 'message': 'The Thread is claimed by another admin.'}
+        return jsonify(response), 409
     
     try:
         update_thread_status(
@@ -116,10 +126,15 @@ def update_thread(id: int):
     except ValidationError as error:
         return jsonify({"errors": error.errors(include_url=False, include_context=False)}), 400
 
-    thread: Thread = Thread.active().filter_by(id=id).first()
+    # Claimed first, so that no other admin decides it meanwhile
+    thread: Thread = claim_thread(id, current_user.id)
     if not thread:
-        response = {'success': False, 'message': 'No such Thread.'}
-        return jsonify(response), 404
+        db.session.rollback()
+        if not Thread.active().filter_by(id=id).first():
+            response = {'success': False, 'message': 'No such Thread.'}
+            return jsonify(response), 404
+        response = {'success': False, 'message': 'The Thread is claimed by another admin.'}
+        return jsonify(response), 409
     
     try:
         update_thread_status(
@@ -132,12 +147,154 @@ def update_thread(id: int):
         return {'success': False,
                 'message': 'Unknown error occured'}, 500    
 
+    thread = Thread.query.options(*Thread.detailed_options()).filter_by(id=id).first()
     response = ThreadDetailedSchema.model_validate(thread).model_dump()
     return jsonify(response)
 
 
+@conversations_bp.route('/threads/bulk-status', methods=['POST'])
+@admin_only
+def bulk_update_threads():
+    try:
+        schema = ThreadBulkUpdate(**request.get_json())
+    except ValidationError as error:
+        return jsonify({"errors": error.errors(include_url=False, include_context=False)}), 400
+
+    if schema.status not in (Thread.STATUSES.APPROVED, Thread.STATUSES.DENIED, Thread.STATUSES.UNRESOLVED):
+        response = {'success': False, 'message': 'No such finished status.'}
+        return jsonify(response), 400
+
+    thread_ids = list(dict.fromkeys(schema.ids))
+    if not 0 < len(thread_ids) <= config.THREAD_BULK_STATUS_MAX_SIZE:
+        response = {'success': False,
+                    'message': f'Between 1 and {config.THREAD_BULK_STATUS_MAX_SIZE} Threads at once.'}
+        return jsonify(response), 400
+
+    try:
+        updated_ids = bulk_update_thread_status(thread_ids, Thread.STATUSES(schema.status))
+        # Not updated as claimed by another admin, or as not active
+        skipped_ids = set(thread_ids).difference(updated_ids)
+        claimed_ids = set(db.session.scalars(
+            select(Thread.id).where(Thread.id.in_(skipped_ids), Thread.status == Thread.STATUSES.ACTIVE)
+        ).all()) if skipped_ids else set()
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.exception(e)
+        return {'success': False,
+                'message': 'Unknown error occured'}, 500
+
+    results = {thread_id: 'updated' if thread_id in updated_ids else
+               'claimed' if thread_id in claimed_ids else 'not_found'
+               for thread_id in thread_ids}
+
+    invalidate_thread_cache(updated_ids)
+    publish_thread_events([status_event(thread_id, schema.status) for thread_id in updated_ids])
+
+    return jsonify({'updated': len(updated_ids), 'results': results})
+
+
+@conversations_bp.route('/queue/next', methods=['POST'])
+@admin_only
+def claim_next_queued_thread():
+    thread_id = claim_next_thread(admin_id=current_user.id)
+
+    if thread_id is None:
+        response = {'success': False, 'message': 'The queue is empty.'}
+        return jsonify(response), 404
+
+    thread: Thread = db.session.get(Thread, thread_id)
+    finished_statuses = [status for status in Thread.STATUSES if status != Thread.STATUSES.ACTIVE]
+    is_repeat_requester = db.session.query(
+        Thread.query.filter(Thread.status.in_(finished_statuses),
+                            Thread.requester_id == thread.requester_id).exists()
+    ).scalar()
+
+    response = ThreadClaimSchema(
+        **ThreadBasicSchema.model_validate(thread).model_dump(),
+        claimed_by_id=thread.claimed_by_id,
+        claimed_until=thread.claimed_until,
+        is_repeat_requester=is_repeat_requester,
+    ).model_dump()
+    return jsonify(response)
+
+
 @conversations_bp.route('/threads/<int:id>', methods=["GET"])
 def get_thread(id: int):
+    cached_thread = get_cached_thread(id)
+
+    if not cached_thread:
+        response = {'success': False, 'message': 'No such Thread.'}
+        return jsonify(response), 404
+
+    if cached_thread.requester_id != session.get('requester_id') and current_user.is_anonymous:
+        abort(403)
+
+    # query params
+    since_id = request.args.get("since_id", type=int)
+    before_id = request.args.get("before_id", type=int)
+    limit = request.args.get("limit", type=int)
+    if limit is not None and limit < 1:
+        abort(400)
+
+    # Every window of the messages is a representation of its own
+    window = (since_id, before_id, limit)
+    etag = cached_thread.etag
+    if window != (None, None, None):
+        etag += '-' + '-'.join('' if value is None else str(value) for value in window)
+
+    # Nothing to send if the client already has the latest version
+    if etag in request.if_none_match:
+        response = make_response('', 304)
+        response.set_etag(etag)
+        return response
+
+    if window == (None, None, None):
+        response = Response(cached_thread.payload, mimetype='application/json')
+        response.set_etag(etag)
+        return response
+
+    thread: Thread = Thread.active().filter_by(id=id).first()
+    if not thread:
+        response = {'success': False, 'message': 'No such Thread.'}
+        return jsonify(response), 404
+
+    messages = get_thread_messages(thread=thread,
+                                   since_id=since_id,
+                                   before_id=before_id,
+                                   limit=limit)
+
+    response = ThreadDetailedSchema(
+        **ThreadBasicSchema.model_validate(thread).model_dump(),
+        messages=[MessageSchema.model_validate(message) for message in messages]
+    ).model_dump()
+    response = jsonify(response)
+    response.set_etag(etag)
+    return response
+
+
+@conversations_bp.route('/threads/cache-stats', methods=["GET"])
+@admin_only
+def get_thread_cache_statistics():
+    return jsonify(get_thread_cache_stats())
+
+
+@conversations_bp.route('/threads/<int:id>/archive', methods=["GET"])
+@admin_only
+def get_thread_archive(id: int):
+    thread = db.session.get(Thread, id)
+
+    if not thread:
+        response = {'success': False, 'message': 'No such Thread.'}
+        return jsonify(response), 404
+
+    response = ThreadBasicSchema.model_validate(thread).model_dump()
+    response['messages'] = load_thread_archive(thread.id)
+    return jsonify(response)
+
+
+@conversations_bp.route('/threads/<int:id>/events', methods=["GET"])
+def get_thread_events(id: int):
     thread: Thread = Thread.active().filter_by(id=id).first()
 
     if not thread:
@@ -147,8 +304,17 @@ def get_thread(id: int):
     if thread.requester_id != session.get('requester_id') and current_user.is_anonymous:
         abort(403)
 
-    response = ThreadDetailedSchema.model_validate(thread).model_dump()
-    return jsonify(response)
+    last_event_id = request.headers.get('Last-Event-ID')
+    if last_event_id is not None and not re.fullmatch(r'\d+-\d+', last_event_id):
+        last_event_id = None
+
+    # The generator doesn't need the request context, so the DB session is
+    # released before streaming starts
+    response = Response(stream_thread_events(thread_id=thread.id, last_event_id=last_event_id),
+                        mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # disable the nginx buffering
+    return response
 
 
 @conversations_bp.route('/threads/<int:id>', methods=['POST'])
@@ -179,6 +345,9 @@ def send_message_to_thread(id: int):
         return {'success': False,
                 'message': 'Unknown error occured'}, 500
 
+    invalidate_thread_cache([id])
+    publish_thread_events([message_event(message)])
+
     response = MessageSchema.model_validate(message).model_dump()
     return jsonify(response)
 
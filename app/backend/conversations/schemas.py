@@ -1,12 +1,12 @@
-from datetime import datetime
 from typing import List, Optional
 from pydantic import BaseModel, ConfigDict
+from app.backend.utils.serialization import HttpDatetime
 
 
 class MessageSchema(BaseModel):
     id: int
     text: str
-    created_on: datetime
+    created_on: HttpDatetime
     thread_id: int
     admin_user_id: Optional[int]
     requester_id: Optional[int]
@@ -21,18 +21,30 @@ class MessageCreate(BaseModel):
 class ThreadBasicSchema(BaseModel):
     id: int
     status: int
-    created_on: datetime
-    last_activity_on: datetime
+    created_on: HttpDatetime
+    last_activity_on: HttpDatetime
     requester_id: int
     
     model_config = ConfigDict(from_attributes=True)
 
 
+class ThreadClaimSchema(BaseModel):
+    id: int
+    status: int
+    created_on: HttpDatetime
+    last_activity_on: HttpDatetime
+    requester_id: int
+    claimed_by_id: int
+    claimed_until: HttpDatetime
+    # The requester had threads before this one
+    is_repeat_requester: bool
+
+
 class ThreadDetailedSchema(BaseModel):
     id: int
     status: int
-    created_on: datetime
-    last_activity_on: datetime
+    created_on: HttpDatetime
+    last_activity_on: HttpDatetime
     requester_id: int
     messages: List[MessageSchema]
     
@@ -41,3 +53,8 @@ class ThreadDetailedSchema(BaseModel):
     
 class ThreadUpdate(BaseModel):
     status: int
+
+
+class ThreadBulkUpdate(BaseModel):
+    ids: List[int]
+    status: int
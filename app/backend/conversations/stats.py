@@ -0,0 +1,174 @@
+from collections import defaultdict
+from datetime import datetime
+from logging import getLogger
+import statistics
+from typing import Dict, Iterable, Optional, Tuple
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import Session
+from app import config
+from app.app_factory import db, redis_client
+from app.backend.conversations.models import Thread
+
+
+logger = getLogger(__name__)
+
+STATUSES_KEY = 'moderation_stats:statuses'
+# Thread id -> creation timestamp of the active threads
+ACTIVE_THREADS_KEY = 'moderation_stats:active_threads'
+# The wait times, in seconds, of the latest decisions, newest first
+WAIT_TIMES_KEY = 'moderation_stats:wait_times'
+# Held by the request recounting the lost counters
+RECOUNT_LOCK_KEY = 'moderation_stats:recount_lock'
+
+# The changes of a transaction, applied to the counters once it is committed
+_PENDING = 'moderation_stats'
+
+
+def decisions_key(day: datetime) -> str:
+    return f'moderation_stats:decisions:{day:%Y-%m-%d}'
+
+
+def _get_pending(session: Session) -> dict:
+    return session.info.setdefault(_PENDING, {
+        'statuses': defaultdict(int),
+        'activated': {},
+        'resolved': [],
+    })
+
+
+def record_thread_created(thread: Thread):
+    pending = _get_pending(db.session())
+    pending['statuses'][Thread.STATUSES.ACTIVE] += 1
+    pending['activated'][thread.id] = thread.created_on or datetime.now()
+
+
+def record_status_changes(threads: Iterable[Tuple[int, int, datetime]], new_status: Thread.STATUSES,
+                          admin_id: Optional[int]):
+    """Record the change of the `(id, old status, created_on)` threads to the
+    new status, made by the admin (or by the system if None)."""
+    pending = _get_pending(db.session())
+    now = datetime.now()
+    for thread_id, old_status, created_on in threads:
+        if old_status == new_status:
+            continue
+        pending['statuses'][old_status] -= 1
+        pending['statuses'][new_status] += 1
+
+        if new_status == Thread.STATUSES.ACTIVE:
+            pending['activated'][thread_id] = created_on
+        elif old_status == Thread.STATUSES.ACTIVE:
+            pending['activated'].pop(thread_id, None)
+            pending['resolved'].append((thread_id, (now - created_on).total_seconds(), admin_id))
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_pending(session: Session):
+    # Only the outermost transaction, not the savepoints
+    if session.in_nested_transaction():
+        return None
+
+    pending = session.info.pop(_PENDING, None)
+    if not pending:
+        return None
+
+    today_key = decisions_key(datetime.now())
+    pipeline = redis_client.pipeline(transaction=False)
+    for status, delta in pending['statuses'].items():
+        if delta:
+            pipeline.hincrby(STATUSES_KEY, int(status), delta)
+    if pending['activated']:
+        pipeline.zadd(ACTIVE_THREADS_KEY, {thread_id: created_on.timestamp()
+                                           for thread_id, created_on in pending['activated'].items()})
+    for thread_id, wait_time, admin_id in pending['resolved']:
+        pipeline.zrem(ACTIVE_THREADS_KEY, thread_id)
+        pipeline.lpush(WAIT_TIMES_KEY, wait_time)
+        if admin_id is not None:
+            pipeline.hincrby(today_key, admin_id, 1)
+    if pending['resolved']:
+        pipeline.ltrim(WAIT_TIMES_KEY, 0, config.MODERATION_STATS_WAIT_SAMPLE - 1)
+        pipeline.expire(today_key, 2 * 86400)
+
+    # The transaction is already committed; the recount fixes the counters
+    try:
+        pipeline.execute()
+    except Exception as e:
+        logger.exception(e)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_pending(session: Session):
+    if session.in_nested_transaction():
+        return None
+    session.info.pop(_PENDING, None)
+
+
+def _read_counters() -> list:
+    pipeline = redis_client.pipeline(transaction=False)
+    pipeline.hgetall(STATUSES_KEY)
+    pipeline.zrange(ACTIVE_THREADS_KEY, 0, 0, withscores=True)
+    pipeline.lrange(WAIT_TIMES_KEY, 0, -1)
+    pipeline.hgetall(decisions_key(datetime.now()))
+    return pipeline.execute()
+
+
+def get_moderation_stats() -> Dict:
+    """The dashboard numbers, read from the counters in constant time. The
+    wait times are those of the latest `MODERATION_STATS_WAIT_SAMPLE`
+    decisions. The counters are recounted by the `recountstats` cron job;
+    only if Redis lost them does one request recount them first."""
+    statuses, oldest_active, wait_times, decisions = _read_counters()
+    if not statuses and redis_client.set(RECOUNT_LOCK_KEY, 1, nx=True,
+                                         ex=config.MODERATION_STATS_RECOUNT_LOCK_TIMEOUT):
+        try:
+            recount_moderation_stats()
+        finally:
+            redis_client.delete(RECOUNT_LOCK_KEY)
+        statuses, oldest_active, wait_times, decisions = _read_counters()
+
+    counts = {int(status): int(count) for status, count in statuses.items()}
+    wait_times = sorted(float(wait_time) for wait_time in wait_times)
+
+    return {
+        'threads_by_status': {status.name: counts.get(status, 0) for status in Thread.STATUSES},
+        'oldest_active_thread_age': (datetime.now().timestamp() - oldest_active[0][1]) if oldest_active else None,
+        'wait_time': {
+            'median': statistics.median(wait_times) if wait_times else None,
+            'p95': wait_times[max(round(len(wait_times) * 0.95) - 1, 0)] if wait_times else None,
+            'sample_size': len(wait_times),
+        },
+        'decisions_today': {int(admin_id): int(count) for admin_id, count in decisions.items()},
+    }
+
+
+def recount_moderation_stats():
+    """Rebuild the counters from the database, correcting any drift. The
+    changes committed while it runs may be lost until the next recount."""
+    statuses = dict(db.session.execute(
+        select(Thread.status, func.count(Thread.id)).group_by(Thread.status)).all())
+
+    active_threads = {thread_id: created_on.timestamp() for thread_id, created_on in db.session.execute(
+        select(Thread.id, Thread.created_on).filter(Thread.status == Thread.STATUSES.ACTIVE))}
+
+    wait_times = [(resolved_on - created_on).total_seconds() for resolved_on, created_on in db.session.execute(
+        select(Thread.resolved_on, Thread.created_on)
+        .filter(Thread.resolved_on.is_not(None))
+        .order_by(Thread.resolved_on.desc())
+        .limit(config.MODERATION_STATS_WAIT_SAMPLE))]
+
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    decisions = dict(db.session.execute(
+        select(Thread.resolved_by_id, func.count(Thread.id))
+        .filter(Thread.resolved_on >= today, Thread.resolved_by_id.is_not(None))
+        .group_by(Thread.resolved_by_id)).all())
+
+    pipeline = redis_client.pipeline(transaction=True)
+    pipeline.delete(STATUSES_KEY, ACTIVE_THREADS_KEY, WAIT_TIMES_KEY, decisions_key(today))
+    pipeline.hset(STATUSES_KEY, mapping={int(status): statuses.get(status, 0) for status in Thread.STATUSES})
+    if active_threads:
+        pipeline.zadd(ACTIVE_THREADS_KEY, active_threads)
+    if wait_times:
+        pipeline.rpush(WAIT_TIMES_KEY, *wait_times)
+    if decisions:
+        pipeline.hset(decisions_key(today), mapping=decisions)
+        pipeline.expire(decisions_key(today), 2 * 86400)
+    pipeline.execute()
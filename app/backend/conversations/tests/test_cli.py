@@ -1,6 +1,6 @@
 import datetime
 from app.backend.conversations.helpers import create_thread
-from app.backend.conversations.models import Thread
+from app.backend.conversations.models import Message, Thread, ThreadArchive
 from app.backend.conversations.сli import delete_old_threads
 from app.app_factory import db
 from app.backend.requesters.helpers import create_requester
@@ -30,7 +30,42 @@ def test_delete_old_threads(runner):
     assert result.exit_code == 0
     assert Thread.active().count() == 7
     # Since the default value is set to 7 days
+    assert ThreadArchive.query.count() == 23
     
     result = runner.invoke(delete_old_threads, args=['3'])
     assert result.exit_code == 0
-    assert Thread.active().count() == 3
\ No newline at end of file
+    assert Thread.active().count() == 3
+
+
+def test_delete_old_threads_chunks(runner):
+    requester_schema = RequesterCreate(
+        username= 'test',
+        fp='test',
+        first_message='test'
+    )
+    requester = create_requester(schema=requester_schema, testing=True)
+
+    old_time = datetime.datetime.now() - datetime.timedelta(days=30)
+
+    # Create some old threads
+    for i in range(5):
+        thread: Thread = create_thread(
+            requester=requester,
+            first_message='Test'
+        )
+        thread.last_activity_on = old_time
+    db.session.commit()
+
+    # Nothing changes in the dry run
+    result = runner.invoke(delete_old_threads, args=['--dry-run', '--chunk-size', '2'])
+    assert result.exit_code == 0
+    assert 'Total Threads to be deleted: 5' in result.output
+    assert Thread.active().count() == 5
+    assert Message.query.count() == 5
+
+    result = runner.invoke(delete_old_threads, args=['--chunk-size', '2'])
+    assert result.exit_code == 0
+    assert result.output.count('Threads deleted.') == 3
+    assert Thread.active().count() == 0
+    assert Thread.query.filter_by(status=Thread.STATUSES.UNRESOLVED).count() == 5
+    assert Message.query.count() == 0
@@ -0,0 +1,36 @@
+import datetime
+from app.app_factory import db
+from app.backend.conversations.models import Message, Thread
+
+
+def explain(query) -> str:
+    """Return the SQLite query plan of the ORM query as a single string."""
+    statement = query.statement.compile(dialect=db.engine.dialect,
+                                        compile_kwargs={'literal_binds': True})
+    rows = db.session.execute(db.text(f'EXPLAIN QUERY PLAN {statement}')).all()
+    return ' | '.join(row[-1] for row in rows)
+
+
+def test_active_threads_by_requester_uses_index(app):
+    plan = explain(Thread.active().filter_by(requester_id=1))
+    assert 'ix_thread_status_requester_id' in plan
+    assert 'SCAN thread' not in plan
+
+
+def test_stale_threads_use_index(app):
+    delete_since = datetime.datetime.now() - datetime.timedelta(days=7)
+    plan = explain(Thread.active().filter(Thread.last_activity_on < delete_since))
+    assert 'ix_thread_status_last_activity_on' in plan
+    assert 'SCAN thread' not in plan
+
+
+def test_thread_key_lookup_uses_index(app):
+    plan = explain(Thread.query.filter_by(key='PINBAN-AAA-0000'))
+    assert 'SEARCH thread USING' in plan
+    assert '(key=?)' in plan
+
+
+def test_thread_messages_use_index(app):
+    plan = explain(Message.query.filter_by(thread_id=1))
+    assert 'ix_message_thread_id' in plan
+    assert 'SCAN message' not in plan
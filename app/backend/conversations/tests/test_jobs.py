@@ -0,0 +1,130 @@
+import json
+from app import config
+from app.app_factory import db, redis_client
+from app.backend.conversations.helpers import bulk_update_thread_status, create_thread, update_thread_status
+from app.backend.conversations.jobs import threads_approved, threads_denied
+from app.backend.conversations.models import Thread
+from app.backend.conversations.сli import run_worker
+from app.backend.utils.jobs import DEAD_KEY, DELAYED_KEY, GROUP_NAME, JOBS, STREAM_KEY, job_name
+
+
+def replace_job(monkeypatch, function, calls: list, failures: int = 0):
+    """Record the calls of the job, failing the first `failures` ones."""
+    def replacement(thread_ids):
+        calls.append((thread_ids, db.session.get(Thread, thread_ids[0]).status))
+        if len(calls) <= failures:
+            raise RuntimeError('The game server is down.')
+
+    monkeypatch.setitem(JOBS, job_name(function), replacement)
+
+
+def test_status_hooks_jobs(runner, minimal_testing_setup, monkeypatch):
+    monkeypatch.setattr(config, 'JOB_QUEUE_SYNC', False)
+    first_thread, second_thread = minimal_testing_setup['threads']
+    calls = []
+    replace_job(monkeypatch, threads_denied, calls)
+
+    # Enqueued once committed, not run in the request
+    update_thread_status(thread=first_thread, new_status=Thread.STATUSES.DENIED, processed_by_system=True)
+    assert calls == []
+    assert redis_client.xlen(STREAM_KEY) == 1
+
+    # Nothing if rolled back
+    bulk_update_thread_status([second_thread.id], Thread.STATUSES.DENIED, processed_by_system=True)
+    db.session.rollback()
+    assert redis_client.xlen(STREAM_KEY) == 1
+
+    result = runner.invoke(run_worker, ['--burst'])
+    assert result.exit_code == 0
+    assert '1 jobs run' in result.output
+    # The job sees the committed change
+    assert calls == [([first_thread.id], Thread.STATUSES.DENIED)]
+    assert redis_client.xlen(STREAM_KEY) == 0
+
+
+def test_jobs_with_savepoints(runner, minimal_testing_setup, monkeypatch):
+    monkeypatch.setattr(config, 'JOB_QUEUE_SYNC', False)
+    first_thread, second_thread = minimal_testing_setup['threads']
+    requester = minimal_testing_setup['requesters'][0]
+
+    # Not pushed when a savepoint is released, only with the outer commit
+    bulk_update_thread_status([first_thread.id], Thread.STATUSES.DENIED, processed_by_system=True)
+    create_thread(requester=requester, first_message='Unban me.', commit=False)
+    db.session.rollback()
+    assert redis_client.xlen(STREAM_KEY) == 0
+
+    # Nor discarded when a savepoint is rolled back
+    bulk_update_thread_status([second_thread.id], Thread.STATUSES.DENIED, processed_by_system=True)
+    savepoint = db.session.begin_nested()
+    savepoint.rollback()
+    db.session.commit()
+    assert redis_client.xlen(STREAM_KEY) == 1
+
+
+def test_job_retries(runner, minimal_testing_setup, monkeypatch):
+    monkeypatch.setattr(config, 'JOB_QUEUE_SYNC', False)
+    monkeypatch.setattr(config, 'JOB_MAX_ATTEMPTS', 2)
+    thread = minimal_testing_setup['threads'][0]
+    calls = []
+    replace_job(monkeypatch, threads_approved, calls, failures=2)
+
+    update_thread_status(thread=thread, new_status=Thread.STATUSES.APPROVED, processed_by_system=True)
+    runner.invoke(run_worker, ['--burst'])
+    assert len(calls) == 1
+    # Waiting for the backoff
+    (payload, due_on), = redis_client.zrange(DELAYED_KEY, 0, -1, withscores=True)
+    assert json.loads(payload)['attempt'] == 1
+    runner.invoke(run_worker, ['--burst'])
+    assert len(calls) == 1
+
+    redis_client.zadd(DELAYED_KEY, {payload: 0})
+    runner.invoke(run_worker, ['--burst'])
+    assert len(calls) == 2
+    assert redis_client.zcard(DELAYED_KEY) == 0
+    dead_job = json.loads(redis_client.lindex(DEAD_KEY, 0))
+    assert dead_job['name'] == job_name(threads_approved)
+    assert dead_job['args'] == [[thread.id]]
+    assert 'The game server is down.' in dead_job['error']
+
+
+def test_job_of_dead_worker(runner, minimal_testing_setup, monkeypatch):
+    monkeypatch.setattr(config, 'JOB_QUEUE_SYNC', False)
+    thread = minimal_testing_setup['threads'][0]
+    calls = []
+    replace_job(monkeypatch, threads_denied, calls)
+
+    update_thread_status(thread=thread, new_status=Thread.STATUSES.DENIED, processed_by_system=True)
+    # Taken by a worker which died before finishing it
+    runner.invoke(run_worker, ['--burst'])
+    redis_client.xadd(STREAM_KEY, {'job': json.dumps({'id': 'x', 'name': job_name(threads_denied),
+                                                      'args': [[thread.id]], 'attempt': 0})})
+    redis_client.xreadgroup(GROUP_NAME, 'dead-worker', {STREAM_KEY: '>'})
+    calls.clear()
+
+    runner.invoke(run_worker, ['--burst'])
+    assert calls == []
+
+    monkeypatch.setattr(config, 'JOB_VISIBILITY_TIMEOUT', 0)
+    runner.invoke(run_worker, ['--burst'])
+    assert calls == [([thread.id], Thread.STATUSES.DENIED)]
+    assert redis_client.xpending(STREAM_KEY, GROUP_NAME)['pending'] == 0
+
+
+def test_sync_jobs(minimal_testing_setup, monkeypatch):
+    monkeypatch.setattr(config, 'JOB_MAX_ATTEMPTS', 2)
+    first_thread, second_thread = minimal_testing_setup['threads']
+    calls = []
+    replace_job(monkeypatch, threads_denied, calls, failures=1)
+
+    # Run right after the commit, retried at once
+    update_thread_status(thread=first_thread, new_status=Thread.STATUSES.DENIED, processed_by_system=True)
+    assert calls == [([first_thread.id], Thread.STATUSES.DENIED)] * 2
+    assert redis_client.llen(DEAD_KEY) == 0
+
+    calls.clear()
+    replace_job(monkeypatch, threads_denied, calls, failures=2)
+    bulk_update_thread_status([second_thread.id], Thread.STATUSES.DENIED, processed_by_system=True)
+    db.session.commit()
+    assert len(calls) == 2
+    assert redis_client.llen(DEAD_KEY) == 1
+    assert redis_client.xlen(STREAM_KEY) == 0
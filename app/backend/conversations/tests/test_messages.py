@@ -1,8 +1,14 @@
+import pytest
+import json
+from flask import jsonify
 from flask.testing import FlaskClient
 from app.conftest import TEST_PASSWORD
 from app.backend.conversations.models import Message
+from app.backend.conversations.schemas import MessageSchema
+from app.backend.utils.pagination import paginate
 
 
+@pytest.mark.max_queries(2)
 def test_get_message_list(client: FlaskClient, minimal_testing_setup):
     # Non-authorized login
     response = client.get('api/conversations/messages')
@@ -43,6 +49,7 @@ def test_get_message(client: FlaskClient, minimal_testing_setup):
     assert response.status_code == 404
 
 
+@pytest.mark.max_queries(2)
 def test_delete_message(client: FlaskClient, minimal_testing_setup):
     message = message = minimal_testing_setup['threads'][0].messages[0]
 
@@ -62,3 +69,46 @@ def test_delete_message(client: FlaskClient, minimal_testing_setup):
     response = client.get(f'api/conversations/messages/{message.id}')
     assert response.status_code == 404
 
+
+def test_get_message_list_cursor(client: FlaskClient, minimal_testing_setup):
+    response = client.post('api/admin/login', json={
+        'username': minimal_testing_setup['admin_users'][0].username,
+        'password': TEST_PASSWORD
+    })
+
+    # Walk through all the pages one message at a time
+    seen_ids = []
+    cursor = ''
+    while cursor is not None:
+        response = client.get(f'api/conversations/messages?after={cursor}&limit=1')
+        assert response.status_code == 200
+        assert 'total' not in response.get_json()
+
+        seen_ids.extend(m['id'] for m in response.get_json()['message_list'])
+        cursor = response.get_json()['next_cursor']
+
+    assert len(seen_ids) == Message.query.count()
+    assert len(set(seen_ids)) == len(seen_ids)
+
+    # Malformed cursor
+    response = client.get('api/conversations/messages?after=not-a-cursor')
+    assert response.status_code == 400
+
+
+def test_get_message_list_matches_paginate(client: FlaskClient, minimal_testing_setup):
+    response = client.post('api/admin/login', json={
+        'username': minimal_testing_setup['admin_users'][0].username,
+        'password': TEST_PASSWORD
+    })
+
+    # The fast path gives the same data as the per-object serialization
+    for query_string in ['', '?after=', '?page=2&per-page=2']:
+        response = client.get(f'api/conversations/messages{query_string}')
+        assert response.status_code == 200
+
+        request_args = dict(arg.split('=') for arg in query_string[1:].split('&') if arg)
+        expected = paginate(request_args=request_args,
+                            sqlalchemy_query=Message.query,
+                            pydantic_model=MessageSchema,
+                            list_name='message_list')
+        assert response.get_json() == json.loads(jsonify(expected).data)
@@ -1,8 +1,17 @@
+from datetime import datetime, timedelta
+import pytest
+from flask import Flask, g
 from flask.testing import FlaskClient
-from app.backend.conversations.models import Thread
-from app.conftest import TEST_FP, TEST_PASSWORD
+from app import config
+from app.app_factory import db, redis_client
+from app.backend.conversations.cache import get_thread_cache_stats
+from app.backend.conversations.helpers import (THREAD_KEY_COUNTER, bulk_update_thread_status, create_thread,
+                                               stream_thread_events, thread_key_from_number, update_thread_status)
+from app.backend.conversations.models import Message, Thread, ThreadArchive
+from app.conftest import TEST_FP, TEST_PASSWORD, assert_max_queries
 
 
+@pytest.mark.max_queries(2)
 def test_get_thread_list(client: FlaskClient, minimal_testing_setup):
     response = client.get('api/conversations/threads')
     assert response.status_code == 401
@@ -32,6 +41,7 @@ def test_get_thread_list(client: FlaskClient, minimal_testing_setup):
     assert response.get_json()['total'] == len(requester.threads)
 
 
+@pytest.mark.max_queries(6)
 def test_delete_thread(client: FlaskClient, minimal_testing_setup):
     thread = minimal_testing_setup['threads'][0]
 
@@ -48,6 +58,7 @@ def test_delete_thread(client: FlaskClient, minimal_testing_setup):
     assert response.status_code == 204
 
 
+@pytest.mark.max_queries(8)
 def test_update_thread(client: FlaskClient, minimal_testing_setup):
     thread: Thread = minimal_testing_setup['threads'][0]
     new_status = Thread.STATUSES.APPROVED.value
@@ -70,6 +81,56 @@ def test_update_thread(client: FlaskClient, minimal_testing_setup):
     assert thread.requester.last_reviewed_by_id == minimal_testing_setup['admin_users'][0].id
 
 
+@pytest.mark.max_queries(8)
+def test_bulk_update_threads(client: FlaskClient, minimal_testing_setup, monkeypatch):
+    first_thread, second_thread = minimal_testing_setup['threads']
+    first_admin, second_admin = minimal_testing_setup['admin_users']
+    url = 'api/conversations/threads/bulk-status'
+    new_status = Thread.STATUSES.APPROVED.value
+    response = client.post(url, json={'ids': [first_thread.id], 'status': new_status})
+    assert response.status_code == 401
+
+    # Log in
+    response = client.post('api/admin/login', json={
+        'username': first_admin.username,
+        'password': TEST_PASSWORD
+    })
+
+    second_thread.claimed_by_id = second_admin.id
+    second_thread.claimed_until = datetime.now() + timedelta(minutes=5)
+    db.session.commit()
+
+    response = client.post(url, json={'ids': [first_thread.id, second_thread.id, 999, first_thread.id],
+                                      'status': new_status})
+    assert response.status_code == 200
+    assert response.get_json() == {
+        'updated': 1,
+        'results': {str(first_thread.id): 'updated', str(second_thread.id): 'claimed', '999': 'not_found'},
+    }
+    assert first_thread.status == new_status
+    assert first_thread.requester.last_reviewed_by_id == first_admin.id
+    assert Message.query.filter_by(thread_id=first_thread.id).count() == 0
+    assert ThreadArchive.query.filter_by(thread_id=first_thread.id).count() == 1
+    assert second_thread.status == Thread.STATUSES.ACTIVE
+
+    # Already decided
+    response = client.post(url, json={'ids': [first_thread.id], 'status': new_status})
+    assert response.get_json() == {'updated': 0, 'results': {str(first_thread.id): 'not_found'}}
+    # Even if decided after the threads were picked, the UPDATE checks it
+    assert bulk_update_thread_status([first_thread.id], Thread.STATUSES.DENIED, processed_by_system=True) == []
+    db.session.commit()
+    assert first_thread.status == new_status
+
+    response = client.post(url, json={'ids': [second_thread.id], 'status': Thread.STATUSES.ACTIVE.value})
+    assert response.status_code == 400
+    response = client.post(url, json={'ids': [], 'status': new_status})
+    assert response.status_code == 400
+    monkeypatch.setattr(config, 'THREAD_BULK_STATUS_MAX_SIZE', 1)
+    response = client.post(url, json={'ids': [1, 2], 'status': new_status})
+    assert response.status_code == 400
+
+
+@pytest.mark.max_queries(2)
 def test_get_thread(client: FlaskClient, minimal_testing_setup):
     thread = minimal_testing_setup['threads'][0]
     requester = minimal_testing_setup['requesters'][0]
@@ -103,6 +164,7 @@ def test_get_thread(client: FlaskClient, minimal_testing_setup):
     assert response.get_json()['id'] == thread.id
 
 
+@pytest.mark.max_queries(3)
 def test_send_message_to_thread(client: FlaskClient, minimal_testing_setup):
     thread = minimal_testing_setup['threads'][0]
     requester = minimal_testing_setup['requesters'][0]
@@ -138,3 +200,344 @@ def test_get_thread_statuses(client: FlaskClient, minimal_testing_setup):
     response = client.get('api/conversations/thread-statuses')
     assert response.status_code == 200
     assert len(response.get_json().keys()) == len(statuses.keys())
+
+
+def test_get_thread_since_id(client: FlaskClient, minimal_testing_setup):
+    thread = minimal_testing_setup['threads'][0]
+
+    response = client.post('api/admin/login', json={
+        'username': minimal_testing_setup['admin_users'][0].username,
+        'password': TEST_PASSWORD
+    })
+
+    response = client.get(f'api/conversations/threads/{thread.id}')
+    messages = response.get_json()['messages']
+    assert len(messages) == 2
+
+    # Only the newer messages
+    response = client.get(
+        f'api/conversations/threads/{thread.id}?since_id={messages[0]["id"]}')
+    assert response.status_code == 200
+    assert [m['id'] for m in response.get_json()['messages']] == [messages[1]['id']]
+
+    # Older history windowing
+    response = client.get(f'api/conversations/threads/{thread.id}?limit=1')
+    assert [m['id'] for m in response.get_json()['messages']] == [messages[1]['id']]
+
+    response = client.get(
+        f'api/conversations/threads/{thread.id}?before_id={messages[1]["id"]}&limit=1')
+    assert [m['id'] for m in response.get_json()['messages']] == [messages[0]['id']]
+
+    response = client.get(f'api/conversations/threads/{thread.id}?limit=0')
+    assert response.status_code == 400
+
+
+def test_get_thread_etag(client: FlaskClient, minimal_testing_setup):
+    thread = minimal_testing_setup['threads'][0]
+
+    response = client.post('api/admin/login', json={
+        'username': minimal_testing_setup['admin_users'][0].username,
+        'password': TEST_PASSWORD
+    })
+
+    response = client.get(f'api/conversations/threads/{thread.id}')
+    etag = response.headers['ETag']
+
+    # Unchanged Thread
+    response = client.get(f'api/conversations/threads/{thread.id}',
+                          headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+
+    # A window of the Messages has an ETag of its own
+    response = client.get(f'api/conversations/threads/{thread.id}?limit=1',
+                          headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert len(response.get_json()['messages']) == 1
+    window_etag = response.headers['ETag']
+    assert window_etag != etag
+    response = client.get(f'api/conversations/threads/{thread.id}?limit=1',
+                          headers={'If-None-Match': window_etag})
+    assert response.status_code == 304
+    response = client.get(f'api/conversations/threads/{thread.id}?limit=2',
+                          headers={'If-None-Match': window_etag})
+    assert response.status_code == 200
+    response = client.get(f'api/conversations/threads/{thread.id}',
+                          headers={'If-None-Match': window_etag})
+    assert response.status_code == 200
+
+    # A new Message changes the ETag
+    response = client.post(f'/api/admin/send-message/{thread.id}', json={
+        'text': 'Testing Text'
+    })
+    response = client.get(f'api/conversations/threads/{thread.id}',
+                          headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert len(response.get_json()['messages']) == 3
+
+
+def test_get_thread_events(client: FlaskClient, minimal_testing_setup, monkeypatch):
+    monkeypatch.setattr(config, "THREAD_EVENTS_HEARTBEAT", 0.1)
+    monkeypatch.setattr(config, "THREAD_EVENTS_TIMEOUT", 0.5)
+    thread = minimal_testing_setup['threads'][0]
+
+    response = client.get(f'api/conversations/threads/{thread.id}/events')
+    assert response.status_code == 403
+
+    response = client.post('api/admin/login', json={
+        'username': minimal_testing_setup['admin_users'][0].username,
+        'password': TEST_PASSWORD
+    })
+
+    # No events yet: the id to resume from, then only the heartbeats until the timeout
+    response = client.get(f'api/conversations/threads/{thread.id}/events')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+    data = response.get_data(as_text=True)
+    assert data.startswith('id: 0-0\n\n: heartbeat')
+
+    # The events published while the client reconnects are resumed
+    response = client.post(f'/api/admin/send-message/{thread.id}', json={
+        'text': 'First Event'
+    })
+    response = client.get(f'api/conversations/threads/{thread.id}/events',
+                          headers={'Last-Event-ID': data.split('\n')[0].removeprefix('id: ')})
+    assert 'First Event' in response.get_data(as_text=True)
+
+    # The events are resumed after the Last-Event-ID
+    response = client.post(f'/api/admin/send-message/{thread.id}', json={
+        'text': 'Second Event'
+    })
+    response = client.get(f'api/conversations/threads/{thread.id}/events',
+                          headers={'Last-Event-ID': '0-0'})
+    data = response.get_data(as_text=True)
+    assert 'First Event' in data and 'Second Event' in data
+
+    first_event_id = data.split('\n')[2].removeprefix('id: ')
+    response = client.get(f'api/conversations/threads/{thread.id}/events',
+                          headers={'Last-Event-ID': first_event_id})
+    data = response.get_data(as_text=True)
+    assert 'First Event' not in data and 'Second Event' in data
+
+    # The stream ends once the Thread is closed, before the timeout
+    monkeypatch.setattr(config, "THREAD_EVENTS_TIMEOUT", 60)
+    response = client.put(f'api/conversations/threads/{thread.id}', json={
+        'status': Thread.STATUSES.APPROVED.value
+    })
+    events = list(stream_thread_events(thread_id=thread.id, last_event_id=first_event_id))
+    assert len(events) == 3
+    assert events[0] == f'id: {first_event_id}\n\n'
+    assert events[-1].startswith('id: ') and 'event: status' in events[-1]
+
+    response = client.get(f'api/conversations/threads/{thread.id}/events')
+    assert response.status_code == 404
+
+
+def test_thread_key_from_number():
+    key = thread_key_from_number(1, label='PINBAN')
+    assert key.startswith('PINBAN-')
+    label, alphabet_chars, numerical_chars = key.split('-')
+    assert len(alphabet_chars) == 3 and alphabet_chars.isupper()
+    assert len(numerical_chars) == 4 and numerical_chars.isdigit()
+
+    # Every number of a small key space maps to its own key
+    keys = {thread_key_from_number(number, alpha_width=1, num_width=2)
+            for number in range(1, 26 * 100 + 1)}
+    assert len(keys) == 26 * 100
+
+
+def test_create_thread_key_collision(client: FlaskClient, minimal_testing_setup):
+    requester = minimal_testing_setup['requesters'][0]
+
+    # Simulate a lost Redis counter with a legacy key taking the next number
+    redis_client.delete(THREAD_KEY_COUNTER)
+    max_thread_id = db.session.scalar(db.select(db.func.max(Thread.id)))
+    legacy_thread = create_thread(requester=requester, first_message='Legacy')
+    legacy_thread.key = thread_key_from_number(max_thread_id + 2)
+    db.session.commit()
+
+    thread = create_thread(requester=requester, first_message='Test')
+    assert thread.key != legacy_thread.key
+    assert int(redis_client.get(THREAD_KEY_COUNTER)) == max_thread_id + 3
+    assert Thread.query.filter_by(key=thread.key).count() == 1
+
+
+def test_thread_detail_query_budget(client: FlaskClient, minimal_testing_setup):
+    thread_id = minimal_testing_setup['threads'][0].id
+    other_thread_id = minimal_testing_setup['threads'][1].id
+
+    response = client.post('api/admin/login', json={
+        'username': minimal_testing_setup['admin_users'][0].username,
+        'password': TEST_PASSWORD
+    })
+
+    # Budgets include the lookup of the admin identity
+    # Thread, Messages
+    with assert_max_queries(3):
+        response = client.get(f'api/conversations/threads/{thread_id}')
+    assert response.status_code == 200
+    # Served from the cache
+    with assert_max_queries(1):
+        assert client.get(f'api/conversations/threads/{thread_id}').status_code == 200
+    # Ordered by the creation time
+    messages = response.get_json()['messages']
+    assert [m['id'] for m in messages] == sorted(m['id'] for m in messages)
+
+    # Thread, status, Messages archival and deletion, Requester, reload of Thread with Messages
+    with assert_max_queries(9):
+        response = client.put(f'api/conversations/threads/{thread_id}', json={
+            'status': Thread.STATUSES.APPROVED.value
+        })
+    assert response.status_code == 200
+    assert response.get_json()['messages'] == []
+
+    # Thread, status, Messages archival and deletion, Requester
+    with assert_max_queries(7):
+        response = client.delete(f'api/conversations/threads/{other_thread_id}')
+    assert response.status_code == 204
+
+
+def test_get_thread_cache(client: FlaskClient, minimal_testing_setup):
+    thread = minimal_testing_setup['threads'][0]
+
+    response = client.post('api/admin/login', json={
+        'username': minimal_testing_setup['admin_users'][0].username,
+        'password': TEST_PASSWORD
+    })
+
+    response = client.get(f'api/conversations/threads/{thread.id}')
+    messages = response.get_json()['messages']
+    response = client.get(f'api/conversations/threads/{thread.id}')
+    assert response.get_json()['messages'] == messages
+
+    stats = get_thread_cache_stats()
+    assert (stats['requests'], stats['hits'], stats['misses']) == (2, 1, 1)
+
+    response = client.get('api/conversations/threads/cache-stats')
+    assert response.status_code == 200
+    assert response.get_json()['hit_rate'] == 0.5
+
+    # No stale Messages after the writes
+    response = client.post(f'/api/admin/send-message/{thread.id}', json={
+        'text': 'Testing Text'
+    })
+    message_id = response.get_json()['id']
+    response = client.get(f'api/conversations/threads/{thread.id}')
+    assert response.get_json()['messages'][-1]['id'] == message_id
+
+    response = client.delete(f'api/conversations/messages/{message_id}')
+    assert response.status_code == 204
+    response = client.get(f'api/conversations/threads/{thread.id}')
+    assert response.get_json()['messages'] == messages
+
+    # Nor after the Thread is closed
+    response = client.put(f'api/conversations/threads/{thread.id}', json={
+        'status': Thread.STATUSES.APPROVED.value
+    })
+    response = client.get(f'api/conversations/threads/{thread.id}')
+    assert response.status_code == 404
+
+
+@pytest.mark.max_queries(8)
+def test_get_thread_archive(client: FlaskClient, minimal_testing_setup):
+    thread: Thread = minimal_testing_setup['threads'][0]
+    for i in range(10):
+        db.session.add(Message(text=f'Additional details, part {i}.',
+                               requester_id=thread.requester_id, thread_id=thread.id))
+    db.session.commit()
+    message_ids = [message.id for message in Message.query.filter_by(thread_id=thread.id).order_by(Message.id)]
+
+    response = client.get(f'api/conversations/threads/{thread.id}/archive')
+    assert response.status_code == 401
+
+    response = client.post('api/admin/login', json={
+        'username': minimal_testing_setup['admin_users'][0].username,
+        'password': TEST_PASSWORD
+    })
+
+    # Nothing archived yet
+    response = client.get(f'api/conversations/threads/{thread.id}/archive')
+    assert response.status_code == 200
+    assert response.get_json()['messages'] == []
+
+    response = client.put(f'api/conversations/threads/{thread.id}', json={
+        'status': Thread.STATUSES.DENIED.value
+    })
+    assert response.status_code == 200
+    assert Message.query.filter_by(thread_id=thread.id).count() == 0
+
+    archive = ThreadArchive.query.filter_by(thread_id=thread.id).one()
+    assert archive.message_count == len(message_ids)
+    assert len(archive.data) < archive.raw_size / 2
+
+    response = client.get(f'api/conversations/threads/{thread.id}/archive')
+    assert response.status_code == 200
+    assert response.get_json()['status'] == Thread.STATUSES.DENIED
+    assert [message['id'] for message in response.get_json()['messages']] == message_ids
+    assert response.get_json()['messages'][-1]['text'] == 'Additional details, part 9.'
+
+    response = client.get('api/conversations/threads/9999/archive')
+    assert response.status_code == 404
+
+
+def test_claim_next_thread(app: Flask, client: FlaskClient, minimal_testing_setup):
+    first_thread, second_thread = minimal_testing_setup['threads']
+    first_admin, second_admin = minimal_testing_setup['admin_users']
+    now = datetime.now()
+    first_thread.last_activity_on = now - timedelta(hours=2)
+    second_thread.last_activity_on = now - timedelta(hours=1)
+    # The second requester had an appeal before
+    old_thread = create_thread(requester=minimal_testing_setup['requesters'][1], first_message='Unban me.')
+    update_thread_status(thread=old_thread, new_status=Thread.STATUSES.DENIED, processed_by_system=True)
+
+    response = client.post('api/conversations/queue/next')
+    assert response.status_code == 401
+
+    clients = {first_admin.id: client, second_admin.id: app.test_client()}
+    for admin in (first_admin, second_admin):
+        clients[admin.id].post('api/admin/login', json={'username': admin.username, 'password': TEST_PASSWORD})
+        # The app context, and so the loaded user, is shared by the clients
+        g.pop('_login_user', None)
+
+    def request(admin, method, url, **kwargs):
+        g.pop('_login_user', None)
+        return getattr(clients[admin.id], method)(url, **kwargs)
+
+    # The oldest first, never the same thread to two admins
+    response = request(first_admin, 'post', 'api/conversations/queue/next')
+    assert response.status_code == 200
+    assert response.get_json()['id'] == first_thread.id
+    assert response.get_json()['claimed_by_id'] == first_admin.id
+    assert response.get_json()['is_repeat_requester'] is False
+
+    response = request(second_admin, 'post', 'api/conversations/queue/next')
+    assert response.get_json()['id'] == second_thread.id
+    assert response.get_json()['is_repeat_requester'] is True
+
+    response = request(first_admin, 'post', 'api/conversations/queue/next')
+    assert response.status_code == 404
+
+    # The claimed thread can only be decided by its admin
+    response = request(second_admin, 'put', f'api/conversations/threads/{first_thread.id}',
+                       json={'status': Thread.STATUSES.APPROVED.value})
+    assert response.status_code == 409
+    response = request(first_admin, 'put', f'api/conversations/threads/{first_thread.id}',
+                       json={'status': Thread.STATUSES.APPROVED.value})
+    assert response.status_code == 200
+    assert first_thread.claimed_by_id is None
+    response = request(second_admin, 'delete', f'api/conversations/threads/{first_thread.id}')
+    assert response.status_code == 404
+    response = request(first_admin, 'delete', f'api/conversations/threads/{second_thread.id}')
+    assert response.status_code == 409
+
+    # Once the lease expires, anyone can claim the thread
+    second_thread.claimed_until = datetime.now() - timedelta(seconds=1)
+    db.session.commit()
+    last_activity_on = second_thread.last_activity_on
+    response = request(first_admin, 'post', 'api/conversations/queue/next')
+    assert response.get_json()['id'] == second_thread.id
+    assert response.get_json()['claimed_by_id'] == first_admin.id
+    # Claiming doesn't move the thread in the queue
+    db.session.refresh(second_thread)
+    assert second_thread.last_activity_on == last_activity_on
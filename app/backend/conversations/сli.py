@@ -1,18 +1,27 @@
 import datetime
+import os
+import socket
 import click
-from sqlalchemy import func
-from app.backend.conversations.helpers import update_thread_status
-from app.backend.conversations.models import Thread
+from sqlalchemy import func, select
+from app import config
+from app.backend.conversations.cache import invalidate_thread_cache
+from app.backend.conversations.helpers import bulk_update_thread_status, publish_thread_events, status_event
+from app.backend.conversations.models import Message, Thread
+from app.backend.conversations.stats import recount_moderation_stats
 from app.backend.conversations.routes import conversations_bp
 from app.app_factory import db
 from app.backend.admin.models import AdminUser
+from app.backend.utils.jobs import work
 
 conversations_bp.cli.help = 'Perform conversations-related operations.'
 
 
 @conversations_bp.cli.command('deleteoldthreads', help='Deletes old threads.')
 @click.argument('age', required=False)
-def delete_old_threads(age='7'):
+@click.option('--chunk-size', type=int, default=config.OLD_THREADS_CHUNK_SIZE,
+              help='Number of Threads processed and committed at once.')
+@click.option('--dry-run', is_flag=True, help='Only count the Threads and Messages to be deleted.')
+def delete_old_threads(age='7', chunk_size=config.OLD_THREADS_CHUNK_SIZE, dry_run=False):
     current_time = datetime.datetime.now()
     if not age:
         age = 7
@@ -20,16 +29,61 @@ def delete_old_threads(age='7'):
         age = int(age)
     delete_since = current_time - datetime.timedelta(days=age)
 
-    threads = Thread.active().filter(Thread.status == Thread.STATUSES.ACTIVE,
-                                     Thread.last_activity_on < delete_since)
+    if chunk_size < 1:
+        raise click.BadParameter('The chunk size must be positive.', param_hint='--chunk-size')
+
+    threads_query = select(Thread.id).filter(Thread.status == Thread.STATUSES.ACTIVE,
+                                             Thread.last_activity_on < delete_since)
 
     total_deleted = 0
-    for thread in threads:
+    last_id = 0
+    chunk_number = 0
+    while True:
+        thread_ids = db.session.scalars(
+            threads_query.filter(Thread.id > last_id).order_by(Thread.id).limit(chunk_size)
+        ).all()
+        if not thread_ids:
+            break
+        last_id = thread_ids[-1]
+        chunk_number += 1
+
+        if dry_run:
+            message_count = db.session.scalar(
+                select(func.count(Message.id)).filter(Message.thread_id.in_(thread_ids)))
+            total_deleted += len(thread_ids)
+            click.echo(f'Chunk {chunk_number}: {len(thread_ids)} Threads, {message_count} Messages would be deleted.')
+            continue
+
         try:
-            update_thread_status(thread, Thread.STATUSES.UNRESOLVED, processed_by_system=True)
+            thread_ids = bulk_update_thread_status(thread_ids, Thread.STATUSES.UNRESOLVED, processed_by_system=True)
+            db.session.commit()
         except Exception as e:
-            raise click.ClickException(f'An error ocurred when deleting the Thread {thread.id}. Total Threads deleted: {total_deleted}.')
-        total_deleted += 1
+            db.session.rollback()
+            raise click.ClickException(f'An error ocurred when deleting the Threads {thread_ids[0]}-{thread_ids[-1]}. Total Threads deleted: {total_deleted}.')
+        invalidate_thread_cache(thread_ids)
+        publish_thread_events([status_event(thread_id, Thread.STATUSES.UNRESOLVED)
+                               for thread_id in thread_ids])
+        total_deleted += len(thread_ids)
+        click.echo(f'Chunk {chunk_number}: {len(thread_ids)} Threads deleted.')
+
+    if dry_run:
+        click.echo(f'Dry run, nothing was changed. Total Threads to be deleted: {total_deleted}.')
+        return
 
     click.echo(f'The operation was completed successfully. Total Threads deleted: {total_deleted}.')
-    return 
\ No newline at end of file
+    return 
+
+
+@conversations_bp.cli.command('recountstats', help='Recounts the moderation stats from the database.')
+def recount_stats():
+    recount_moderation_stats()
+    click.echo('The moderation stats were recounted.')
+
+
+@conversations_bp.cli.command('worker', help='Runs the jobs of the thread status hooks.')
+@click.option('--burst', is_flag=True, help='Exit once there is no job left to run.')
+def run_worker(burst=False):
+    consumer = f'{socket.gethostname()}-{os.getpid()}'
+    click.echo(f'Worker {consumer} started.')
+    processed = work(consumer=consumer, burst=burst)
+    click.echo(f'Worker {consumer} stopped, {processed} jobs run.')
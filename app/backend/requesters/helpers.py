@@ -1,6 +1,11 @@
 import hashlib
+from typing import Optional, Tuple
+from sqlalchemy import and_, select
+from sqlalchemy.dialects import postgresql, sqlite
+from app.backend.conversations.models import Thread
 from app.backend.requesters.models import Requester
-from app.backend.requesters.schemas import RequesterSchema
+from app.backend.requesters.schemas import RequesterCreate, RequesterSchema
+from app.backend.utils.identity_cache import IdentityCache
 from app.backend.utils.misc import get_ip_address
 from app.app_factory import db
 
@@ -20,3 +25,63 @@ def create_requester(schema: RequesterSchema, testing=False):
     db.session.commit()
     
     return requester
+
+
+def find_requester(*criteria) -> Tuple[Optional[Requester], Optional[int]]:
+    """Load the Requester matching the criteria together with the id of its
+    active Thread (`None` if there is none) in a single query."""
+    row = db.session.execute(
+        select(Requester, Thread.id)
+        .outerjoin(Thread, and_(Thread.requester_id == Requester.id,
+                                Thread.status == Thread.STATUSES.ACTIVE))
+        .filter(*criteria)
+        .order_by(Thread.id)
+        .limit(1)
+    ).first()
+
+    if not row:
+        return None, None
+    return row[0], row[1]
+
+
+def load_requester_identity(id: int) -> Optional[dict]:
+    requester = db.session.get(Requester, id)
+    if not requester:
+        return None
+    return RequesterSchema.model_validate(requester).model_dump()
+
+
+requester_identity_cache = IdentityCache(name='requester', loader=load_requester_identity)
+
+
+def get_active_thread_id(requester_id: int) -> Optional[int]:
+    return db.session.scalar(
+        select(Thread.id)
+        .filter_by(requester_id=requester_id, status=Thread.STATUSES.ACTIVE)
+        .order_by(Thread.id)
+        .limit(1)
+    )
+
+
+def upsert_requester(schema: RequesterCreate) -> Requester:
+    """Create the Requester or, if the normalized username is already taken,
+    update the IP and the fingerprint hashes of the existing one. A single
+    statement, so parallel requests can't create duplicates. Committing is
+    left to the caller."""
+    ip = get_ip_address().encode()
+    data = {
+        'username': schema.username,
+        'username_normalized': Requester.normalize_username(schema.username),
+        'ip_hash': hashlib.sha256(ip).hexdigest(),
+        'fp_hash': schema.fp_hash,
+    }
+
+    dialect_insert = postgresql.insert if db.engine.dialect.name == 'postgresql' else sqlite.insert
+    statement = dialect_insert(Requester).values(**data)
+    statement = statement.on_conflict_do_update(
+        index_elements=[Requester.username_normalized],
+        set_={'ip_hash': statement.excluded.ip_hash,
+              'fp_hash': statement.excluded.fp_hash}
+    ).returning(Requester)
+
+    return db.session.scalars(statement, execution_options={'populate_existing': True}).one()
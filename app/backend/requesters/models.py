@@ -1,4 +1,4 @@
-from sqlalchemy import ForeignKey
+from sqlalchemy import ForeignKey, UniqueConstraint
 from app.app_factory import db
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from typing import TYPE_CHECKING, List
@@ -9,8 +9,16 @@ if TYPE_CHECKING:
 
 
 class Requester(db.Model):
+    __table_args__ = (
+        UniqueConstraint('username_normalized', name='uq_requester_username_normalized'),
+    )
+
     id: Mapped[int] = mapped_column(primary_key=True)
     username: Mapped[str] = mapped_column()
+    # Unique key for the case-insensitive lookups and upserts
+    username_normalized: Mapped[str] = mapped_column(
+        default=lambda context: Requester.normalize_username(
+            context.get_current_parameters()['username']))
     created_on: Mapped[datetime] = mapped_column(default=datetime.now)
     
     ip_hash: Mapped[str] = mapped_column()
@@ -27,6 +35,6 @@ class Requester(db.Model):
     def __repr__(self):
         return f"<User: id={self.id}, username='{self.username}'>"
     
-    @property
-    def has_active_threads(self):
-        return bool(Thread.query.filter_by(requester_id=self.id, status=Thread.STATUSES.ACTIVE).first())
\ No newline at end of file
+    @staticmethod
+    def normalize_username(username: str) -> str:
+        return username.lower()
\ No newline at end of file
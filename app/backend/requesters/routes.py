@@ -1,4 +1,3 @@
-import hashlib
 from uuid import uuid4
 from flask import Blueprint, abort, jsonify, request, session
 from pydantic import ValidationError
@@ -6,12 +5,9 @@ from app.backend.admin.helpers import admin_only
 from app.backend.conversations.helpers import create_thread
 from app.backend.requesters.models import Requester
 from app.backend.requesters.schemas import RequesterCreate, RequesterSchema
-from app.backend.conversations.models import Thread
-from sqlalchemy import func
-from app.app_factory import db
-from app.backend.utils.misc import get_ip_address
+from app.app_factory import db, redis_client
 from app.backend.requesters import helpers
-from app.backend.utils.pagination import paginate
+from app.backend.utils.pagination import paginate_response
 
 requesters_bp = Blueprint(
     name='requesters',
@@ -27,58 +23,56 @@ def authenticate_requester():
     except ValidationError as error:
         return jsonify({"errors": error.errors(include_url=False, include_context=False)}), 400
 
-    requester: Requester = Requester.query.filter(func.lower(
-        Requester.username) == requester_schema.username.lower()).first()
+    username_normalized = Requester.normalize_username(requester_schema.username)
+    requester, active_thread_id = helpers.find_requester(
+        Requester.username_normalized == username_normalized)
 
-    if not requester:
-        requester = helpers.create_requester(schema=requester_schema)
-
-    if requester.has_active_threads:
+    if active_thread_id is not None:
         # If the user has a session or the same fingerprint
         if session.get('requester_id') == requester.id or requester_schema.fp_hash == requester.fp_hash:
             # Log them in
             session['requester_id'] = requester.id
-            thread = Thread.active().filter_by(requester_id=requester.id).first()
             response = {'success': True,
                         'message': 'Active Thread has been found.',
-                        'thread_id': thread.id}
+                        'thread_id': active_thread_id}
 
             return jsonify(response), 200
         else:
             response = {'success': False}
             return jsonify(response), 401
 
-    else:
-        # Log them in and create a new thread, update the FP and IP of the user
-        ip = get_ip_address().encode()
-        requester.ip_hash = hashlib.sha256(ip).hexdigest()
-        requester.fp_hash = requester_schema.fp_hash
-
+    # Log them in and create a new thread, create the user or update their
+    # FP and IP, all in one transaction
+    requester = helpers.upsert_requester(schema=requester_schema)
     new_thread = create_thread(requester=requester,
-                               first_message=requester_schema.first_message)
+                               first_message=requester_schema.first_message,
+                               commit=False)
+    requester_id, thread_id = requester.id, new_thread.id
+    db.session.commit()
+    helpers.requester_identity_cache.invalidate(redis_client, requester_id)
 
-    session['requester_id'] = requester.id
+    session['requester_id'] = requester_id
     response = {'success': True,
                 'message': 'New Thread has been created.',
-                'thread_id': new_thread.id}
+                'thread_id': thread_id}
     return jsonify(response), 200
 
 
 @requesters_bp.route('/get-current-requester', methods=['GET'])
 def get_current_requester():
     requester_id = session.get('requester_id')
+    requester = None
+    if requester_id:
+        requester = helpers.requester_identity_cache.get(redis_client, requester_id)
 
-    if not requester_id:
+    if not requester:
         response = {
             'requester': None
         }
     else:
-        requester: Requester = Requester.query.filter_by(
-            id=requester_id).first()
-        active_thread = Thread.active().filter_by(requester_id=requester_id).first()
         response = {
-            'requester': RequesterSchema.model_validate(requester).model_dump(),
-            'thread_id': active_thread.id
+            'requester': requester,
+            'thread_id': helpers.get_active_thread_id(requester_id)
         }
     return response
 
@@ -86,12 +80,10 @@ def get_current_requester():
 @requesters_bp.route('/users', methods=['GET'])
 @admin_only
 def get_requester_list():
-    pagination = paginate(request_args=request.args,
-                          sqlalchemy_query=Requester.query,
-                          pydantic_model=RequesterSchema,
-                          list_name='user_list')
-
-    return jsonify(pagination)
+    return paginate_response(request_args=request.args,
+                             sqlalchemy_query=Requester.query,
+                             pydantic_model=RequesterSchema,
+                             list_name='user_list')
 
 
 @requesters_bp.route('/users/<int:id>', methods=["GET"])
@@ -1,10 +1,12 @@
+import pytest
 from flask.testing import FlaskClient
 from app.app_factory import db
 from app.backend.conversations.models import Message, Thread
 from app.backend.requesters.models import Requester
-from app.conftest import TEST_PASSWORD
+from app.conftest import TEST_PASSWORD, count_queries
 
 
+@pytest.mark.max_queries(7)
 def test_authenticate(client: FlaskClient):
     username = 'TestUser'
     first_message = 'This is a test message.'
@@ -79,6 +81,41 @@ def test_authenticate(client: FlaskClient):
         assert session.get('requester_id') == requester.id
 
 
+def test_authenticate_query_count(client: FlaskClient):
+    data = {
+        'username': 'TestUser',
+        'first_message': 'This is a test message.',
+        'fp': 'this_is_fingerprint_string'
+    }
+
+    # New Requester: lookup, upsert, counter seed, savepoint, Thread, Message
+    with count_queries() as statements:
+        response = client.post('/api/requesters/authenticate', json=data)
+    assert response.status_code == 200
+    assert len(statements) <= 7
+
+    # Requester with an active Thread: a single joined lookup
+    with count_queries() as statements:
+        response = client.post('/api/requesters/authenticate', json=data)
+    assert response.status_code == 200
+    assert len(statements) == 1
+
+
+def test_authenticate_normalized_username(client: FlaskClient):
+    for username in ['TestUser', 'TESTUSER', 'testuser']:
+        with client.session_transaction() as session:
+            session.clear()
+        response = client.post('/api/requesters/authenticate', json={
+            'username': username,
+            'first_message': 'This is a test message.',
+            'fp': 'this_is_fingerprint_string'
+        })
+        assert response.status_code == 200
+
+    assert Requester.query.count() == 1
+    assert Thread.query.count() == 1
+
+
 def test_get_current_user(client: FlaskClient):
     response = client.get('/api/requesters/get-current-requester')
 
@@ -101,6 +138,7 @@ def test_get_current_user(client: FlaskClient):
     assert response.get_json().get('requester').get('username') == username
 
 
+@pytest.mark.max_queries(2)
 def test_get_requester_list(client: FlaskClient, minimal_testing_setup):
     response = client.get('api/requesters/users')
     assert response.status_code == 401
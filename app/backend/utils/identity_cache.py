@@ -0,0 +1,153 @@
+from collections import OrderedDict
+import json
+from logging import getLogger
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional
+from app import config
+
+
+logger = getLogger(__name__)
+
+INVALIDATION_CHANNEL = 'identity_cache_invalidation'
+
+_caches: Dict[str, 'IdentityCache'] = {}
+_listener_pid = None
+_listener_lock = threading.Lock()
+
+
+class IdentityCache:
+    """Two-tier cache of the identities (admins, requesters) looked up on
+    every request: a per-worker LRU with a short TTL in front of Redis.
+
+    `loader(id)` returns a JSON-serializable dict, or `None` if there is no
+    such identity; `None` is never cached. `invalidate()` drops the entry
+    from Redis and, through pub/sub, from the LRU of every worker."""
+
+    def __init__(self, name: str, loader: Callable[[int], Optional[dict]]):
+        self.name = name
+        self.loader = loader
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'local_hits': 0, 'redis_hits': 0, 'misses': 0}
+        _caches[name] = self
+
+    def key(self, id: int) -> str:
+        return f'identity_cache:{self.name}:{id}'
+
+    def get(self, redis_client, id: int) -> Optional[dict]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(id)
+            if entry and entry[0] > now:
+                self._entries.move_to_end(id)
+                self.stats['local_hits'] += 1
+                return entry[1]
+
+        value = redis_client.get(self.key(id))
+        if value is not None:
+            value = json.loads(value)
+            self.stats['redis_hits'] += 1
+        else:
+            value = self.loader(id)
+            self.stats['misses'] += 1
+            if value is None:
+                return None
+            redis_client.set(self.key(id), json.dumps(value), ex=config.IDENTITY_CACHE_TTL)
+
+        with self._lock:
+            self._entries[id] = (now + config.IDENTITY_CACHE_LOCAL_TTL, value)
+            self._entries.move_to_end(id)
+            while len(self._entries) > config.IDENTITY_CACHE_MAX_SIZE:
+                self._entries.popitem(last=False)
+        return value
+
+    def invalidate(self, redis_client, id: int):
+        """Must be called after the commit of the change."""
+        self.evict(id)
+        pipeline = redis_client.pipeline(transaction=False)
+        pipeline.delete(self.key(id))
+        pipeline.publish(INVALIDATION_CHANNEL, f'{self.name}:{id}')
+        pipeline.execute()
+
+    def evict(self, id: int):
+        with self._lock:
+            self._entries.pop(id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> dict:
+        requests = sum(self.stats.values())
+        hits = self.stats['local_hits'] + self.stats['redis_hits']
+        return {
+            **self.stats,
+            'requests': requests,
+            'hit_rate': hits / requests if requests else None,
+        }
+
+
+def handle_invalidation(message: bytes):
+    name, _, id = message.decode().rpartition(':')
+    cache = _caches.get(name)
+    if cache:
+        cache.evict(int(id))
+
+
+def get_identity_cache_stats() -> dict:
+    return {name: cache.get_stats() for name, cache in _caches.items()}
+
+
+def clear_identity_caches(reset_stats=False):
+    for cache in _caches.values():
+        cache.clear()
+        if reset_stats:
+            cache.stats = dict.fromkeys(cache.stats, 0)
+
+
+def setup_identity_cache(app, redis_client):
+    # A test process runs many apps, the entries are cleared between them
+    if app.testing:
+        return None
+
+    @app.before_request
+    def identity_cache_listener():
+        start_listener(redis_client)
+
+
+def start_listener(redis_client):
+    """Start the invalidation listener of the current worker process, once.
+    gunicorn forks the workers, so the process id is checked rather than a
+    flag alone."""
+    global _listener_pid
+    if _listener_pid == os.getpid():
+        return None
+
+    with _listener_lock:
+        if _listener_pid == os.getpid():
+            return None
+        _listener_pid = os.getpid()
+        # The thread doesn't need the app context, only the Redis connection
+        thread = threading.Thread(target=_listen, args=(redis_client._redis_client,),
+                                  name='identity-cache-listener', daemon=True)
+        thread.start()
+
+
+def _listen(redis_connection):
+    while True:
+        try:
+            pubsub = redis_connection.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(INVALIDATION_CHANNEL)
+            while True:
+                # Not `listen()`, which would fail on the socket timeout
+                message = pubsub.get_message(timeout=1.0)
+                if message:
+                    handle_invalidation(message['data'])
+        except Exception as e:
+            logger.exception(e)
+
+        # Invalidations could have been missed while disconnected
+        clear_identity_caches()
+        time.sleep(1)
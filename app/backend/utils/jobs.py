@@ -0,0 +1,179 @@
+from datetime import datetime
+import json
+from logging import getLogger
+import time
+from typing import Callable, Dict, Optional
+from uuid import uuid4
+from flask import current_app
+from redis.exceptions import ResponseError
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from app.app_factory import db, redis_client
+from app import config
+
+
+logger = getLogger(__name__)
+
+STREAM_KEY = 'jobs:stream'
+GROUP_NAME = 'workers'
+# The payloads of the jobs waiting for a retry, scored by when it is due
+DELAYED_KEY = 'jobs:delayed'
+# The jobs which failed `JOB_MAX_ATTEMPTS` times, newest first
+DEAD_KEY = 'jobs:dead'
+
+# The jobs enqueued in a transaction, pushed once it is committed
+_PENDING = 'jobs'
+
+JOBS: Dict[str, Callable] = {}
+
+
+def job(function: Callable) -> Callable:
+    """Register the function as a job, which `enqueue` can run later."""
+    JOBS[job_name(function)] = function
+    return function
+
+
+def job_name(function: Callable) -> str:
+    return f'{function.__module__}.{function.__name__}'
+
+
+def enqueue(function: Callable, *args):
+    """Run the job with the JSON-serializable arguments once the current
+    transaction is committed: in a worker, or in-process right after the
+    commit in the synchronous mode. Nothing runs if it is rolled back.
+
+    A job runs at least once; if its worker dies, another one runs it
+    again, so the jobs have to be idempotent."""
+    name = job_name(function)
+    if name not in JOBS:
+        raise ValueError(f'{name} is not a job.')
+    db.session().info.setdefault(_PENDING, []).append(
+        {'id': uuid4().hex, 'name': name, 'args': list(args), 'attempt': 0})
+
+
+@event.listens_for(Session, 'after_commit')
+def _push_pending(session: Session):
+    # Only the outermost transaction, not the savepoints
+    if session.in_nested_transaction():
+        return None
+
+    pending = session.info.pop(_PENDING, None)
+    if not pending:
+        return None
+
+    if config.JOB_QUEUE_SYNC:
+        for payload in pending:
+            run_job_sync(payload)
+        return None
+
+    # The transaction is already committed; the jobs are lost with Redis
+    try:
+        pipeline = redis_client.pipeline(transaction=False)
+        for payload in pending:
+            pipeline.xadd(STREAM_KEY, {'job': json.dumps(payload)})
+        pipeline.execute()
+    except Exception as e:
+        logger.exception(e)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_pending(session: Session):
+    if session.in_nested_transaction():
+        return None
+    session.info.pop(_PENDING, None)
+
+
+def run_job(payload: Dict) -> Optional[str]:
+    """Run the job in an app context, and so a database session, of its
+    own; returns the error if it failed."""
+    with current_app.app_context():
+        try:
+            JOBS[payload['name']](*payload['args'])
+            return None
+        except Exception as e:
+            logger.exception(e)
+            db.session.rollback()
+            return repr(e)
+
+
+def run_job_sync(payload: Dict):
+    """The synchronous mode: the retries run at once, without a backoff."""
+    while True:
+        error = run_job(payload)
+        if error is None:
+            return None
+        payload['attempt'] += 1
+        if payload['attempt'] >= config.JOB_MAX_ATTEMPTS:
+            pipeline = redis_client.pipeline(transaction=False)
+            _bury(pipeline, payload, error)
+            pipeline.execute()
+            return None
+
+
+def retry_delay(attempt: int) -> float:
+    """The backoff (in seconds) after the attempt-th failure."""
+    return min(config.JOB_RETRY_BACKOFF * 2 ** (attempt - 1), config.JOB_RETRY_MAX_BACKOFF)
+
+
+def _bury(pipeline, payload: Dict, error: str):
+    pipeline.lpush(DEAD_KEY, json.dumps({**payload, 'error': error, 'failed_on': datetime.now().isoformat()}))
+    pipeline.ltrim(DEAD_KEY, 0, config.JOB_DEAD_LETTERS_MAX_LENGTH - 1)
+
+
+def _finish(message_id: bytes, payload: Dict, error: Optional[str]):
+    pipeline = redis_client.pipeline(transaction=True)
+    if error is not None:
+        payload['attempt'] += 1
+        if payload['attempt'] >= config.JOB_MAX_ATTEMPTS:
+            _bury(pipeline, payload, error)
+        else:
+            pipeline.zadd(DELAYED_KEY, {json.dumps(payload): time.time() + retry_delay(payload['attempt'])})
+    pipeline.xack(STREAM_KEY, GROUP_NAME, message_id)
+    pipeline.xdel(STREAM_KEY, message_id)
+    pipeline.execute()
+
+
+def _requeue_due_jobs():
+    for member in redis_client.zrangebyscore(DELAYED_KEY, '-inf', time.time(),
+                                             start=0, num=config.JOB_BATCH_SIZE):
+        # Only the worker which removed it requeues it
+        if redis_client.zrem(DELAYED_KEY, member):
+            redis_client.xadd(STREAM_KEY, {'job': member})
+
+
+def work(consumer: str, burst=False) -> int:
+    """Run the jobs as the `consumer` worker; returns the number of jobs
+    run. In the `burst` mode, returns once there is no job to run right
+    away instead of waiting for more."""
+    try:
+        redis_client.xgroup_create(STREAM_KEY, GROUP_NAME, id='0', mkstream=True)
+    except ResponseError as e:
+        if 'BUSYGROUP' not in str(e):
+            raise
+
+    processed = 0
+    while True:
+        _requeue_due_jobs()
+
+        # The jobs of the workers which died first
+        messages = redis_client.xautoclaim(STREAM_KEY, GROUP_NAME, consumer,
+                                           min_idle_time=config.JOB_VISIBILITY_TIMEOUT * 1000,
+                                           count=config.JOB_BATCH_SIZE)[1]
+        if not messages:
+            streams = redis_client.xreadgroup(GROUP_NAME, consumer, {STREAM_KEY: '>'},
+                                              count=config.JOB_BATCH_SIZE,
+                                              block=None if burst else config.JOB_POLL_INTERVAL * 1000)
+            messages = streams[0][1] if streams else []
+
+        if not messages:
+            if burst:
+                return processed
+            continue
+
+        for message_id, fields in messages:
+            # Deleted meanwhile
+            if fields is None:
+                continue
+            payload = json.loads(fields[b'job'])
+            _finish(message_id, payload, run_job(payload))
+            processed += 1
@@ -0,0 +1,214 @@
+from collections import defaultdict
+from logging import getLogger
+import threading
+import time
+from typing import Dict
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from app import config
+
+
+logger = getLogger(__name__)
+
+METRICS_KEY = 'metrics'
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# name: (type, help)
+METRICS = {
+    'http_requests_total': ('counter', 'Requests by endpoint, method and status code.'),
+    'http_request_duration_seconds': ('histogram', 'Request latency by endpoint, method and status code.'),
+    'sql_statements_total': ('counter', 'SQL statements executed, by endpoint.'),
+    'sql_duration_seconds_total': ('counter', 'Time spent executing SQL statements, by endpoint.'),
+    'redis_commands_total': ('counter', 'Redis commands sent, by endpoint.'),
+    'rate_limit_rejections_total': ('counter', 'Requests rejected by the rate limiters, by endpoint and limiter.'),
+}
+
+# The samples of the worker not yet added to the Redis hash, which is shared
+# by all the workers
+_buffer = defaultdict(float)
+_buffer_lock = threading.Lock()
+_last_flushed_on = time.monotonic()
+
+
+def setup_metrics(app, redis_client):
+    """Must be set up before the other `before_request` hooks, so that the
+    requests they reject are measured too."""
+    if not config.METRICS_ENABLED:
+        return None
+
+    instrument_redis(redis_client._redis_client)
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+    @app.before_request
+    def start_request_metrics():
+        g.metrics = {
+            'started_on': time.perf_counter(),
+            'sql_statements': 0,
+            'sql_duration': 0.0,
+            'redis_commands': 0,
+        }
+
+    @app.after_request
+    def record_request_metrics(response):
+        metrics = g.pop('metrics', None)
+        if metrics is None:
+            return response
+
+        endpoint = request.endpoint or 'unmatched'
+        labels = {'endpoint': endpoint, 'method': request.method, 'status': response.status_code}
+        increment('http_requests_total', labels)
+        observe('http_request_duration_seconds', time.perf_counter() - metrics['started_on'], labels)
+        increment('sql_statements_total', {'endpoint': endpoint}, metrics['sql_statements'])
+        increment('sql_duration_seconds_total', {'endpoint': endpoint}, metrics['sql_duration'])
+        increment('redis_commands_total', {'endpoint': endpoint}, metrics['redis_commands'])
+
+        flush_metrics(redis_client)
+        return response
+
+
+def sample_name(name: str, labels: Dict[str, object]) -> str:
+    if not labels:
+        return name
+    label_list = ','.join(f'{label}="{_escape(value)}"' for label, value in labels.items())
+    return f'{name}{{{label_list}}}'
+
+
+def _escape(value: object) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def increment(name: str, labels: Dict[str, object], value: float = 1):
+    if not value:
+        return None
+    with _buffer_lock:
+        _buffer[sample_name(name, labels)] += value
+
+
+def observe(name: str, value: float, labels: Dict[str, object]):
+    """Add the value to the histogram; the buckets are cumulative."""
+    with _buffer_lock:
+        for bucket in DURATION_BUCKETS:
+            if value <= bucket:
+                _buffer[sample_name(f'{name}_bucket', {**labels, 'le': bucket})] += 1
+        _buffer[sample_name(f'{name}_bucket', {**labels, 'le': '+Inf'})] += 1
+        _buffer[sample_name(f'{name}_sum', labels)] += value
+        _buffer[sample_name(f'{name}_count', labels)] += 1
+
+
+def record_rate_limit_rejection(limiter: str):
+    increment('rate_limit_rejections_total', {'endpoint': request.endpoint or 'unmatched',
+                                              'limiter': limiter})
+
+
+def flush_metrics(redis_client, force=False):
+    """Add the samples of the worker to the shared hash, at most every
+    `METRICS_FLUSH_INTERVAL` seconds unless forced. A Redis failure is only
+    logged, the samples are lost."""
+    global _last_flushed_on
+    with _buffer_lock:
+        if not force and time.monotonic() - _last_flushed_on < config.METRICS_FLUSH_INTERVAL:
+            return None
+        samples = dict(_buffer)
+        _buffer.clear()
+        _last_flushed_on = time.monotonic()
+
+    if not samples:
+        return None
+
+    try:
+        pipeline = redis_client.pipeline(transaction=False)
+        for name, value in samples.items():
+            pipeline.hincrbyfloat(METRICS_KEY, name, value)
+        pipeline.execute()
+    except Exception as e:
+        logger.exception(e)
+
+
+def start_metrics_flusher(redis_client) -> threading.Event:
+    """Flush the samples every `METRICS_FLUSH_INTERVAL` seconds from a
+    thread of the worker, as the requests only flush them when they end:
+    the samples of an idle worker would wait for its next request. Returns
+    the event which stops it."""
+    stopped = threading.Event()
+    if not config.METRICS_ENABLED:
+        return stopped
+
+    def flush_periodically():
+        while not stopped.wait(config.METRICS_FLUSH_INTERVAL):
+            flush_metrics(redis_client, force=True)
+
+    threading.Thread(target=flush_periodically, name='metrics-flusher', daemon=True).start()
+    return stopped
+
+
+def render_metrics(redis_client) -> str:
+    """The metrics of all the workers in the Prometheus text format. The
+    other workers' samples of the last `METRICS_FLUSH_INTERVAL` seconds may
+    be missing."""
+    flush_metrics(redis_client, force=True)
+    samples = {name.decode(): float(value)
+               for name, value in redis_client.hgetall(METRICS_KEY).items()}
+
+    families = defaultdict(list)
+    for name, value in samples.items():
+        family = name.split('{', 1)[0]
+        if family not in METRICS:
+            family = family.rsplit('_', 1)[0]
+        families[family].append((name, value))
+
+    lines = []
+    for family, (metric_type, help_text) in METRICS.items():
+        lines.append(f'# HELP {family} {help_text}')
+        lines.append(f'# TYPE {family} {metric_type}')
+        for name, value in sorted(families[family], key=_sort_key):
+            lines.append(f'{name} {int(value) if value.is_integer() else value}')
+    return '\n'.join(lines) + '\n'
+
+
+def _sort_key(sample):
+    # The buckets of a histogram in the order of their bounds
+    name, _ = sample
+    if 'le="' not in name:
+        return name, 0
+    name, le = name.rsplit('le="', 1)
+    return name, float(le.split('"', 1)[0].replace('+Inf', 'inf'))
+
+
+def instrument_redis(redis_connection):
+    """Count the commands sent through the connections of the pool."""
+    pool = redis_connection.connection_pool
+    if issubclass(pool.connection_class, CountingConnectionMixin):
+        return None
+    pool.connection_class = type(f'Counting{pool.connection_class.__name__}',
+                                 (CountingConnectionMixin, pool.connection_class), {})
+
+
+class CountingConnectionMixin:
+    def send_command(self, *args, **kwargs):
+        _count_redis_commands(1)
+        return super().send_command(*args, **kwargs)
+
+    def pack_commands(self, commands):
+        # The pipelines
+        commands = list(commands)
+        _count_redis_commands(len(commands))
+        return super().pack_commands(commands)
+
+
+def _count_redis_commands(count: int):
+    if has_request_context() and 'metrics' in g:
+        g.metrics['redis_commands'] += count
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info['metrics_started_on'] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started_on = conn.info.pop('metrics_started_on', None)
+    if started_on is not None and has_request_context() and 'metrics' in g:
+        g.metrics['sql_statements'] += 1
+        g.metrics['sql_duration'] += time.perf_counter() - started_on
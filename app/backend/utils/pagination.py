@@ -1,9 +1,58 @@
-from flask import abort, jsonify
+import base64
+from datetime import datetime
+import json
+from typing import Tuple
+from flask import Response, abort, jsonify
 from pydantic import BaseModel
+from sqlalchemy import tuple_
 from sqlalchemy.orm import Query
+from app.backend.utils.serialization import dump_list_json
 
 
 def paginate(request_args: dict, sqlalchemy_query: Query, pydantic_model: BaseModel, **kwargs):
+    envelope, items = get_page(request_args=request_args,
+                               sqlalchemy_query=sqlalchemy_query,
+                               **kwargs)
+
+    obj_list = [pydantic_model.model_validate(obj).model_dump()
+                for obj in items]
+
+    return {
+        **envelope,
+        kwargs.get('list_name', "item_list"): obj_list,
+    }
+
+
+def paginate_response(request_args: dict, sqlalchemy_query: Query, pydantic_model: BaseModel, **kwargs):
+    """The fast path of `paginate`: only the columns of the schema are
+    selected, and the whole page is validated and serialized to JSON in one
+    pass, without hydrating the ORM objects. Returns the ready response."""
+    model = sqlalchemy_query.column_descriptions[0]['entity']
+    # The keyset columns are needed to build the next cursor
+    column_names = dict.fromkeys([*pydantic_model.model_fields, 'created_on', 'id'])
+
+    envelope, rows = get_page(request_args=request_args,
+                              sqlalchemy_query=sqlalchemy_query,
+                              columns=[getattr(model, name) for name in column_names],
+                              **kwargs)
+
+    body = dump_list_json(pydantic_model=pydantic_model,
+                          rows=rows,
+                          envelope=envelope,
+                          list_name=kwargs.get('list_name', "item_list"))
+    return Response(body, mimetype='application/json')
+
+
+def get_page(request_args: dict, sqlalchemy_query: Query, columns: list = None, **kwargs) -> Tuple[dict, list]:
+    """Return the pagination data and the items of the requested page. If
+    `columns` are given, only they are selected and the items are rows."""
+    # The keyset mode is opt-in, the offset one is kept for old clients
+    if 'after' in request_args:
+        return get_page_by_cursor(request_args=request_args,
+                                  sqlalchemy_query=sqlalchemy_query,
+                                  columns=columns,
+                                  **kwargs)
+
     try:
         page = int(request_args.get('page', 1))
         per_page = int(request_args.get(
@@ -11,19 +60,70 @@ def paginate(request_args: dict, sqlalchemy_query: Query, pydantic_model: BaseMo
     except ValueError:
         abort(400)
 
+    if columns is not None:
+        sqlalchemy_query = sqlalchemy_query.with_entities(*columns)
+
     pagination = sqlalchemy_query.paginate(page=page,
                                            per_page=per_page,
                                            max_per_page=kwargs.get(
                                                'max_per_page', 25),
                                            error_out=False)
 
-    obj_list = [pydantic_model.model_validate(obj).model_dump()
-                for obj in pagination.items]
-
-    return {
+    envelope = {
         "page": pagination.page,
         "per_page": pagination.per_page,
         "total": pagination.total,
         "pages": pagination.pages,
-        kwargs.get('list_name', "item_list"): obj_list,
     }
+    return envelope, pagination.items
+
+
+def get_page_by_cursor(request_args: dict, sqlalchemy_query: Query, columns: list = None, **kwargs) -> Tuple[dict, list]:
+    """Paginate the query using the `(created_on, id)` keyset instead of
+    OFFSET. No count query is made; the response contains an opaque
+    `next_cursor` to be passed as `?after=` to get the next page."""
+    try:
+        limit = int(request_args.get('limit', kwargs.get('per_page', 5)))
+        cursor = request_args.get('after')
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError:
+        abort(400)
+
+    limit = max(1, min(limit, kwargs.get('max_per_page', 25)))
+
+    model = sqlalchemy_query.column_descriptions[0]['entity']
+    query = sqlalchemy_query.order_by(None).order_by(model.created_on, model.id)
+    if after is not None:
+        query = query.filter(tuple_(model.created_on, model.id) > tuple_(*after))
+    if columns is not None:
+        query = query.with_entities(*columns)
+
+    # Fetch one extra row to know whether there is a next page
+    items = query.limit(limit + 1).all()
+    has_next = len(items) > limit
+    items = items[:limit]
+
+    next_cursor = None
+    if has_next:
+        next_cursor = encode_cursor(items[-1].created_on, items[-1].id)
+
+    envelope = {
+        "limit": limit,
+        "next_cursor": next_cursor,
+    }
+    return envelope, items
+
+
+def encode_cursor(created_on: datetime, id: int) -> str:
+    raw = json.dumps([created_on.isoformat(), id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """Raises `ValueError` if the cursor is malformed."""
+    try:
+        padding = '=' * (-len(cursor) % 4)
+        created_on, id = json.loads(base64.urlsafe_b64decode(cursor + padding))
+        return datetime.fromisoformat(created_on), int(id)
+    except (TypeError, json.JSONDecodeError, UnicodeDecodeError) as e:
+        raise ValueError('Malformed cursor.') from e
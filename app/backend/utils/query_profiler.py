@@ -0,0 +1,89 @@
+from collections import Counter
+from logging import getLogger
+import traceback
+from typing import Callable, List, NamedTuple, Optional
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from app import config
+
+
+logger = getLogger(__name__)
+
+# Called with every `RequestProfile` at the end of its request
+profile_handlers: List[Callable[['RequestProfile'], None]] = []
+
+
+class ProfiledStatement(NamedTuple):
+    statement: str
+    # The frames of the app which issued the statement, if recorded
+    stack: Optional[str]
+
+
+class RequestProfile(NamedTuple):
+    method: str
+    path: str
+    endpoint: Optional[str]
+    statements: List[ProfiledStatement]
+
+    def format(self) -> str:
+        lines = [f'{self.method} {self.path} ({self.endpoint}) issued {len(self.statements)} statements:']
+        for i, profiled in enumerate(self.statements, start=1):
+            lines.append(f'{i}. {profiled.statement}')
+            if profiled.stack:
+                lines.append(profiled.stack)
+        return '\n'.join(lines)
+
+
+def setup_query_profiler(app):
+    """Record the SQL statements issued by every request. Always on in the
+    tests, where the `max_queries` marker uses it; elsewhere enabled with
+    `QUERY_PROFILER_ENABLED`, to log the N+1 queries."""
+    if not (config.QUERY_PROFILER_ENABLED or app.testing):
+        return None
+
+    if not event.contains(Engine, 'before_cursor_execute', _record_statement):
+        event.listen(Engine, 'before_cursor_execute', _record_statement)
+
+    @app.before_request
+    def start_query_profile():
+        g.query_profile = []
+
+    @app.after_request
+    def finish_query_profile(response):
+        statements = g.pop('query_profile', None)
+        if statements is None:
+            return response
+
+        profile = RequestProfile(method=request.method,
+                                 path=request.full_path.rstrip('?'),
+                                 endpoint=request.endpoint,
+                                 statements=statements)
+        if config.QUERY_PROFILER_N_PLUS_ONE_THRESHOLD:
+            log_repeated_statements(profile)
+        for handler in profile_handlers:
+            handler(profile)
+        return response
+
+
+def log_repeated_statements(profile: RequestProfile):
+    """Warn about the identical statements issued over and over, which are
+    usually lazy loads in a loop."""
+    counts = Counter(profiled.statement for profiled in profile.statements)
+    for statement, count in counts.items():
+        if count >= config.QUERY_PROFILER_N_PLUS_ONE_THRESHOLD:
+            logger.warning('Possible N+1 in %s %s: %d times %s',
+                           profile.method, profile.path, count, statement)
+
+
+def _record_statement(conn, cursor, statement, parameters, context, executemany):
+    if not has_request_context() or 'query_profile' not in g:
+        return None
+
+    stack = None
+    if config.QUERY_PROFILER_TRACEBACKS:
+        frames = [frame for frame in traceback.extract_stack()[:-1]
+                  if frame.filename.startswith(str(config.BASE_DIR))
+                  and 'site-packages' not in frame.filename]
+        stack = ''.join(traceback.format_list(frames)).rstrip()
+    g.query_profile.append(ProfiledStatement(statement=statement, stack=stack))
@@ -1,21 +1,63 @@
-from flask import abort
+import secrets
+import time
+from typing import List, Tuple
+from flask import abort, request
 from app import config
+from app.backend.utils.metrics import record_rate_limit_rejection
 from app.backend.utils.misc import get_ip_address
 
 
 def setup_rate_limiting(app, redis_client):
     if not config.RATE_LIMIT_ENABLED:
         return None
-    
+
     @app.before_request
     def rate_limit():
         ip = get_ip_address()
-        key = f'request_count:{ip}'
-        
-        request_count = redis_client.incr(key)
+        endpoint_limits = config.RATE_LIMIT_ENDPOINTS.get(request.endpoint, {})
+        cost = endpoint_limits.get('cost', 1)
 
-        if request_count == 1:
-            redis_client.expire(key, config.RATE_LIMIT_COOLDOWN)
+        windows = [(f'rate_limit:{ip}', config.RATE_LIMIT_MAX_REQUESTS,
+                    config.RATE_LIMIT_COOLDOWN, cost)]
+        if 'max_requests' in endpoint_limits:
+            windows.append((f'rate_limit:{request.endpoint}:{ip}',
+                            endpoint_limits['max_requests'],
+                            endpoint_limits.get('cooldown', config.RATE_LIMIT_COOLDOWN),
+                            cost))
 
-        elif request_count > config.RATE_LIMIT_MAX_REQUESTS:
+        if hit_sliding_windows(redis_client, windows):
+            record_rate_limit_rejection('requests')
             abort(429)
+
+
+def hit_sliding_windows(redis_client, windows: List[Tuple[str, int, int, int]]) -> bool:
+    """Register a request in each of the `(key, max_requests, cooldown, cost)`
+    sliding windows and return `True` if any of the limits is exceeded.
+
+    Every window is a sorted set of request timestamps. They are counted
+    under WATCH and only updated, with their expiration, in the MULTI/EXEC
+    transaction if no limit is exceeded: a rejected request is not recorded,
+    so a client retrying while over the limit is released once its accepted
+    requests leave the window."""
+    now = int(time.time() * 1000)
+    token = secrets.token_hex(4)
+
+    def hit(pipeline) -> bool:
+        for key, max_requests, cooldown, cost in windows:
+            if pipeline.zcount(key, now - cooldown * 1000 + 1, '+inf') + cost > max_requests:
+                return True
+
+        pipeline.multi()
+        for key, max_requests, cooldown, cost in windows:
+            pipeline.zremrangebyscore(key, 0, now - cooldown * 1000)
+            pipeline.zadd(key, {f'{now}:{token}:{i}': now for i in range(cost)})
+            pipeline.pexpire(key, cooldown * 1000)
+        return False
+
+    # Retried if another request changed a window meanwhile
+    return redis_client.transaction(hit, *(key for key, *_ in windows), value_from_callable=True)
+
+
+def get_sliding_window_count(redis_client, key: str, cooldown: int) -> int:
+    now = int(time.time() * 1000)
+    return redis_client.zcount(key, now - cooldown * 1000, '+inf')
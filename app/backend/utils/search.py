@@ -0,0 +1,170 @@
+import re
+from typing import List, Tuple
+from sqlalchemy import DDL, column, event, func, literal_column, table, text
+from app.app_factory import db
+from app import config
+
+
+# The indexed objects; the row of an object in the index is
+# `object_id * KIND_COUNT + code`, so that it is found by its primary key
+KINDS = {
+    'message': 1,
+    'note': 2,
+    'requester': 3,
+}
+KIND_COUNT = 4
+SNIPPET_WORDS = 16
+
+search_index = table(
+    'search_index',
+    column('rowid'),
+    column('body'),
+    column('kind'),
+    column('object_id'),
+    column('thread_id'),
+    column('requester_id'),
+)
+
+# The (table, kind, body, thread_id, requester_id) of the indexed objects
+INDEXED_TABLES = (
+    ('message', 'message', 'text', 'thread_id', 'requester_id'),
+    ('admin_note', 'note', 'text', 'NULL', 'requester_id'),
+    ('requester', 'requester', 'username', 'NULL', 'id'),
+)
+
+# The messages archived with their resolved thread stay searchable; the
+# ones deleted while their thread is active (0), even if it was archived
+# before being reopened, are removed from the index
+MESSAGE_DELETE_CONDITION = ('NOT EXISTS (SELECT 1 FROM thread_archive WHERE thread_archive.thread_id = old.thread_id) '
+                            'OR EXISTS (SELECT 1 FROM thread WHERE thread.id = old.thread_id AND thread.status = 0)')
+
+
+def sqlite_ddl() -> List[str]:
+    statements = [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5("
+        "body, kind UNINDEXED, object_id UNINDEXED, thread_id UNINDEXED, requester_id UNINDEXED, "
+        "tokenize='unicode61 remove_diacritics 2')",
+    ]
+    for table_name, kind, body, thread_id, requester_id in INDEXED_TABLES:
+        rowid = f'{{row}}.id * {KIND_COUNT} + {KINDS[kind]}'
+        delete_condition = f'WHEN {MESSAGE_DELETE_CONDITION} ' if kind == 'message' else ''
+        thread_id = f'new.{thread_id}' if thread_id != 'NULL' else 'NULL'
+        statements += [
+            f"CREATE TRIGGER IF NOT EXISTS search_index_{table_name}_insert AFTER INSERT ON {table_name} BEGIN "
+            f"INSERT INTO search_index (rowid, body, kind, object_id, thread_id, requester_id) VALUES "
+            f"({rowid.format(row='new')}, new.{body}, '{kind}', new.id, {thread_id}, new.{requester_id}); END",
+            f"CREATE TRIGGER IF NOT EXISTS search_index_{table_name}_update AFTER UPDATE OF {body} ON {table_name} "
+            f"BEGIN UPDATE search_index SET body = new.{body} WHERE rowid = {rowid.format(row='new')}; END",
+            f"CREATE TRIGGER IF NOT EXISTS search_index_{table_name}_delete AFTER DELETE ON {table_name} "
+            f"{delete_condition}BEGIN DELETE FROM search_index WHERE rowid = {rowid.format(row='old')}; END",
+        ]
+    return statements
+
+
+def postgresql_ddl() -> List[str]:
+    statements = [
+        "CREATE TABLE IF NOT EXISTS search_index ("
+        "rowid BIGINT PRIMARY KEY, body TEXT NOT NULL, kind VARCHAR NOT NULL, object_id INTEGER NOT NULL, "
+        "thread_id INTEGER, requester_id INTEGER, "
+        "document TSVECTOR GENERATED ALWAYS AS (to_tsvector('simple', body)) STORED)",
+        "CREATE INDEX IF NOT EXISTS ix_search_index_document ON search_index USING GIN (document)",
+    ]
+    for table_name, kind, body, thread_id, requester_id in INDEXED_TABLES:
+        rowid = f'{{row}}.id * {KIND_COUNT} + {KINDS[kind]}'
+        delete_condition = MESSAGE_DELETE_CONDITION if kind == 'message' else 'TRUE'
+        thread_id = f'NEW.{thread_id}' if thread_id != 'NULL' else 'NULL'
+        statements += [
+            f"CREATE OR REPLACE FUNCTION search_index_{table_name}() RETURNS TRIGGER AS $$ BEGIN "
+            f"IF TG_OP = 'DELETE' THEN "
+            f"IF {delete_condition} THEN "
+            f"DELETE FROM search_index WHERE rowid = {rowid.format(row='OLD')}; END IF; "
+            f"RETURN OLD; END IF; "
+            f"INSERT INTO search_index (rowid, body, kind, object_id, thread_id, requester_id) VALUES "
+            f"({rowid.format(row='NEW')}, NEW.{body}, '{kind}', NEW.id, {thread_id}, NEW.{requester_id}) "
+            f"ON CONFLICT (rowid) DO UPDATE SET body = EXCLUDED.body; "
+            f"RETURN NEW; END $$ LANGUAGE plpgsql",
+            f"DROP TRIGGER IF EXISTS search_index_{table_name} ON {table_name}",
+            f"CREATE TRIGGER search_index_{table_name} AFTER INSERT OR DELETE OR UPDATE OF {body} "
+            f"ON {table_name} FOR EACH ROW EXECUTE FUNCTION search_index_{table_name}()",
+        ]
+    return statements
+
+
+def backfill_statements() -> List[str]:
+    """Index the already existing objects."""
+    return [
+        f"INSERT INTO search_index (rowid, body, kind, object_id, thread_id, requester_id) "
+        f"SELECT id * {KIND_COUNT} + {KINDS[kind]}, {body}, '{kind}', id, {thread_id}, {requester_id} "
+        f"FROM {table_name}"
+        for table_name, kind, body, thread_id, requester_id in INDEXED_TABLES
+    ]
+
+
+# `create_all` and `drop_all` (the tests) manage the index too; the
+# deployments get it from the migration
+for statement in sqlite_ddl():
+    event.listen(db.metadata, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+for statement in postgresql_ddl():
+    event.listen(db.metadata, 'after_create', DDL(statement).execute_if(dialect='postgresql'))
+event.listen(db.metadata, 'before_drop', DDL('DROP TABLE IF EXISTS search_index'))
+
+
+def parse_search_query(query: str) -> Tuple[List[str], List[str]]:
+    """Split the query the way `websearch_to_tsquery` does, into the
+    "quoted phrases" and the other words, all of which have to match."""
+    phrases = []
+    for phrase in re.findall(r'"([^"]*)"', query):
+        words = re.findall(r'\w+', phrase)
+        if words:
+            phrases.append(' '.join(words))
+    words = re.findall(r'\w+', re.sub(r'"[^"]*"', ' ', query))
+    return phrases, words
+
+
+def build_match_expression(query: str) -> str:
+    """The FTS5 query of the search query; every term is quoted, so none of
+    the FTS5 syntax can be injected. Empty if nothing can be searched."""
+    phrases, words = parse_search_query(query)
+    return ' '.join(f'"{term}"' for term in phrases + words)
+
+
+def search_query(query: str, kind: str = None):
+    """The ranked query of the index entries matching the search query, best
+    match first; `kind` limits it to one kind of objects. Returns None if the
+    query has nothing to search for.
+
+    Ranking costs as much as the number of matches, so only the
+    `SEARCH_RANK_WINDOW` most recent ones are ranked and returned; the
+    common words would otherwise take seconds."""
+    if db.engine.dialect.name == 'postgresql':
+        if not any(parse_search_query(query)):
+            return None
+        ts_query = func.websearch_to_tsquery('simple', query)
+        document = literal_column('search_index.document')
+        match = document.op('@@')(ts_query)
+        rank = func.ts_rank(document, ts_query).desc()
+        snippet = func.ts_headline('simple', search_index.c.body, ts_query,
+                                   f'StartSel="",StopSel="",MaxWords={SNIPPET_WORDS},MinWords=5')
+    else:
+        match_expression = build_match_expression(query)
+        if not match_expression:
+            return None
+        match = text('search_index MATCH :match_expression').bindparams(match_expression=match_expression)
+        rank = literal_column('rank')
+        snippet = func.snippet(literal_column('search_index'), 0, '', '', '…', SNIPPET_WORDS)
+
+    matches = db.session.query(search_index.c.rowid).filter(match)
+    if kind is not None:
+        matches = matches.filter(search_index.c.kind == kind)
+    window_start = matches.order_by(search_index.c.rowid.desc()).offset(config.SEARCH_RANK_WINDOW - 1).limit(1).scalar()
+
+    sqlalchemy_query = matches.with_entities(
+        search_index.c.kind,
+        search_index.c.object_id.label('id'),
+        search_index.c.thread_id,
+        search_index.c.requester_id,
+        snippet.label('snippet'),
+    ).order_by(rank)
+    if window_start is not None:
+        sqlalchemy_query = sqlalchemy_query.filter(search_index.c.rowid >= window_start)
+    return sqlalchemy_query
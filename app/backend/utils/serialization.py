@@ -0,0 +1,23 @@
+from datetime import datetime
+from functools import lru_cache
+from typing import Annotated, Any, Dict, List, Type
+from pydantic import BaseModel, PlainSerializer, TypeAdapter
+from werkzeug.http import http_date
+
+# Serialized to JSON the same way `jsonify` does it, so the responses look
+# the same whether they are built by pydantic or by Flask
+HttpDatetime = Annotated[datetime, PlainSerializer(http_date, return_type=str, when_used='json')]
+
+_envelope_adapter = TypeAdapter(Dict[str, Any])
+
+
+@lru_cache(maxsize=None)
+def get_list_adapter(pydantic_model: Type[BaseModel]) -> TypeAdapter:
+    return TypeAdapter(List[pydantic_model])
+
+
+def dump_list_json(pydantic_model: Type[BaseModel], rows: list, envelope: dict, list_name: str) -> bytes:
+    """Validate all the rows (ORM objects or result rows) at once and
+    serialize them, inside the `envelope` dict, straight to JSON bytes."""
+    obj_list = get_list_adapter(pydantic_model).validate_python(rows, from_attributes=True)
+    return _envelope_adapter.dump_json({**envelope, list_name: obj_list})
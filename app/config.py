@@ -7,16 +7,114 @@ SECRET_KEY = os.getenv('FLASK_SECRET_KEY')
 SQLALCHEMY_DATABASE_URI = os.getenv('SQLALCHEMY_DATABASE_URI')
 REDIS_URL = os.getenv('REDIS_URL')
 
+SQLALCHEMY_ENGINE_OPTIONS = {
+    'pool_recycle': int(os.getenv('SQLALCHEMY_POOL_RECYCLE', 1800)),
+    'pool_pre_ping': os.getenv('SQLALCHEMY_POOL_PRE_PING', 'true').lower() == 'true',
+}
+# Sized for the cooperative workers: every worker serves up to
+# `GUNICORN_WORKER_CONNECTIONS` requests at once (see gunicorn_conf.py).
+# Added to the engine options on the databases other than SQLite, whose
+# in-memory databases have a pool that can't be sized
+SQLALCHEMY_POOL_OPTIONS = {
+    'pool_size': int(os.getenv('SQLALCHEMY_POOL_SIZE', 10)),
+    'max_overflow': int(os.getenv('SQLALCHEMY_MAX_OVERFLOW', 20)),
+    'pool_timeout': int(os.getenv('SQLALCHEMY_POOL_TIMEOUT', 10)),
+}
+# The pub/sub of the Server-Sent Events holds a connection per stream
+REDIS_POOL_OPTIONS = {
+    'max_connections': int(os.getenv('REDIS_MAX_CONNECTIONS', 120)),
+    'timeout': int(os.getenv('REDIS_POOL_TIMEOUT', 5)),
+    'socket_timeout': float(os.getenv('REDIS_SOCKET_TIMEOUT', 5)),
+    'socket_connect_timeout': float(os.getenv('REDIS_SOCKET_CONNECT_TIMEOUT', 2)),
+    'health_check_interval': int(os.getenv('REDIS_HEALTH_CHECK_INTERVAL', 30)),
+}
+
 CSRF_PROTECTION = True
 
 RATE_LIMIT_ENABLED = True
 RATE_LIMIT_COOLDOWN = 900
 RATE_LIMIT_MAX_REQUESTS = 100
+# Per-endpoint settings: `cost` is how many requests one call counts as;
+# `max_requests` (and optionally `cooldown`) add a separate limit for the
+# endpoint, counted in the same cost units
+RATE_LIMIT_ENDPOINTS = {
+    'requesters.authenticate_requester': {'cost': 5},
+}
 
 ADMIN_LOGIN_COOLDOWN = 3600
 ADMIN_LOGIN_MAX_ATTEMPTS = 5
+# The most threads one broadcast message can be sent to
+ADMIN_BROADCAST_MAX_THREADS = 10000
+
+# The cost of the password hashes; the existing ones are rehashed at login
+BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', 12))
+BCRYPT_MAX_THREADS = 2
 
 THREAD_ID_LABEL = 'PINBAN'
+THREAD_KEY_SEED = int(os.getenv('THREAD_KEY_SEED', 0x2545F491))
+THREAD_KEY_MAX_ATTEMPTS = 5
+OLD_THREADS_CHUNK_SIZE = 500
+# The review queue: how long a claim lasts (in seconds), and how many of the
+# next threads are tried at once on SQLite, which has no SKIP LOCKED
+THREAD_CLAIM_LEASE = 600
+THREAD_CLAIM_CANDIDATES = 5
+THREAD_CLAIM_MAX_ATTEMPTS = 3
+# The most threads one bulk status change can decide
+THREAD_BULK_STATUS_MAX_SIZE = 500
+# The messages of the resolved threads are compressed into `ThreadArchive`
+# rows instead of being only deleted
+THREAD_ARCHIVE_ENABLED = os.getenv('THREAD_ARCHIVE_ENABLED', 'true').lower() == 'true'
+THREAD_ARCHIVE_COMPRESSION_LEVEL = 9
+
+# The job queue of the thread status hooks. A failed job is retried after
+# the backoff (in seconds), doubled after every attempt, and moved to the
+# dead letters after the last one. A job its worker didn't finish within
+# the visibility timeout (the worker died) is run by another one. In the
+# synchronous mode (the tests) the jobs run in-process after the commit
+JOB_QUEUE_SYNC = os.getenv('JOB_QUEUE_SYNC', 'false').lower() == 'true'
+JOB_MAX_ATTEMPTS = 5
+JOB_RETRY_BACKOFF = 10
+JOB_RETRY_MAX_BACKOFF = 3600
+JOB_VISIBILITY_TIMEOUT = 300
+JOB_BATCH_SIZE = 10
+JOB_POLL_INTERVAL = 5
+JOB_DEAD_LETTERS_MAX_LENGTH = 10000
+
+# The moderation dashboard: the wait times are those of this many latest
+# decisions. The counters are recounted hourly by the cron job, or by one
+# request (holding the lock for at most this many seconds) once Redis lost them
+MODERATION_STATS_WAIT_SAMPLE = 1000
+MODERATION_STATS_RECOUNT_LOCK_TIMEOUT = 60
+
+# Only the most recent matches of a search are ranked and returned
+SEARCH_RANK_WINDOW = 5000
+
+# Server-Sent Events of the threads (in seconds, except for the length)
+THREAD_EVENTS_HEARTBEAT = 15
+THREAD_EVENTS_TIMEOUT = 300
+THREAD_EVENTS_TTL = 86400
+THREAD_EVENTS_MAX_LENGTH = 100
+
+# Records the statements of every request (always on in the tests); an
+# identical statement repeated this many times is logged as an N+1, 0 disables
+QUERY_PROFILER_ENABLED = os.getenv('QUERY_PROFILER_ENABLED', 'false').lower() == 'true'
+QUERY_PROFILER_N_PLUS_ONE_THRESHOLD = 3
+QUERY_PROFILER_TRACEBACKS = False
+
+METRICS_ENABLED = True
+METRICS_FLUSH_INTERVAL = 1
+# Lets the scraper read the metrics without an admin session
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
+# Cache of the admin and requester identities (in seconds)
+IDENTITY_CACHE_TTL = 3600
+IDENTITY_CACHE_LOCAL_TTL = 30
+IDENTITY_CACHE_MAX_SIZE = 1024
+
+# Cache of the detailed threads (in seconds)
+THREAD_CACHE_TTL = 3600
+THREAD_CACHE_LOCK_TIMEOUT = 5
+THREAD_CACHE_WAIT = 1
 
 LOGGING = {
     'version': 1,
@@ -51,20 +149,21 @@ LOGGING = {
             'level': 'INFO',
             'propagate': False
         },
-    },
-    'loggers': {
         'app.backend.admin.routes': {
             'handlers': {'stdout', 'error_log'},
             'level': 'INFO',
             'propagate': False
         },
-    },
-    'loggers': {
-        'app.backend.messages.routes': {
+        'app.backend.conversations.routes': {
             'handlers': {'stdout', 'error_log'},
             'level': 'INFO',
             'propagate': False
         },
+        'app.backend.utils.query_profiler': {
+            'handlers': {'stdout'},
+            'level': 'WARNING',
+            'propagate': False
+        },
     },
     'root': {
         'handlers': ['error_log'],
@@ -1,4 +1,5 @@
-from typing import Dict
+from contextlib import contextmanager
+from typing import Dict, List
 from flask.testing import FlaskClient
 import pytest
 from app.app_factory import create_app, db, redis_client
@@ -9,12 +10,72 @@ from app.backend.conversations.models import Message, Thread
 from app.backend.requesters.helpers import create_requester
 from app.backend.requesters.models import Requester
 from app.backend.requesters.schemas import RequesterCreate
+from app.backend.utils.identity_cache import clear_identity_caches
+from app.backend.utils import query_profiler
 from app import config
 from click.testing import CliRunner
 
 TEST_FP = 'testing-fingerprint'
 TEST_PASSWORD = 'testing-password'
 
+# The jobs run in-process, right after the commit
+config.JOB_QUEUE_SYNC = True
+
+
+@contextmanager
+def record_query_profiles() -> List[query_profiler.RequestProfile]:
+    """Collect the profiles of the requests made inside the `with` block,
+    with the code which issued each statement."""
+    profiles = []
+    query_profiler.profile_handlers.append(profiles.append)
+    tracebacks, config.QUERY_PROFILER_TRACEBACKS = config.QUERY_PROFILER_TRACEBACKS, True
+    try:
+        yield profiles
+    finally:
+        query_profiler.profile_handlers.remove(profiles.append)
+        config.QUERY_PROFILER_TRACEBACKS = tracebacks
+
+
+@contextmanager
+def count_queries() -> List[str]:
+    """Collect the SQL statements issued by the requests made inside the
+    `with` block; the list is filled when it exits."""
+    statements = []
+    with record_query_profiles() as profiles:
+        yield statements
+    statements.extend(profiled.statement for profile in profiles for profiled in profile.statements)
+
+
+@contextmanager
+def assert_max_queries(budget: int) -> List[query_profiler.RequestProfile]:
+    """Fail if the requests made inside the `with` block issue more than
+    `budget` SQL statements in all."""
+    with record_query_profiles() as profiles:
+        yield profiles
+    count = sum(len(profile.statements) for profile in profiles)
+    assert count <= budget, \
+        f'{count} queries over the budget of {budget}:\n\n' + '\n\n'.join(profile.format() for profile in profiles)
+
+
+@pytest.hookimpl(wrapper=True)
+def pytest_runtest_call(item: pytest.Item):
+    """Fail the tests marked with `max_queries(budget)` if any of their
+    requests issued more statements than the budget, showing the statements
+    with the code which issued them."""
+    marker = item.get_closest_marker('max_queries')
+    if marker is None:
+        return (yield)
+
+    budget = marker.args[0]
+    with record_query_profiles() as profiles:
+        result = yield
+
+    over_budget = [profile for profile in profiles if len(profile.statements) > budget]
+    if over_budget:
+        pytest.fail(f'Over the budget of {budget} queries per request:\n\n'
+                    + '\n\n'.join(profile.format() for profile in over_budget), pytrace=False)
+    return result
+
 
 @pytest.fixture
 def app():
@@ -30,6 +91,7 @@ def app():
         db.session.remove()
         db.drop_all()
         redis_client.flushall()
+        clear_identity_caches(reset_stats=True)
 
 
 @pytest.fixture
@@ -0,0 +1,53 @@
+"""gunicorn settings, driven by the environment.
+
+Usage: python -m gunicorn app.run:app --config app/gunicorn_conf.py
+
+The default worker class is the cooperative gevent one: a worker keeps
+serving other requests while one waits on the database, Redis or bcrypt,
+and the Server-Sent Events streams don't occupy a whole worker each. With
+`GUNICORN_WORKER_CLASS=sync` every worker serves one request at a time.
+
+Every worker serves up to `worker_connections` requests at once, so the
+pools in `config.py` should be sized for it: `SQLALCHEMY_POOL_SIZE` plus
+`SQLALCHEMY_MAX_OVERFLOW` for the requests querying the database at the
+same moment, and `REDIS_MAX_CONNECTIONS` for the open event streams plus
+the other requests.
+"""
+import os
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.getenv('GUNICORN_WORKERS', 3))
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gevent')
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', 100))
+
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+
+# Recycle the workers now and then, in case of leaks
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 10000))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 1000))
+
+
+def post_fork(server, worker):
+    # psycopg2 would block the whole gevent worker on every query
+    if worker_class != 'gevent':
+        return None
+    try:
+        from psycogreen.gevent import patch_psycopg
+    except ImportError:
+        return None
+    patch_psycopg()
+
+
+def post_worker_init(worker):
+    from app.app_factory import redis_client
+    from app.backend.utils.metrics import start_metrics_flusher
+    start_metrics_flusher(redis_client)
+
+
+def worker_exit(server, worker):
+    # The samples not flushed yet, as the workers are recycled
+    from app.app_factory import redis_client
+    from app.backend.utils.metrics import flush_metrics
+    flush_metrics(redis_client, force=True)
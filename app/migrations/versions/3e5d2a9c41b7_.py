@@ -0,0 +1,77 @@
+"""Full-text search index
+
+Revision ID: 3e5d2a9c41b7
+Revises: f6790f081d6a
+Create Date: 2026-10-18 09:12:40.518236
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3e5d2a9c41b7'
+down_revision = 'f6790f081d6a'
+branch_labels = None
+depends_on = None
+
+# The DDL of `app.backend.utils.search` at this revision
+SQLITE_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(body, kind UNINDEXED, object_id UNINDEXED, thread_id UNINDEXED, requester_id UNINDEXED, tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS search_index_message_insert AFTER INSERT ON message BEGIN INSERT INTO search_index (rowid, body, kind, object_id, thread_id, requester_id) VALUES (new.id * 4 + 1, new.text, 'message', new.id, new.thread_id, new.requester_id); END",
+    'CREATE TRIGGER IF NOT EXISTS search_index_message_update AFTER UPDATE OF text ON message BEGIN UPDATE search_index SET body = new.text WHERE rowid = new.id * 4 + 1; END',
+    'CREATE TRIGGER IF NOT EXISTS search_index_message_delete AFTER DELETE ON message WHEN NOT EXISTS (SELECT 1 FROM thread_archive WHERE thread_archive.thread_id = old.thread_id) BEGIN DELETE FROM search_index WHERE rowid = old.id * 4 + 1; END',
+    "CREATE TRIGGER IF NOT EXISTS search_index_admin_note_insert AFTER INSERT ON admin_note BEGIN INSERT INTO search_index (rowid, body, kind, object_id, thread_id, requester_id) VALUES (new.id * 4 + 2, new.text, 'note', new.id, NULL, new.requester_id); END",
+    'CREATE TRIGGER IF NOT EXISTS search_index_admin_note_update AFTER UPDATE OF text ON admin_note BEGIN UPDATE search_index SET body = new.text WHERE rowid = new.id * 4 + 2; END',
+    'CREATE TRIGGER IF NOT EXISTS search_index_admin_note_delete AFTER DELETE ON admin_note BEGIN DELETE FROM search_index WHERE rowid = old.id * 4 + 2; END',
+    "CREATE TRIGGER IF NOT EXISTS search_index_requester_insert AFTER INSERT ON requester BEGIN INSERT INTO search_index (rowid, body, kind, object_id, thread_id, requester_id) VALUES (new.id * 4 + 3, new.username, 'requester', new.id, NULL, new.id); END",
+    'CREATE TRIGGER IF NOT EXISTS search_index_requester_update AFTER UPDATE OF username ON requester BEGIN UPDATE search_index SET body = new.username WHERE rowid = new.id * 4 + 3; END',
+    'CREATE TRIGGER IF NOT EXISTS search_index_requester_delete AFTER DELETE ON requester BEGIN DELETE FROM search_index WHERE rowid = old.id * 4 + 3; END',
+]
+
+POSTGRESQL_DDL = [
+    "CREATE TABLE IF NOT EXISTS search_index (rowid BIGINT PRIMARY KEY, body TEXT NOT NULL, kind VARCHAR NOT NULL, object_id INTEGER NOT NULL, thread_id INTEGER, requester_id INTEGER, document TSVECTOR GENERATED ALWAYS AS (to_tsvector('simple', body)) STORED)",
+    'CREATE INDEX IF NOT EXISTS ix_search_index_document ON search_index USING GIN (document)',
+    "CREATE OR REPLACE FUNCTION search_index_message() RETURNS TRIGGER AS $$ BEGIN IF TG_OP = 'DELETE' THEN IF NOT EXISTS (SELECT 1 FROM thread_archive WHERE thread_archive.thread_id = old.thread_id) THEN DELETE FROM search_index WHERE rowid = OLD.id * 4 + 1; END IF; RETURN OLD; END IF; INSERT INTO search_index (rowid, body, kind, object_id, thread_id, requester_id) VALUES (NEW.id * 4 + 1, NEW.text, 'message', NEW.id, NEW.thread_id, NEW.requester_id) ON CONFLICT (rowid) DO UPDATE SET body = EXCLUDED.body; RETURN NEW; END $$ LANGUAGE plpgsql",
+    'DROP TRIGGER IF EXISTS search_index_message ON message',
+    'CREATE TRIGGER search_index_message AFTER INSERT OR DELETE OR UPDATE OF text ON message FOR EACH ROW EXECUTE FUNCTION search_index_message()',
+    "CREATE OR REPLACE FUNCTION search_index_admin_note() RETURNS TRIGGER AS $$ BEGIN IF TG_OP = 'DELETE' THEN IF TRUE THEN DELETE FROM search_index WHERE rowid = OLD.id * 4 + 2; END IF; RETURN OLD; END IF; INSERT INTO search_index (rowid, body, kind, object_id, thread_id, requester_id) VALUES (NEW.id * 4 + 2, NEW.text, 'note', NEW.id, NULL, NEW.requester_id) ON CONFLICT (rowid) DO UPDATE SET body = EXCLUDED.body; RETURN NEW; END $$ LANGUAGE plpgsql",
+    'DROP TRIGGER IF EXISTS search_index_admin_note ON admin_note',
+    'CREATE TRIGGER search_index_admin_note AFTER INSERT OR DELETE OR UPDATE OF text ON admin_note FOR EACH ROW EXECUTE FUNCTION search_index_admin_note()',
+    "CREATE OR REPLACE FUNCTION search_index_requester() RETURNS TRIGGER AS $$ BEGIN IF TG_OP = 'DELETE' THEN IF TRUE THEN DELETE FROM search_index WHERE rowid = OLD.id * 4 + 3; END IF; RETURN OLD; END IF; INSERT INTO search_index (rowid, body, kind, object_id, thread_id, requester_id) VALUES (NEW.id * 4 + 3, NEW.username, 'requester', NEW.id, NULL, NEW.id) ON CONFLICT (rowid) DO UPDATE SET body = EXCLUDED.body; RETURN NEW; END $$ LANGUAGE plpgsql",
+    'DROP TRIGGER IF EXISTS search_index_requester ON requester',
+    'CREATE TRIGGER search_index_requester AFTER INSERT OR DELETE OR UPDATE OF username ON requester FOR EACH ROW EXECUTE FUNCTION search_index_requester()',
+]
+
+BACKFILL_STATEMENTS = [
+    "INSERT INTO search_index (rowid, body, kind, object_id, thread_id, requester_id) SELECT id * 4 + 1, text, 'message', id, thread_id, requester_id FROM message",
+    "INSERT INTO search_index (rowid, body, kind, object_id, thread_id, requester_id) SELECT id * 4 + 2, text, 'note', id, NULL, requester_id FROM admin_note",
+    "INSERT INTO search_index (rowid, body, kind, object_id, thread_id, requester_id) SELECT id * 4 + 3, username, 'requester', id, NULL, id FROM requester",
+]
+
+INDEXED_TABLES = ('message', 'admin_note', 'requester')
+
+
+def upgrade():
+    # The index is an FTS5 table on SQLite and a table with a GIN-indexed
+    # tsvector on Postgres, kept in sync by triggers
+    if op.get_bind().dialect.name == 'postgresql':
+        statements = POSTGRESQL_DDL
+    else:
+        statements = SQLITE_DDL
+
+    for statement in statements + BACKFILL_STATEMENTS:
+        op.execute(statement)
+
+
+def downgrade():
+    postgresql = op.get_bind().dialect.name == 'postgresql'
+    for table_name in INDEXED_TABLES:
+        if postgresql:
+            op.execute(f'DROP TRIGGER IF EXISTS search_index_{table_name} ON {table_name}')
+            op.execute(f'DROP FUNCTION IF EXISTS search_index_{table_name}()')
+        else:
+            for operation in ('insert', 'update', 'delete'):
+                op.execute(f'DROP TRIGGER IF EXISTS search_index_{table_name}_{operation}')
+
+    op.execute('DROP TABLE IF EXISTS search_index')
@@ -0,0 +1,51 @@
+"""Message ids never reused on SQLite
+
+Revision ID: c2a8e5f1b9d4
+Revises: 5e8decbb2b5e
+Create Date: 2026-10-18 10:02:37.815904
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c2a8e5f1b9d4'
+down_revision = '5e8decbb2b5e'
+branch_labels = None
+depends_on = None
+
+# Dropped with the rebuilt table
+MESSAGE_TRIGGERS = [
+    "CREATE TRIGGER IF NOT EXISTS search_index_message_insert AFTER INSERT ON message BEGIN INSERT INTO search_index (rowid, body, kind, object_id, thread_id, requester_id) VALUES (new.id * 4 + 1, new.text, 'message', new.id, new.thread_id, new.requester_id); END",
+    'CREATE TRIGGER IF NOT EXISTS search_index_message_update AFTER UPDATE OF text ON message BEGIN UPDATE search_index SET body = new.text WHERE rowid = new.id * 4 + 1; END',
+    'CREATE TRIGGER IF NOT EXISTS search_index_message_delete AFTER DELETE ON message WHEN NOT EXISTS (SELECT 1 FROM thread_archive WHERE thread_archive.thread_id = old.thread_id) BEGIN DELETE FROM search_index WHERE rowid = old.id * 4 + 1; END',
+]
+
+
+def rebuild_message_table(autoincrement: bool):
+    with op.batch_alter_table('message', recreate='always',
+                              table_kwargs={'sqlite_autoincrement': autoincrement}) as batch_op:
+        pass
+
+    for statement in MESSAGE_TRIGGERS:
+        op.execute(statement)
+
+
+def upgrade():
+    # The Postgres sequences never reuse the ids
+    if op.get_bind().dialect.name != 'sqlite':
+        return None
+
+    rebuild_message_table(autoincrement=True)
+    # Nor the ids of the archived messages, which were already deleted
+    op.execute("DELETE FROM sqlite_sequence WHERE name = 'message'")
+    op.execute("INSERT INTO sqlite_sequence (name, seq) SELECT 'message', MAX(COALESCE(MAX(object_id), 0), "
+               "(SELECT COALESCE(MAX(id), 0) FROM message)) FROM search_index WHERE kind = 'message'")
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return None
+
+    rebuild_message_table(autoincrement=False)
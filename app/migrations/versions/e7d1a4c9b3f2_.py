@@ -0,0 +1,40 @@
+"""Messages deleted from a reopened thread removed from the search index
+
+Revision ID: e7d1a4c9b3f2
+Revises: c2a8e5f1b9d4
+Create Date: 2026-10-18 11:24:05.301472
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7d1a4c9b3f2'
+down_revision = 'c2a8e5f1b9d4'
+branch_labels = None
+depends_on = None
+
+SQLITE_TRIGGER = 'CREATE TRIGGER IF NOT EXISTS search_index_message_delete AFTER DELETE ON message WHEN NOT EXISTS (SELECT 1 FROM thread_archive WHERE thread_archive.thread_id = old.thread_id) OR EXISTS (SELECT 1 FROM thread WHERE thread.id = old.thread_id AND thread.status = 0) BEGIN DELETE FROM search_index WHERE rowid = old.id * 4 + 1; END'
+POSTGRESQL_FUNCTION = "CREATE OR REPLACE FUNCTION search_index_message() RETURNS TRIGGER AS $$ BEGIN IF TG_OP = 'DELETE' THEN IF NOT EXISTS (SELECT 1 FROM thread_archive WHERE thread_archive.thread_id = old.thread_id) OR EXISTS (SELECT 1 FROM thread WHERE thread.id = old.thread_id AND thread.status = 0) THEN DELETE FROM search_index WHERE rowid = OLD.id * 4 + 1; END IF; RETURN OLD; END IF; INSERT INTO search_index (rowid, body, kind, object_id, thread_id, requester_id) VALUES (NEW.id * 4 + 1, NEW.text, 'message', NEW.id, NEW.thread_id, NEW.requester_id) ON CONFLICT (rowid) DO UPDATE SET body = EXCLUDED.body; RETURN NEW; END $$ LANGUAGE plpgsql"
+
+# The ones of the previous revision
+OLD_SQLITE_TRIGGER = 'CREATE TRIGGER IF NOT EXISTS search_index_message_delete AFTER DELETE ON message WHEN NOT EXISTS (SELECT 1 FROM thread_archive WHERE thread_archive.thread_id = old.thread_id) BEGIN DELETE FROM search_index WHERE rowid = old.id * 4 + 1; END'
+OLD_POSTGRESQL_FUNCTION = "CREATE OR REPLACE FUNCTION search_index_message() RETURNS TRIGGER AS $$ BEGIN IF TG_OP = 'DELETE' THEN IF NOT EXISTS (SELECT 1 FROM thread_archive WHERE thread_archive.thread_id = old.thread_id) THEN DELETE FROM search_index WHERE rowid = OLD.id * 4 + 1; END IF; RETURN OLD; END IF; INSERT INTO search_index (rowid, body, kind, object_id, thread_id, requester_id) VALUES (NEW.id * 4 + 1, NEW.text, 'message', NEW.id, NEW.thread_id, NEW.requester_id) ON CONFLICT (rowid) DO UPDATE SET body = EXCLUDED.body; RETURN NEW; END $$ LANGUAGE plpgsql"
+
+
+def replace_delete_trigger(sqlite_trigger: str, postgresql_function: str):
+    # The trigger of Postgres calls the function, which is replaced in place
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute(postgresql_function)
+    else:
+        op.execute('DROP TRIGGER IF EXISTS search_index_message_delete')
+        op.execute(sqlite_trigger)
+
+
+def upgrade():
+    replace_delete_trigger(SQLITE_TRIGGER, POSTGRESQL_FUNCTION)
+
+
+def downgrade():
+    replace_delete_trigger(OLD_SQLITE_TRIGGER, OLD_POSTGRESQL_FUNCTION)
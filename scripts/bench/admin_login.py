@@ -0,0 +1,59 @@
+"""Show how available a gevent worker stays while the admin logins run
+concurrently, with bcrypt run inline (as before) and in the bounded pool.
+
+A probe greenlet wakes up every 10 ms, like a cheap request would; its
+lateness is the time the worker was unable to serve anything else.
+
+Usage: python -m scripts.bench.admin_login [logins] [rounds]
+"""
+from gevent import monkey
+monkey.patch_all()
+
+import sys
+import time
+import bcrypt
+import gevent
+from app import config
+from app.backend.admin.helpers import check_password_hash
+
+PASSWORD = 'benchmark-password'
+PROBE_INTERVAL = 0.01
+
+
+def inline_check(password, password_hash):
+    return bcrypt.checkpw(password.encode(), password_hash.encode())
+
+
+def probe(lateness, until):
+    while time.perf_counter() < until[0]:
+        started = time.perf_counter()
+        gevent.sleep(PROBE_INTERVAL)
+        lateness.append(time.perf_counter() - started - PROBE_INTERVAL)
+
+
+def run(name, check, logins, password_hash):
+    lateness = []
+    until = [float('inf')]
+    prober = gevent.spawn(probe, lateness, until)
+    gevent.sleep(0)
+
+    started = time.perf_counter()
+    gevent.joinall([gevent.spawn(check, PASSWORD, password_hash) for _ in range(logins)])
+    elapsed = time.perf_counter() - started
+    until[0] = 0
+    prober.join()
+
+    print(f'{name:<8} {elapsed:>7.2f} s for the logins'
+          f' {max(lateness) * 1000:>9.1f} ms max probe delay'
+          f' {sum(lateness) / len(lateness) * 1000:>8.1f} ms mean probe delay')
+
+
+if __name__ == '__main__':
+    logins = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    config.BCRYPT_ROUNDS = int(sys.argv[2]) if len(sys.argv) > 2 else config.BCRYPT_ROUNDS
+    password_hash = bcrypt.hashpw(PASSWORD.encode(), bcrypt.gensalt(config.BCRYPT_ROUNDS)).decode()
+
+    print(f'{logins} concurrent logins, cost {config.BCRYPT_ROUNDS},'
+          f' {config.BCRYPT_MAX_THREADS} bcrypt threads')
+    run('inline', inline_check, logins, password_hash)
+    run('pool', check_password_hash, logins, password_hash)
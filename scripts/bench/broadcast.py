@@ -0,0 +1,102 @@
+"""Sending the same admin reply to many active threads: one
+`POST /api/admin/send-message/<id>` per thread against a single
+`POST /api/admin/broadcast`, by thread ids and by date filter. The
+messages are indexed by the search triggers as they are inserted.
+
+The database is SQLite and Redis is FakeRedis, whose emulation of the
+cache invalidation and event pipelines costs far more than a real Redis
+would; the last row times the database part of the broadcast alone.
+
+Usage: python -m scripts.bench.broadcast [--threads 10000] [--single-requests 1000]
+"""
+import argparse
+from datetime import datetime, timedelta
+import os
+import tempfile
+import time
+from pathlib import Path
+
+ADMIN_PASSWORD = 'bench-password'
+TEXT = 'We are aware of the ban wave and are reviewing all the appeals.'
+
+
+def build_app(database_uri):
+    from app import config
+    from app.app_factory import create_app, db
+    from app.backend.admin.helpers import generate_password_hash
+    from app.backend.admin.models import AdminUser
+
+    config.RATE_LIMIT_ENABLED = False
+    app = create_app(overrides={'TESTING': True, 'SQLALCHEMY_DATABASE_URI': database_uri})
+    with app.app_context():
+        db.create_all()
+        db.session.add(AdminUser(username='BenchAdmin', password=generate_password_hash(ADMIN_PASSWORD),
+                                 email='bench@email.com'))
+        db.session.commit()
+    return app
+
+
+def seed(app, threads):
+    from sqlalchemy import insert
+    from app.app_factory import db
+    from app.backend.conversations.models import Thread
+    from app.backend.requesters.models import Requester
+
+    now = datetime.now()
+    with app.app_context():
+        db.session.execute(insert(Requester), [
+            {'id': i + 1, 'username': f'Requester{i}', 'username_normalized': f'requester{i}',
+             'ip_hash': 'ip', 'fp_hash': 'fp', 'created_on': now} for i in range(threads)])
+        db.session.execute(insert(Thread), [
+            {'id': i + 1, 'key': f'BROADCAST-{i}', 'created_on': now, 'last_activity_on': now, 'requester_id': i + 1}
+            for i in range(threads)])
+        db.session.commit()
+    return list(range(1, threads + 1)), now - timedelta(seconds=1)
+
+
+def report(mode, replies, elapsed):
+    print(f'{mode:<28} {replies:>8} {elapsed:>9.2f} {replies / elapsed:>10.1f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Throughput of the broadcast admin replies.')
+    parser.add_argument('--threads', type=int, default=10000)
+    parser.add_argument('--single-requests', type=int, default=1000,
+                        help='threads replied to one request at a time')
+    args = parser.parse_args()
+
+    os.environ.setdefault('FLASK_SECRET_KEY', 'bench')
+    os.environ.setdefault('REDIS_URL', 'redis://localhost:6379')
+
+    with tempfile.TemporaryDirectory() as directory:
+        app = build_app(f'sqlite:///{Path(directory) / "bench_broadcast.db"}')
+        thread_ids, created_after = seed(app, args.threads)
+
+        client = app.test_client()
+        response = client.post('/api/admin/login', json={'username': 'BenchAdmin', 'password': ADMIN_PASSWORD})
+        assert response.status_code == 200, response.get_data(as_text=True)
+
+        print(f'{"mode":<28} {"replies":>8} {"seconds":>9} {"replies/s":>10}')
+        started = time.perf_counter()
+        for thread_id in thread_ids[:args.single_requests]:
+            response = client.post(f'/api/admin/send-message/{thread_id}', json={'text': TEXT})
+            assert response.status_code == 200, response.get_data(as_text=True)
+        report('send-message per thread', args.single_requests, time.perf_counter() - started)
+
+        for mode, body in (('broadcast, thread ids', {'thread_ids': thread_ids}),
+                           ('broadcast, created_after', {'created_after': created_after.isoformat()})):
+            started = time.perf_counter()
+            response = client.post('/api/admin/broadcast', json={'text': TEXT, **body})
+            elapsed = time.perf_counter() - started
+            assert response.status_code == 200, response.get_data(as_text=True)
+            report(mode, response.get_json()['sent'], elapsed)
+
+        from app.app_factory import db
+        from app.backend.conversations.helpers import broadcast_admin_message
+        from app.backend.conversations.models import Thread
+
+        with app.app_context():
+            started = time.perf_counter()
+            messages = broadcast_admin_message(TEXT, 1, Thread.id.in_(thread_ids))
+            db.session.commit()
+            report('INSERT ... SELECT only', len(messages), time.perf_counter() - started)
@@ -0,0 +1,98 @@
+"""Throughput of deciding a backlog of active threads, each with a few
+messages: one `PUT /api/conversations/threads/<id>` per thread against
+`POST /api/conversations/threads/bulk-status` with batches of up to
+`THREAD_BULK_STATUS_MAX_SIZE` ids.
+
+The database is SQLite and Redis is FakeRedis.
+
+Usage: python -m scripts.bench.bulk_status [--threads 2000] [--messages 5] [--batch-sizes 50 500]
+"""
+import argparse
+from datetime import datetime
+import os
+import tempfile
+import time
+from pathlib import Path
+
+ADMIN_PASSWORD = 'bench-password'
+
+
+def build_app(database_uri):
+    from app import config
+    from app.app_factory import create_app, db
+    from app.backend.admin.helpers import generate_password_hash
+    from app.backend.admin.models import AdminUser
+
+    config.RATE_LIMIT_ENABLED = False
+    app = create_app(overrides={'TESTING': True, 'SQLALCHEMY_DATABASE_URI': database_uri})
+    with app.app_context():
+        db.create_all()
+        db.session.add(AdminUser(username='BenchAdmin', password=generate_password_hash(ADMIN_PASSWORD),
+                                 email='bench@email.com'))
+        db.session.commit()
+    return app
+
+
+def seed(app, threads, messages):
+    from sqlalchemy import delete, insert
+    from app.app_factory import db
+    from app.backend.conversations.models import Message, Thread, ThreadArchive
+    from app.backend.requesters.models import Requester
+
+    now = datetime.now()
+    with app.app_context():
+        for model in (ThreadArchive, Message, Thread, Requester):
+            db.session.execute(delete(model))
+        db.session.execute(insert(Requester), [
+            {'id': i + 1, 'username': f'Requester{i}', 'username_normalized': f'requester{i}',
+             'ip_hash': 'ip', 'fp_hash': 'fp', 'created_on': now} for i in range(threads)])
+        db.session.execute(insert(Thread), [
+            {'id': i + 1, 'key': f'BULK-{i}', 'created_on': now, 'last_activity_on': now, 'requester_id': i + 1}
+            for i in range(threads)])
+        db.session.execute(insert(Message), [
+            {'text': f'Please unban me, message {j}.', 'created_on': now, 'thread_id': i + 1,
+             'requester_id': i + 1} for i in range(threads) for j in range(messages)])
+        db.session.commit()
+    return list(range(1, threads + 1))
+
+
+def run(app, thread_ids, batch_size):
+    from app.backend.conversations.models import Thread
+
+    client = app.test_client()
+    response = client.post('/api/admin/login', json={'username': 'BenchAdmin', 'password': ADMIN_PASSWORD})
+    assert response.status_code == 200, response.get_data(as_text=True)
+    status = Thread.STATUSES.APPROVED.value
+
+    started = time.perf_counter()
+    if batch_size is None:
+        for thread_id in thread_ids:
+            response = client.put(f'/api/conversations/threads/{thread_id}', json={'status': status})
+            assert response.status_code == 200, response.get_data(as_text=True)
+    else:
+        for start in range(0, len(thread_ids), batch_size):
+            response = client.post('/api/conversations/threads/bulk-status',
+                                   json={'ids': thread_ids[start:start + batch_size], 'status': status})
+            assert response.status_code == 200, response.get_data(as_text=True)
+    elapsed = time.perf_counter() - started
+
+    mode = 'PUT per thread' if batch_size is None else f'bulk, {batch_size} per request'
+    print(f'{mode:<24} {elapsed:>9.2f} {len(thread_ids) / elapsed:>10.1f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Throughput of the bulk status changes.')
+    parser.add_argument('--threads', type=int, default=2000)
+    parser.add_argument('--messages', type=int, default=5, help='messages per thread')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[50, 500])
+    args = parser.parse_args()
+
+    os.environ.setdefault('FLASK_SECRET_KEY', 'bench')
+    os.environ.setdefault('REDIS_URL', 'redis://localhost:6379')
+
+    with tempfile.TemporaryDirectory() as directory:
+        app = build_app(f'sqlite:///{Path(directory) / "bench_bulk_status.db"}')
+        print(f'{args.threads} threads, {args.messages} messages each')
+        print(f'{"mode":<24} {"seconds":>9} {"threads/s":>10}')
+        for batch_size in [None, *args.batch_sizes]:
+            run(app, seed(app, args.threads, args.messages), batch_size)
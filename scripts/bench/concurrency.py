@@ -0,0 +1,114 @@
+"""Load test of the worker classes: the app is run under gunicorn with
+`app/gunicorn_conf.py`, once with the sync workers and once with the gevent
+ones, and hit by a growing number of concurrent clients.
+
+The database is SQLite (or `BENCH_DATABASE_URI`, e.g. a local Postgres) and
+Redis is FakeRedis; both get an artificial latency per round trip, standing
+in for the network, so that the waiting, not the CPU, dominates a request,
+as it does in production.
+
+Usage: python -m scripts.bench.concurrency [requests] [workers]
+"""
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.request import urlopen
+
+DB_LATENCY = 0.02
+REDIS_LATENCY = 0.005
+CONCURRENCY = [1, 4, 16, 64]
+BIND = '127.0.0.1:5099'
+DATABASE_URI = os.getenv('BENCH_DATABASE_URI', 'sqlite:////tmp/bench_concurrency.db')
+
+
+def create_bench_app():
+    """The app factory run by the gunicorn workers."""
+    from fakeredis._connection import FakeConnection
+    from flask import current_app
+    from sqlalchemy import event, text
+    from app import config
+    from app.app_factory import create_app, db, redis_client
+
+    config.RATE_LIMIT_ENABLED = False
+    app = create_app(overrides={'TESTING': True, 'SQLALCHEMY_DATABASE_URI': DATABASE_URI})
+
+    send_packed_command = FakeConnection.send_packed_command
+
+    def slow_send_packed_command(self, *args, **kwargs):
+        time.sleep(REDIS_LATENCY)
+        return send_packed_command(self, *args, **kwargs)
+
+    FakeConnection.send_packed_command = slow_send_packed_command
+
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', lambda *args: time.sleep(DB_LATENCY))
+
+    @app.route('/bench')
+    def bench():
+        # A typical request: the identity, a query and a cache read
+        redis_client.get('identity')
+        db.session.execute(text('SELECT 1'))
+        redis_client.get('cache')
+        return current_app.response_class('ok')
+
+    return app
+
+
+def load(requests, concurrency):
+    def get(_):
+        started = time.perf_counter()
+        with urlopen(f'http://{BIND}/bench') as response:
+            response.read()
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = sorted(executor.map(get, range(requests)))
+    elapsed = time.perf_counter() - started
+
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f'{concurrency:>5} clients {requests / elapsed:>9.1f} requests/s'
+          f' {p95 * 1000:>9.1f} ms p95')
+
+
+def wait_until_up(timeout=15):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urlopen(f'http://{BIND}/bench'):
+                return None
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('gunicorn did not start.')
+
+
+def run(worker_class, requests, workers):
+    env = {
+        **os.environ,
+        'GUNICORN_WORKER_CLASS': worker_class,
+        'GUNICORN_WORKERS': str(workers),
+        'GUNICORN_BIND': BIND,
+        'FLASK_SECRET_KEY': os.getenv('FLASK_SECRET_KEY', 'bench'),
+        # Replaced with FakeRedis, but has to be set
+        'REDIS_URL': os.getenv('REDIS_URL', 'redis://localhost:6379'),
+    }
+    server = subprocess.Popen([sys.executable, '-m', 'gunicorn', 'scripts.bench.concurrency:create_bench_app()',
+                               '--config', 'app/gunicorn_conf.py', '--log-level', 'warning'], env=env)
+    try:
+        wait_until_up()
+        print(f'{worker_class} workers')
+        for concurrency in CONCURRENCY:
+            load(requests, concurrency)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == '__main__':
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 400
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    print(f'{requests} requests per step, {workers} workers, {DATABASE_URI}')
+    run('sync', requests, workers)
+    run('gevent', requests, workers)
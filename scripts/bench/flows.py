@@ -0,0 +1,220 @@
+"""End-to-end load test of the appeal and moderation flows, run against an
+app built by `create_app` with a local SQLite database and FakeRedis (or
+the local Redis of `REDIS_URL` with `--redis`, its db is flushed).
+
+Requesters authenticate, poll their thread and post messages; admins log
+in, list the threads, reply to the appeals and approve or deny them. The
+throughput and the p50/p95/p99 latencies are reported per endpoint; the
+throughput and the medians are compared with the stored baseline, and a
+regression over the tolerance, or any unexpected status, fails the run.
+
+Usage: python -m scripts.bench.flows [--requesters 8] [--admins 2] [--appeals 200]
+                                     [--redis] [--save-baseline] [--tolerance 0.5]
+"""
+import argparse
+import json
+import math
+import os
+import queue
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+
+BASELINE_PATH = Path(__file__).parent / 'baselines' / 'flows.json'
+ADMIN_PASSWORD = 'bench-password'
+POLLS = 5
+MESSAGES = 2
+# Below this the latencies are noise
+MIN_REGRESSION_MS = 2
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.lock = threading.Lock()
+
+    def timed(self, name, call, expected=(200,)):
+        started = time.perf_counter()
+        response = call()
+        elapsed = time.perf_counter() - started
+        with self.lock:
+            self.latencies[name].append(elapsed)
+            if response.status_code not in expected:
+                self.errors[name] += 1
+        return response
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[max(math.ceil(p / 100 * len(values)) - 1, 0)]
+
+
+def build_app(use_redis, database_path, admins):
+    from redis import Redis
+    from app import config
+    from app.app_factory import create_app, db, redis_client
+    from app.backend.admin.helpers import generate_password_hash
+    from app.backend.admin.models import AdminUser
+
+    # Every virtual user comes from the same IP address
+    config.RATE_LIMIT_ENABLED = False
+    app = create_app(overrides={'TESTING': True, 'SQLALCHEMY_DATABASE_URI': f'sqlite:///{database_path}'})
+    if use_redis:
+        redis_client._redis_client = Redis.from_url(config.REDIS_URL)
+    redis_client.flushdb()
+
+    with app.app_context():
+        db.create_all()
+        password_hash = generate_password_hash(ADMIN_PASSWORD)
+        for i in range(admins):
+            db.session.add(AdminUser(username=f'BenchAdmin{i}', password=password_hash,
+                                     email=f'bench{i}@email.com'))
+        db.session.commit()
+    return app
+
+
+def requester_flow(app, recorder, appeals, pending):
+    for i in appeals:
+        # A new client per appeal, as each one is a different person
+        client = app.test_client()
+        response = recorder.timed('authenticate', lambda: client.post('/api/requesters/authenticate', json={
+            'username': f'Requester{i}',
+            'fp': f'fingerprint-{i}',
+            'first_message': 'Please review my ban.',
+        }))
+        thread_id = response.get_json()['thread_id']
+
+        for _ in range(POLLS):
+            recorder.timed('get_thread', lambda: client.get(f'/api/conversations/threads/{thread_id}'))
+        for j in range(MESSAGES):
+            recorder.timed('send_message', lambda: client.post(f'/api/conversations/threads/{thread_id}',
+                                                                json={'text': f'Additional details {j}.'}))
+        pending.put(thread_id)
+
+
+def admin_flow(app, recorder, number, pending, requesters_done):
+    from app.backend.conversations.models import Thread
+
+    client = app.test_client()
+    recorder.timed('admin_login', lambda: client.post('/api/admin/login', json={
+        'username': f'BenchAdmin{number}',
+        'password': ADMIN_PASSWORD,
+    }))
+
+    decisions = [Thread.STATUSES.APPROVED, Thread.STATUSES.DENIED]
+    while not (requesters_done.is_set() and pending.empty()):
+        recorder.timed('list_threads', lambda: client.get('/api/conversations/threads?per-page=25'))
+        for _ in range(5):
+            try:
+                thread_id = pending.get(timeout=0.1)
+            except queue.Empty:
+                break
+            recorder.timed('admin_reply', lambda: client.post(f'/api/admin/send-message/{thread_id}',
+                                                               json={'text': 'We are looking into it.'}))
+            status = decisions[thread_id % 2]
+            recorder.timed('update_status', lambda: client.put(f'/api/conversations/threads/{thread_id}',
+                                                                json={'status': status.value}))
+
+
+def run(args):
+    with tempfile.TemporaryDirectory() as directory:
+        app = build_app(args.redis, Path(directory) / 'bench_flows.db', args.admins)
+        recorder = Recorder()
+        pending = queue.Queue()
+        requesters_done = threading.Event()
+
+        appeals = list(range(args.appeals))
+        requesters = [threading.Thread(target=requester_flow,
+                                       args=(app, recorder, appeals[i::args.requesters], pending))
+                      for i in range(args.requesters)]
+        admins = [threading.Thread(target=admin_flow, args=(app, recorder, i, pending, requesters_done))
+                  for i in range(args.admins)]
+
+        started = time.perf_counter()
+        for thread in requesters + admins:
+            thread.start()
+        for thread in requesters:
+            thread.join()
+        requesters_done.set()
+        for thread in admins:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+    results = {
+        'settings': {'requesters': args.requesters, 'admins': args.admins,
+                     'appeals': args.appeals, 'redis': args.redis},
+        'throughput': sum(map(len, recorder.latencies.values())) / elapsed,
+        'endpoints': {},
+    }
+    for name, latencies in sorted(recorder.latencies.items()):
+        results['endpoints'][name] = {
+            'requests': len(latencies),
+            'errors': recorder.errors[name],
+            'throughput': len(latencies) / elapsed,
+            **{f'p{p}': percentile(latencies, p) * 1000 for p in (50, 95, 99)},
+        }
+    return results
+
+
+def report(results):
+    print(f'{"endpoint":<15} {"requests":>8} {"errors":>6} {"req/s":>9} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8}')
+    for name, stats in results['endpoints'].items():
+        print(f'{name:<15} {stats["requests"]:>8} {stats["errors"]:>6} {stats["throughput"]:>9.1f}'
+              f' {stats["p50"]:>8.2f} {stats["p95"]:>8.2f} {stats["p99"]:>8.2f}')
+    print(f'total {results["throughput"]:.1f} requests/s')
+
+
+def compare(results, baseline, tolerance):
+    """Return the list of the regressions against the baseline. The medians
+    are compared; the tails depend too much on the thread scheduling."""
+    regressions = []
+    if results['settings'] != baseline['settings']:
+        print(f'Warning: the baseline was made with {baseline["settings"]}.')
+
+    if results['throughput'] < baseline['throughput'] * (1 - tolerance):
+        regressions.append(f'throughput {results["throughput"]:.1f} < {baseline["throughput"]:.1f} requests/s')
+
+    for name, stats in results['endpoints'].items():
+        if stats['errors']:
+            regressions.append(f'{name}: {stats["errors"]} errors')
+        if name not in baseline['endpoints']:
+            continue
+        baseline_p50 = baseline['endpoints'][name]['p50']
+        if stats['p50'] > baseline_p50 * (1 + tolerance) and stats['p50'] - baseline_p50 > MIN_REGRESSION_MS:
+            regressions.append(f'{name}: p50 {stats["p50"]:.2f} > {baseline_p50:.2f} ms')
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load test of the appeal and moderation flows.')
+    parser.add_argument('--requesters', type=int, default=8, help='concurrent requester threads')
+    parser.add_argument('--admins', type=int, default=2, help='concurrent admin threads')
+    parser.add_argument('--appeals', type=int, default=200, help='appeals to go through')
+    parser.add_argument('--redis', action='store_true', help='use the Redis of REDIS_URL instead of FakeRedis')
+    parser.add_argument('--save-baseline', action='store_true', help=f'store the results in {BASELINE_PATH}')
+    parser.add_argument('--tolerance', type=float, default=0.5, help='allowed regression, as a fraction')
+    args = parser.parse_args()
+
+    os.environ.setdefault('FLASK_SECRET_KEY', 'bench')
+    os.environ.setdefault('REDIS_URL', 'redis://localhost:6379/15')
+    results = run(args)
+    report(results)
+
+    if args.save_baseline:
+        BASELINE_PATH.parent.mkdir(exist_ok=True)
+        BASELINE_PATH.write_text(json.dumps(results, indent=4) + '\n')
+        print(f'Baseline saved to {BASELINE_PATH}')
+        sys.exit(0)
+
+    if not BASELINE_PATH.exists():
+        print('No baseline to compare with, run with --save-baseline first.')
+        sys.exit(0)
+
+    regressions = compare(results, json.loads(BASELINE_PATH.read_text()), args.tolerance)
+    for regression in regressions:
+        print(f'Regression: {regression}')
+    sys.exit(1 if regressions else 0)
@@ -0,0 +1,189 @@
+"""Microbenchmarks of the helpers on every request path, run against seeded
+SQLite databases (FakeRedis for Redis) of growing size. The sizes are the
+number of Threads; there is a Message per Thread and a Requester per four.
+
+The results are written as JSON, with the commit they were measured on, so
+that they can be compared across releases.
+
+Usage: python -m scripts.bench.micro [--sizes 10000 100000 1000000]
+                                     [--iterations 200] [--output bench_micro.json]
+"""
+import argparse
+from datetime import datetime, timedelta
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+SEED = 2545
+CHUNK_SIZE = 50000
+
+
+def seed(db, size):
+    """Insert `size` Threads, mostly closed, with their Messages and
+    Requesters, in large chunks without the ORM."""
+    from sqlalchemy import insert
+    from app.backend.conversations.models import Message, Thread
+    from app.backend.requesters.models import Requester
+
+    rng = random.Random(SEED)
+    now = datetime.now()
+    requesters = max(size // 4, 1)
+
+    for start in range(0, requesters, CHUNK_SIZE):
+        db.session.execute(insert(Requester), [
+            {'id': i + 1, 'username': f'Requester{i}', 'username_normalized': f'requester{i}',
+             'ip_hash': 'ip', 'fp_hash': 'fp', 'created_on': now}
+            for i in range(start, min(start + CHUNK_SIZE, requesters))
+        ])
+
+    for start in range(0, size, CHUNK_SIZE):
+        threads, messages = [], []
+        for i in range(start, min(start + CHUNK_SIZE, size)):
+            created_on = now - timedelta(minutes=rng.randrange(60 * 24 * 90))
+            # About one Thread in ten is still active
+            status = Thread.STATUSES.ACTIVE if rng.random() < 0.1 else rng.choice(
+                [Thread.STATUSES.APPROVED, Thread.STATUSES.DENIED, Thread.STATUSES.UNRESOLVED])
+            threads.append({'id': i + 1, 'key': f'SEED-{i}', 'status': status, 'created_on': created_on,
+                            'last_activity_on': created_on, 'requester_id': i % requesters + 1})
+            messages.append({'text': 'Please review my ban.', 'created_on': created_on,
+                             'thread_id': i + 1, 'requester_id': i % requesters + 1})
+        db.session.execute(insert(Thread), threads)
+        db.session.execute(insert(Message), messages)
+    db.session.commit()
+
+
+def measure(name, size, function, iterations, setup=None):
+    """Run `function` `iterations` times; `setup`, if given, is run before
+    every call, untimed, and its result is passed to the function."""
+    timings = []
+    for _ in range(iterations):
+        argument = setup() if setup else None
+        started = time.perf_counter()
+        function(argument) if setup else function()
+        timings.append(time.perf_counter() - started)
+
+    timings.sort()
+    result = {
+        'benchmark': name,
+        'rows': size,
+        'iterations': iterations,
+        'mean_us': statistics.fmean(timings) * 1e6,
+        'median_us': statistics.median(timings) * 1e6,
+        'min_us': timings[0] * 1e6,
+        'p95_us': timings[int(len(timings) * 0.95) - 1] * 1e6,
+    }
+    print(f'{name:<32} {size:>9} {result["median_us"]:>12.1f} us median {result["p95_us"]:>12.1f} us p95')
+    return result
+
+
+def run_size(size, iterations, directory):
+    from flask import session
+    from app import config
+    from app.app_factory import create_app, db
+    from app.backend.conversations.helpers import create_thread, generate_thread_key, update_thread_status
+    from app.backend.conversations.models import Thread
+    from app.backend.conversations.schemas import ThreadBasicSchema, ThreadDetailedSchema
+    from app.backend.requesters.models import Requester
+    from app.backend.utils.pagination import paginate, paginate_response
+    from app.backend.utils.serialization import dump_list_json
+
+    config.RATE_LIMIT_MAX_REQUESTS = 10 ** 9
+    app = create_app(overrides={'TESTING': True,
+                                'SQLALCHEMY_DATABASE_URI': f'sqlite:///{Path(directory) / f"micro_{size}.db"}'})
+    hooks = {function.__name__: function for function in app.before_request_funcs[None]}
+    results = []
+
+    with app.app_context():
+        db.create_all()
+        started = time.perf_counter()
+        seed(db, size)
+        print(f'Seeded {size} rows in {time.perf_counter() - started:.1f} s')
+
+        middle_page = {'page': size // 25 // 2, 'per-page': 25}
+        results.append(measure('paginate', size, lambda: paginate(
+            request_args=middle_page, sqlalchemy_query=Thread.query, pydantic_model=ThreadBasicSchema,
+            list_name='thread_list'), iterations))
+        results.append(measure('paginate_response', size, lambda: paginate_response(
+            request_args=middle_page, sqlalchemy_query=Thread.query, pydantic_model=ThreadBasicSchema,
+            list_name='thread_list'), iterations))
+        results.append(measure('paginate_response_cursor', size, lambda: paginate_response(
+            request_args={'after': '', 'limit': 25}, sqlalchemy_query=Thread.query,
+            pydantic_model=ThreadBasicSchema, list_name='thread_list'), iterations))
+
+        with app.test_request_context('/api/conversations/thread-statuses',
+                                      environ_base={'REMOTE_ADDR': '127.0.0.1'}):
+            results.append(measure('rate_limit', size, hooks['rate_limit'], iterations))
+
+        # The check is skipped in the tests
+        app.config['TESTING'] = False
+        with app.test_request_context('/api/conversations/threads/1', method='POST',
+                                      headers={'X-CSRF-Token': 'token'}):
+            session['csrf_token'] = 'token'
+            results.append(measure('csrf_protect', size, hooks['csrf_protect'], iterations))
+        app.config['TESTING'] = True
+
+        results.append(measure('generate_thread_key', size, generate_thread_key, iterations))
+
+        requester = db.session.get(Requester, 1)
+        results.append(measure('create_thread', size, lambda: create_thread(
+            requester=requester, first_message='Please review my ban.'), iterations))
+
+        active_threads = iter(Thread.active().limit(iterations).all())
+        results.append(measure('update_thread_status', size, lambda thread: update_thread_status(
+            thread=thread, new_status=Thread.STATUSES.DENIED, processed_by_system=True),
+            iterations, setup=lambda: next(active_threads)))
+
+        page = Thread.query.order_by(Thread.id).limit(25).all()
+        results.append(measure('schema_dump_basic_page', size, lambda: [
+            ThreadBasicSchema.model_validate(thread).model_dump() for thread in page], iterations))
+        results.append(measure('dump_list_json_page', size, lambda: dump_list_json(
+            pydantic_model=ThreadBasicSchema, rows=page, envelope={}, list_name='thread_list'), iterations))
+        detailed = Thread.query.options(*Thread.detailed_options()).filter_by(id=page[0].id).one()
+        results.append(measure('schema_dump_detailed', size, lambda: ThreadDetailedSchema.model_validate(
+            detailed).model_dump_json(), iterations))
+
+        db.session.remove()
+        db.engine.dispose()
+    return results
+
+
+def get_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Microbenchmarks of the request path helpers.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--output', default='bench_micro.json')
+    args = parser.parse_args()
+
+    os.environ.setdefault('FLASK_SECRET_KEY', 'bench')
+    os.environ.setdefault('REDIS_URL', 'redis://localhost:6379')
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for size in args.sizes:
+            results.extend(run_size(size, args.iterations, directory))
+
+    report = {
+        'commit': get_commit(),
+        'measured_on': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results,
+    }
+    Path(args.output).write_text(json.dumps(report, indent=4) + '\n')
+    print(f'Results written to {args.output}')
+    sys.exit(0)
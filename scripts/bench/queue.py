@@ -0,0 +1,141 @@
+"""Contention benchmark of the review queue: a growing number of concurrent
+moderators work through the same backlog of active threads, each taking a
+thread and deciding it, until the backlog is empty.
+
+With `claim`, the threads are taken with `POST /api/conversations/queue/next`.
+With `naive`, every moderator opens the oldest active thread, the way they
+pick it from the thread list today. The duplicates are the decisions which
+failed because another moderator had already decided, or was deciding, the
+same thread: the duplicated work.
+
+The database is SQLite (or `--database-uri`, e.g. a local Postgres, whose
+tables are dropped) and Redis is FakeRedis.
+
+Usage: python -m scripts.bench.queue [--threads 400] [--moderators 1 4 16] [--database-uri URI]
+"""
+import argparse
+from datetime import datetime, timedelta
+import os
+import statistics
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+ADMIN_PASSWORD = 'bench-password'
+
+
+def build_app(database_uri, moderators):
+    from app import config
+    from app.app_factory import create_app, db
+    from app.backend.admin.helpers import generate_password_hash
+    from app.backend.admin.models import AdminUser
+
+    config.RATE_LIMIT_ENABLED = False
+    # All the moderators log in from the same address
+    config.ADMIN_LOGIN_MAX_ATTEMPTS = 1000
+    # The failed compare-and-set claims would be logged as N+1 queries
+    config.QUERY_PROFILER_N_PLUS_ONE_THRESHOLD = 0
+    app = create_app(overrides={'TESTING': True, 'SQLALCHEMY_DATABASE_URI': database_uri})
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        password_hash = generate_password_hash(ADMIN_PASSWORD)
+        for i in range(moderators):
+            db.session.add(AdminUser(username=f'BenchAdmin{i}', password=password_hash,
+                                     email=f'bench{i}@email.com'))
+        db.session.commit()
+    return app
+
+
+def seed(app, threads):
+    from sqlalchemy import delete, insert
+    from app.app_factory import db
+    from app.backend.conversations.models import Thread
+    from app.backend.requesters.models import Requester
+
+    now = datetime.now()
+    with app.app_context():
+        db.session.execute(delete(Thread))
+        db.session.execute(delete(Requester))
+        db.session.execute(insert(Requester), [
+            {'id': i + 1, 'username': f'Requester{i}', 'username_normalized': f'requester{i}',
+             'ip_hash': 'ip', 'fp_hash': 'fp', 'created_on': now} for i in range(threads)])
+        db.session.execute(insert(Thread), [
+            {'id': i + 1, 'key': f'QUEUE-{i}', 'created_on': now - timedelta(minutes=threads - i),
+             'last_activity_on': now - timedelta(minutes=threads - i), 'requester_id': i + 1}
+            for i in range(threads)])
+        db.session.commit()
+
+
+def moderate(app, number, mode, stats, lock):
+    from app.app_factory import db
+    from app.backend.conversations.models import Thread
+
+    client = app.test_client()
+    response = client.post('/api/admin/login', json={'username': f'BenchAdmin{number}', 'password': ADMIN_PASSWORD})
+    assert response.status_code == 200, response.get_data(as_text=True)
+
+    while True:
+        started = time.perf_counter()
+        if mode == 'claim':
+            response = client.post('/api/conversations/queue/next')
+            thread_id = response.get_json()['id'] if response.status_code == 200 else None
+        else:
+            with app.app_context():
+                thread = Thread.active().order_by(Thread.last_activity_on, Thread.id).first()
+                thread_id = thread.id if thread else None
+        taken = time.perf_counter()
+        if thread_id is None:
+            break
+
+        response = client.put(f'/api/conversations/threads/{thread_id}',
+                              json={'status': Thread.STATUSES.DENIED.value})
+        with lock:
+            stats['take'].append(taken - started)
+            if response.status_code == 200:
+                stats['decided'] += 1
+            elif response.status_code in (404, 409):
+                stats['duplicates'] += 1
+            else:
+                stats['errors'] += 1
+
+
+def run(app, mode, moderators, threads):
+    seed(app, threads)
+    stats = {'take': [], 'decided': 0, 'duplicates': 0, 'errors': 0}
+    lock = threading.Lock()
+    workers = [threading.Thread(target=moderate, args=(app, i, mode, stats, lock)) for i in range(moderators)]
+
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+
+    take = sorted(stats['take'])
+    p95 = take[max(int(len(take) * 0.95) - 1, 0)]
+    print(f'{mode:<6} {moderators:>10} {stats["decided"] / elapsed:>11.1f} {statistics.median(take) * 1000:>9.2f}'
+          f' {p95 * 1000:>9.2f} {stats["duplicates"]:>10} {stats["errors"]:>6}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Contention benchmark of the review queue.')
+    parser.add_argument('--threads', type=int, default=400, help='active threads in the backlog')
+    parser.add_argument('--moderators', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--database-uri')
+    args = parser.parse_args()
+
+    os.environ.setdefault('FLASK_SECRET_KEY', 'bench')
+    os.environ.setdefault('REDIS_URL', 'redis://localhost:6379')
+
+    with tempfile.TemporaryDirectory() as directory:
+        database_uri = args.database_uri or f'sqlite:///{Path(directory) / "bench_queue.db"}'
+        app = build_app(database_uri, max(args.moderators))
+        print(f'{args.threads} threads, {database_uri}')
+        print(f'{"mode":<6} {"moderators":>10} {"decisions/s":>11} {"take p50":>9} {"take p95":>9}'
+              f' {"duplicates":>10} {"errors":>6}')
+        for mode in ('naive', 'claim'):
+            for moderators in args.moderators:
+                run(app, mode, moderators, args.threads)
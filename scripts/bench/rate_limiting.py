@@ -0,0 +1,62 @@
+"""Compare the round trips and the time per request of the old fixed window
+rate limiter (INCR + EXPIRE) and the sliding window one. FakeRedis runs
+in-process, so the timings don't include the network latency that each
+round trip costs against a real Redis.
+
+Usage: python -m scripts.bench.rate_limiting [requests] [ips]
+"""
+import sys
+import time
+from fakeredis import FakeRedis
+from fakeredis._connection import FakeConnection
+from app.backend.utils.rate_limiting import hit_sliding_windows
+
+MAX_REQUESTS = 100
+COOLDOWN = 900
+
+round_trips = 0
+_send_packed_command = FakeConnection.send_packed_command
+
+
+def counting_send_packed_command(self, *args, **kwargs):
+    global round_trips
+    round_trips += 1
+    return _send_packed_command(self, *args, **kwargs)
+
+
+FakeConnection.send_packed_command = counting_send_packed_command
+
+
+def fixed_window(redis_client, ip):
+    # The limiter used before the sliding window one
+    key = f'request_count:{ip}'
+    request_count = redis_client.incr(key)
+    if request_count == 1:
+        redis_client.expire(key, COOLDOWN)
+    return request_count > MAX_REQUESTS
+
+
+def sliding_window(redis_client, ip):
+    return hit_sliding_windows(redis_client, [(f'rate_limit:{ip}', MAX_REQUESTS, COOLDOWN, 1)])
+
+
+def run(name, limiter, requests, ips):
+    global round_trips
+    redis_client = FakeRedis()
+    round_trips = 0
+
+    started = time.perf_counter()
+    for i in range(requests):
+        limiter(redis_client, f'10.0.{i % ips // 256}.{i % ips % 256}')
+    elapsed = time.perf_counter() - started
+
+    print(f'{name:<15} {round_trips / requests:>8.3f} round trips/request'
+          f' {elapsed / requests * 1e6:>10.1f} us/request')
+
+
+if __name__ == '__main__':
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    ips = int(sys.argv[2]) if len(sys.argv) > 2 else requests
+    print(f'{requests} requests from {ips} IPs')
+    run('fixed window', fixed_window, requests, ips)
+    run('sliding window', sliding_window, requests, ips)
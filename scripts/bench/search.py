@@ -0,0 +1,117 @@
+"""Latency of the full-text search endpoint over a seeded SQLite database of
+a million messages (by default), indexed by the triggers as they are
+inserted. The words of the messages follow a Zipf distribution, so that
+there are very common words, matching a large part of the messages, as
+well as rare ones.
+
+Usage: python -m scripts.bench.search [--messages 1000000] [--iterations 50]
+"""
+import argparse
+from datetime import datetime
+from itertools import accumulate
+import os
+import random
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+SEED = 2545
+CHUNK_SIZE = 50000
+VOCABULARY_SIZE = 20000
+MESSAGES_PER_THREAD = 10
+ADMIN_PASSWORD = 'bench-password'
+
+QUERIES = {
+    'common word': {'q': 'w1'},
+    'common words': {'q': 'w1 w2'},
+    'uncommon word': {'q': 'w500'},
+    'rare word': {'q': 'w15000'},
+    'phrase': {'q': '"review my ban"'},
+    'username': {'q': 'requester4242', 'type': 'requester'},
+    'no match': {'q': 'nonexistent'},
+    'common word, page 20': {'q': 'w1', 'page': 20},
+}
+
+
+def seed(db, messages):
+    from sqlalchemy import insert
+    from app.backend.conversations.models import Message, Thread
+    from app.backend.requesters.models import Requester
+
+    rng = random.Random(SEED)
+    words = [f'w{i}' for i in range(VOCABULARY_SIZE)]
+    cum_weights = list(accumulate(1 / (i + 1) for i in range(VOCABULARY_SIZE)))
+    threads = max(messages // MESSAGES_PER_THREAD, 1)
+    now = datetime.now()
+
+    for start in range(0, threads, CHUNK_SIZE):
+        ids = range(start, min(start + CHUNK_SIZE, threads))
+        db.session.execute(insert(Requester), [
+            {'id': i + 1, 'username': f'Requester{i}', 'username_normalized': f'requester{i}',
+             'ip_hash': 'ip', 'fp_hash': 'fp', 'created_on': now} for i in ids])
+        db.session.execute(insert(Thread), [
+            {'id': i + 1, 'key': f'SEED-{i}', 'created_on': now, 'last_activity_on': now,
+             'requester_id': i + 1} for i in ids])
+
+    for start in range(0, messages, CHUNK_SIZE):
+        rows = []
+        for i in range(start, min(start + CHUNK_SIZE, messages)):
+            text = ' '.join(rng.choices(words, cum_weights=cum_weights, k=rng.randint(5, 30)))
+            if i % 100 == 0:
+                text = f'Please review my ban. {text}'
+            rows.append({'text': text, 'created_on': now, 'thread_id': i % threads + 1,
+                         'requester_id': i % threads + 1})
+        db.session.execute(insert(Message), rows)
+    db.session.commit()
+
+
+def run(messages, iterations, directory):
+    from app import config
+    from app.app_factory import create_app, db
+    from app.backend.admin.helpers import generate_password_hash
+    from app.backend.admin.models import AdminUser
+
+    config.RATE_LIMIT_ENABLED = False
+    app = create_app(overrides={'TESTING': True,
+                                'SQLALCHEMY_DATABASE_URI': f'sqlite:///{Path(directory) / "bench_search.db"}'})
+
+    with app.app_context():
+        db.create_all()
+        started = time.perf_counter()
+        seed(db, messages)
+        print(f'Seeded and indexed {messages} messages in {time.perf_counter() - started:.1f} s')
+
+        db.session.add(AdminUser(username='BenchAdmin', password=generate_password_hash(ADMIN_PASSWORD),
+                                 email='bench@email.com'))
+        db.session.commit()
+
+        client = app.test_client()
+        client.post('/api/admin/login', json={'username': 'BenchAdmin', 'password': ADMIN_PASSWORD})
+
+        print(f'{"query":<22} {"total":>8} {"p50 ms":>8} {"p95 ms":>8}')
+        for name, params in QUERIES.items():
+            timings = []
+            for _ in range(iterations):
+                started = time.perf_counter()
+                response = client.get('/api/admin/search', query_string=params)
+                timings.append(time.perf_counter() - started)
+                assert response.status_code == 200, response.get_data(as_text=True)
+
+            timings.sort()
+            p95 = timings[max(int(len(timings) * 0.95) - 1, 0)]
+            print(f'{name:<22} {response.get_json()["total"]:>8}'
+                  f' {statistics.median(timings) * 1000:>8.2f} {p95 * 1000:>8.2f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Latency of the full-text search.')
+    parser.add_argument('--messages', type=int, default=1000000)
+    parser.add_argument('--iterations', type=int, default=50)
+    args = parser.parse_args()
+
+    os.environ.setdefault('FLASK_SECRET_KEY', 'bench')
+    os.environ.setdefault('REDIS_URL', 'redis://localhost:6379')
+
+    with tempfile.TemporaryDirectory() as directory:
+        run(args.messages, args.iterations, directory)
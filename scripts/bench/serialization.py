@@ -0,0 +1,65 @@
+"""Compare the per-object serialization of a list page (`paginate` +
+`jsonify`) with the fast path (`paginate_response`) at several page sizes,
+on an in-memory SQLite database.
+
+Usage: python -m scripts.bench.serialization [repeats]
+"""
+import sys
+import timeit
+from flask import jsonify
+from app import config
+from app.app_factory import create_app, db
+from app.backend.conversations.models import Message, Thread
+from app.backend.conversations.schemas import MessageSchema
+from app.backend.requesters.models import Requester
+from app.backend.utils.pagination import paginate, paginate_response
+
+PAGE_SIZES = [25, 1000]
+
+
+def seed(count: int):
+    requester = Requester(username='Requester', ip_hash='ip', fp_hash='fp')
+    db.session.add(requester)
+    db.session.flush()
+    thread = Thread(key='PINBAN-AAA-0000', requester_id=requester.id)
+    db.session.add(thread)
+    db.session.flush()
+    db.session.add_all([Message(text=f'Message number {i}', requester_id=requester.id,
+                                thread_id=thread.id) for i in range(count)])
+    db.session.commit()
+
+
+def old_path(size: int):
+    pagination = paginate(request_args={'per-page': size},
+                          sqlalchemy_query=Message.query,
+                          pydantic_model=MessageSchema,
+                          list_name='message_list',
+                          max_per_page=size)
+    return jsonify(pagination).data
+
+
+def new_path(size: int):
+    return paginate_response(request_args={'per-page': size},
+                             sqlalchemy_query=Message.query,
+                             pydantic_model=MessageSchema,
+                             list_name='message_list',
+                             max_per_page=size).data
+
+
+if __name__ == '__main__':
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    app = create_app(config_object=config, overrides={
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite://',
+    })
+    app.debug = False  # no pretty-printing in `jsonify`
+
+    with app.app_context():
+        db.create_all()
+        seed(max(PAGE_SIZES))
+
+        for size in PAGE_SIZES:
+            old = min(timeit.repeat(lambda: old_path(size), number=1, repeat=repeats))
+            new = min(timeit.repeat(lambda: new_path(size), number=1, repeat=repeats))
+            print(f'{size:>5} items: old {old * 1000:8.2f} ms, new {new * 1000:8.2f} ms,'
+                  f' {old / new:.1f}x faster')
@@ -0,0 +1,25 @@
+"""Allocate Thread keys for a range of sequence numbers, check that none of
+them collide and report the time per key. No DB or Redis is needed, since
+the allocation itself never looks up the existing keys.
+
+Usage: python -m scripts.bench.thread_keys [count]
+"""
+import sys
+import time
+from app.backend.conversations.helpers import thread_key_from_number
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+
+    keys = set()
+    started = time.perf_counter()
+    for number in range(1, count + 1):
+        keys.add(thread_key_from_number(number))
+    elapsed = time.perf_counter() - started
+
+    collisions = count - len(keys)
+    print(f'{count} keys allocated in {elapsed:.2f}s'
+          f' ({elapsed / count * 1e6:.2f} us/key), {collisions} collisions')
+    print('Sample:', ', '.join(thread_key_from_number(number) for number in range(1, 6)))
+    sys.exit(1 if collisions else 0)
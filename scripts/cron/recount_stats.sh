@@ -0,0 +1,10 @@
+#!/bin/bash
+LOG_FILE="/var/log/pinban/stats_recount.log"
+
+cd /app
+
+# Catch the output
+OUTPUT=$(/usr/local/bin/python -m flask --app app/run conversations recountstats 2>&1)
+
+# Log the data
+echo "$(date '+%Y-%m-%d %H:%M:%S') - $OUTPUT" >> "$LOG_FILE"